@@ -5,9 +5,13 @@ simulating the Nusuk card management system for Hajj 2025.
 """
 
 import streamlit as st
-import pandas as pd
-import os
 from datetime import datetime
+from utils.data import read_dataset, data_version
+from utils.sqlstore import use_sql, read_sql_dataset
+from utils.core import use_core, read_core_dataset
+from utils.family import get_family_graph
+from utils.ingest import live_enabled, get_live_dataset, render_live_status
+from utils.profiling import start_profile, finish_profile, span, render_profile_panel
 
 # ── Page Config (must be first Streamlit call) ─────────────────────────────
 st.set_page_config(
@@ -25,6 +29,9 @@ if "playing" not in st.session_state:
 
 lang = st.session_state["lang"]
 
+# Profile this run (only with ?debug=1 or NUSUK_PROFILE=1)
+profile = start_profile("app")
+
 # ── CSS Injection ──────────────────────────────────────────────────────────
 SHARED_CSS = """
 <style>
@@ -145,57 +152,40 @@ LTR_EXTRA = """
 </style>
 """
 
-st.markdown(SHARED_CSS, unsafe_allow_html=True)
-st.markdown(RTL_EXTRA if lang == "ar" else LTR_EXTRA, unsafe_allow_html=True)
+with span("css"):
+    st.markdown(SHARED_CSS, unsafe_allow_html=True)
+    st.markdown(RTL_EXTRA if lang == "ar" else LTR_EXTRA, unsafe_allow_html=True)
 
 # ── Data Loading ───────────────────────────────────────────────────────────
 @st.cache_resource
 def load_data():
-    data_dir = os.path.join(os.path.dirname(__file__), "data")
-    gz_path = os.path.join(data_dir, "hajj_data.csv.gz")
-    csv_path = os.path.join(data_dir, "hajj_data.csv")
-
-    if os.path.exists(gz_path):
-        df = pd.read_csv(gz_path, compression="gzip", low_memory=False)
-    elif os.path.exists(csv_path):
-        df = pd.read_csv(csv_path, low_memory=False)
-    else:
-        # Auto-generate if neither file exists
-        import subprocess, sys
-        gen_script = os.path.join(data_dir, "generate_data.py")
-        subprocess.run([sys.executable, gen_script], check=True)
-        df = pd.read_csv(csv_path, low_memory=False)
-    date_cols = [
-        "visa_issue_date", "group_formation_date", "travel_date", "arrival_date",
-        "card_printed_date", "card_at_center_date", "card_at_provider_date",
-        "card_received_date", "card_activation_date", "proof_picture_date",
-        "health_date", "death_date",
-    ]
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-    bool_cols = [
-        "arrival_status", "card_printed", "card_at_center", "card_at_provider",
-        "card_received", "card_activated", "proof_picture_received", "death_status",
-    ]
-    for col in bool_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna(False).astype(bool)
-    # Ensure string columns for search
-    for col in ["id_number", "passport_number", "nusuk_number", "first_name", "last_name"]:
-        if col in df.columns:
-            df[col] = df[col].astype(str).replace("nan", "")
+    if use_sql():
+        # Only the header: pages read rows and aggregates from the SQLite store
+        return read_sql_dataset()
+    # Memory mode: dates and status flags only in the packed day matrix
+    df = read_core_dataset() if use_core() else read_dataset()
+    # Household index now, rather than on the first Demographics render
+    get_family_graph(df)
     return df
 
 
-df = load_data()
+with span("load_data"):
+    df = load_data()
+    if live_enabled():
+        df = get_live_dataset().refresh(df)
 st.session_state["df"] = df
 
 # ── Sidebar ────────────────────────────────────────────────────────────────
-from utils.filters import render_sidebar, animate_slider
+from utils.filters import render_sidebar, session_key
 from utils.i18n import t
-
-filters = render_sidebar(df)
+from utils.memory import record_session_memory, render_memory_panel
+from utils.debug import debug_enabled
+
+with span("sidebar"):
+    filters = render_sidebar(df)
+    if live_enabled():
+        with st.sidebar:
+            render_live_status(load_data(), data_version(df))
 st.session_state["filters"] = filters
 
 # ── Navigation (bilingual page labels) ─────────────────────────────────────
@@ -220,7 +210,22 @@ nav = st.navigation([
     home_page, exec_page, pipeline_page, tracking_page,
     providers_page, health_page, demo_page, reports_page,
 ])
-nav.run()
 
-# Animation: sleep-based rerun loop (1s interval for Cloud reliability)
-animate_slider()
+# ── Page ───────────────────────────────────────────────────────────────────
+st.session_state["page_title"] = nav.title
+if profile is not None:
+    profile.page = nav.title
+try:
+    with span("page"):
+        nav.run()
+finally:
+    finish_profile()
+if profile is not None:
+    with st.sidebar:
+        render_profile_panel(profile)
+
+# Session state size for the memory report (the shared frame is not counted)
+record_session_memory(session_key(), shared=[df])
+if debug_enabled():
+    with st.sidebar:
+        render_memory_panel(df)
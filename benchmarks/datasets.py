@@ -0,0 +1,66 @@
+"""
+Benchmark datasets at several scales.
+The mock data generator builds records one by one (and pairs families with a
+full scan per couple), so it is only practical at its native 200K rows.
+Larger scales replicate the generated dataset with fresh person, group and
+identifier values, keeping its distributions and date patterns.
+"""
+
+import math
+import os
+import tempfile
+import pandas as pd
+from utils.data import dataset_path
+
+
+# Every scale has a stored baseline; a 20M-row frame (about 8 GB) does not fit the
+# benchmark machine, so larger scales are left out until one can be recorded
+SCALES = {"200k": 200_000, "2m": 2_000_000}
+BENCH_DATA_DIR = os.environ.get("NUSUK_BENCH_DATA", os.path.join(tempfile.gettempdir(), "nusuk_bench"))
+
+# Columns that must stay unique (or consistent) across copies
+ID_COLS = ["person_id"]
+LINK_COLS = ["spouse_id", "father_id"]
+IDENTIFIER_COLS = ["id_number", "passport_number", "visa_number", "nusuk_number"]
+
+
+def dataset_dir(scale):
+    """Directory holding the dataset for `scale` (a SCALES key), building it on first use."""
+    rows = SCALES[scale]
+    path = os.path.join(BENCH_DATA_DIR, scale)
+    csv_path = os.path.join(path, "hajj_data.csv")
+    if not os.path.exists(csv_path):
+        os.makedirs(path, exist_ok=True)
+        build_dataset(rows, csv_path)
+    return path
+
+
+def build_dataset(rows, csv_path):
+    """Write `rows` records to csv_path by replicating the generated dataset."""
+    # Untyped read: values are written back exactly as the generator wrote them
+    base = pd.read_csv(dataset_path(), dtype=str, keep_default_na=False)
+    copies = math.ceil(rows / len(base))
+    max_id = int(pd.to_numeric(base["person_id"]).max())
+    groups = pd.to_numeric(base["group_id"], errors="coerce")
+    max_group = int(groups.max())
+    width = len(str(copies - 1))
+
+    part = f"{csv_path}.part"
+    written = 0
+    for i in range(copies):
+        chunk = base.iloc[:min(len(base), rows - written)].copy()
+        if i > 0:
+            for col in ID_COLS + LINK_COLS:
+                ids = pd.to_numeric(chunk[col], errors="coerce") + i * max_id
+                chunk[col] = ids.astype("Int64").astype(str).replace("<NA>", "")
+            grouped = groups.iloc[:len(chunk)] > 0
+            chunk.loc[grouped, "group_id"] = (groups.iloc[:len(chunk)][grouped] + i * max_group).astype(int).astype(str)
+        if copies > 1:
+            suffix = f"{i:0{width}d}"
+            for col in IDENTIFIER_COLS:
+                present = chunk[col] != ""
+                chunk.loc[present, col] = chunk.loc[present, col] + suffix
+        chunk.to_csv(part, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        written += len(chunk)
+    os.replace(part, csv_path)
+    return written
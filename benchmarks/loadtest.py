@@ -0,0 +1,600 @@
+"""
+Hajj Nusuk Dashboard - Load Test
+Starts app.py with `streamlit run` and drives simulated operator sessions
+against it over the websocket protocol browsers use, one connection per
+session. The sessions share the server process, its loaded data and every
+cache the way the sessions of one server replica do. Each session plays a
+scripted scenario (browsing, animation playback, slider scrubbing, searches,
+exports); every script run is timed from the request to its last message.
+Fragment timers (animation frames, export progress, live status) fire on
+the client side the way the browser fires them.
+
+Run: python -m benchmarks.loadtest --sessions 8
+     python -m benchmarks.loadtest --sessions 1,5,10,20 --scenarios animation,search
+Reports latency percentiles per step and per session, and the server's CPU
+use and RSS (its worker processes included; RSS growth per session is an
+average: the sessions share one process). A list of session counts runs one
+load after the other against the same server and ends with a capacity table.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+from utils.i18n import t
+from utils.data import dataset_path
+from utils.filters import SEASON_START, SEASON_END
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+# In the order app.py passes them to st.navigation
+PAGES = [
+    "pages/0_Home.py", "pages/1_Executive_Summary.py", "pages/2_Card_Pipeline.py",
+    "pages/3_Card_Tracking.py", "pages/4_Service_Providers.py", "pages/5_Health_Safety.py",
+    "pages/6_Demographics.py", "pages/7_Reports.py",
+]
+# Pages with the date-driven charts the animation and slider redraw
+DATE_PAGES = [
+    "pages/1_Executive_Summary.py", "pages/2_Card_Pipeline.py", "pages/4_Service_Providers.py",
+    "pages/5_Health_Safety.py", "pages/6_Demographics.py",
+]
+TRACKING_PAGE = "pages/3_Card_Tracking.py"
+REPORTS_PAGE = "pages/7_Reports.py"
+# Sessions use the default language, like a fresh browser tab
+LANG = "ar"
+
+SERVER_START_TIMEOUT = 120
+RUN_TIMEOUT = 300
+# Seconds an operator waits between two interactions
+THINK_TIME = 1.0
+ANIMATION_FRAMES = 20
+SCRUB_STEPS = 8
+SEARCH_QUERIES = ["moradi", "mohammed", "ahmad"]
+# Seconds an export job may take before it counts as failed (the Reports
+# workbook holds every record up to the date: minutes at 200K rows)
+EXPORT_TIMEOUT = 300
+PROC_SAMPLE_S = 0.2
+PERCENTILES = [50, 90, 95, 99]
+
+# The harness speaks Streamlit's websocket protocol (protobuf messages,
+# widget ids ending in the widget key). It was written against this release;
+# others are run with a warning, as the protocol may have changed.
+TESTED_STREAMLIT = "1.66"
+
+_DONE = {
+    ForwardMsg.ScriptFinishedStatus.FINISHED_SUCCESSFULLY,
+    ForwardMsg.ScriptFinishedStatus.FINISHED_WITH_COMPILE_ERROR,
+    ForwardMsg.ScriptFinishedStatus.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# ── Server ─────────────────────────────────────────────────────────────────
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """`streamlit run app.py` on a free local port (NUSUK_* settings come from the environment)."""
+
+    def __init__(self, port=None):
+        self.port = port or _free_port()
+        self.log = tempfile.NamedTemporaryFile(prefix="nusuk_loadtest_", suffix=".log", delete=False)
+        self.process = None
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", APP_PATH,
+             "--server.headless", "true", "--server.address", "127.0.0.1",
+             "--server.port", str(self.port), "--server.fileWatcherType", "none",
+             "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+            cwd=APP_DIR, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=2) as r:
+                    if r.read() == b"ok":
+                        return self
+            except OSError:
+                time.sleep(0.5)
+        self.__exit__()
+        raise SystemExit(f"streamlit did not start; see {self.log.name}")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+
+def _process_tree(pid):
+    """pid and the pids of all its descendants (sharded metric workers, export processes)."""
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    todo.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def proc_usage(pid):
+    """CPU seconds and RSS (MB) of a process tree, from /proc."""
+    ticks, pages = 0, 0
+    for current in _process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                # Fields after the command name, which may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{current}/statm") as f:
+                pages += int(f.read().split()[1])
+        except OSError:  # exited in between
+            continue
+        ticks += int(fields[11]) + int(fields[12])  # utime, stime
+    return ticks / os.sysconf("SC_CLK_TCK"), pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class ProcMonitor:
+    """Samples the server's RSS on a background thread; keeps the peak."""
+
+    def __init__(self, pid, interval=PROC_SAMPLE_S):
+        self.pid = pid
+        self.interval = interval
+        self.peak = proc_usage(pid)[1]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, proc_usage(self.pid)[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, proc_usage(self.pid)[1])
+
+
+# ── Sessions ───────────────────────────────────────────────────────────────
+def _widget_key(widget_id):
+    """The user key at the end of a widget id ("None" for widgets without one)."""
+    return widget_id.rsplit("-", 1)[-1]
+
+
+def _date_micros(day):
+    """A date slider value as the frontend sends it: microseconds since the epoch, at UTC midnight."""
+    return (datetime(day.year, day.month, day.day, tzinfo=timezone.utc) - _EPOCH) // timedelta(microseconds=1)
+
+
+class Session:
+    """One simulated operator: a websocket connection driven through a scenario."""
+
+    def __init__(self, index, scenario, url, think_time=THINK_TIME):
+        self.index = index
+        self.scenario = scenario
+        self.url = url
+        self.think_time = think_time
+        self._connection = None
+        self.ws = None
+        self.page = ""  # page_script_hash; empty opens the default page
+        self.pages = []  # page_script_hash of every page, in navigation order
+        self.widgets = {}  # widget id -> (element type, element) of the last run
+        self.states = {}  # widget id -> WidgetState this session set
+        self.timers = {}  # fragment id -> [interval, next due time]
+        self.timings = []  # (step, seconds) per script run
+        self.errors = []
+
+    def __enter__(self):
+        self._connection = connect(self.url, subprotocols=["streamlit"], max_size=None,
+                                   open_timeout=RUN_TIMEOUT)
+        self.ws = self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._connection.__exit__(*exc)
+
+    def _request(self, fragment_id=""):
+        msg = BackMsg()
+        client = msg.rerun_script
+        client.page_script_hash = self.page
+        client.widget_states.widgets.extend(self.states.values())
+        if fragment_id:
+            client.fragment_id = fragment_id
+            client.is_auto_rerun = True
+        self.ws.send(msg.SerializeToString())
+        # Button clicks count once
+        self.states = {i: s for i, s in self.states.items() if s.WhichOneof("value") != "trigger_value"}
+
+    def _receive(self, step):
+        """Read messages until the requested run (and any rerun it asked for) finished."""
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(self.ws.recv(timeout=RUN_TIMEOUT))
+            kind = msg.WhichOneof("type")
+            if kind == "new_session" and not msg.new_session.fragment_ids_this_run:
+                # A full run: the browser drops the page's widgets and fragment timers
+                self.widgets, self.timers = {}, {}
+            elif kind == "navigation":
+                self.pages = [page.page_script_hash for page in msg.navigation.app_pages]
+                self.page = msg.navigation.page_script_hash
+            elif kind == "auto_rerun":
+                interval = msg.auto_rerun.interval
+                self.timers[msg.auto_rerun.fragment_id] = [interval, time.monotonic() + interval]
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._element(step, msg.delta.new_element)
+            elif kind == "script_finished" and msg.script_finished in _DONE:
+                return
+
+    def _element(self, step, element):
+        element_type = element.WhichOneof("type")
+        value = getattr(element, element_type)
+        if element_type == "exception":
+            if not value.is_warning:
+                self.errors.append(f"{step}: {value.type}: {value.message[:200]}")
+            return
+        widget_id = getattr(value, "id", "")
+        if widget_id.startswith("$$ID-"):
+            self.widgets[widget_id] = (element_type, value)
+            # The script set the widget's value: the browser shows (and sends) the new one
+            if getattr(value, "set_value", False):
+                self.states.pop(widget_id, None)
+
+    def run(self, step, fragment_id="", pause=None):
+        """Rerun the app (with the widget values set since) and time it as `step`."""
+        started = time.perf_counter()
+        try:
+            self._request(fragment_id)
+            self._receive(step)
+        except Exception as exc:  # timeouts, closed connections
+            self.errors.append(f"{step}: {exc!r}")
+        self.timings.append((step, time.perf_counter() - started))
+        if pause is None:
+            self.idle(self.think_time)
+
+    def idle(self, seconds=None, runs=None, step="fragment", until=None):
+        """
+        Wait like an idle browser tab: fire the fragment timers as they come
+        due, each a run timed as `step`. Ends after `seconds`, after `runs`
+        timer runs, once `until()` is true, or when no timer is left.
+        """
+        deadline = None if seconds is None else time.monotonic() + seconds
+        fired = 0
+        while runs is None or fired < runs:
+            if until is not None and until():
+                return True
+            now = time.monotonic()
+            if not self.timers:
+                if deadline is None:
+                    return False
+                time.sleep(max(0.0, deadline - now))
+                return False
+            fragment_id, (interval, due) = min(self.timers.items(), key=lambda item: item[1][1])
+            if deadline is not None and due > deadline:
+                time.sleep(max(0.0, deadline - now))
+                return False
+            time.sleep(max(0.0, due - now))
+            # Like setInterval: the next tick is due one interval after this one was
+            self.timers[fragment_id][1] = max(due + interval, time.monotonic())
+            self.run(step, fragment_id=fragment_id, pause=0)
+            fired += 1
+        return False
+
+    def widget(self, key, element_type=None):
+        """The widget with this key (or, for widgets without one, this label) in the last run."""
+        for widget_id, (kind, value) in self.widgets.items():
+            if element_type is not None and kind != element_type:
+                continue
+            if _widget_key(widget_id) == key or (_widget_key(widget_id) == "None" and value.label == key):
+                return widget_id, value
+        raise LookupError(f"no widget {key!r} on the page")
+
+    def has_widget(self, key):
+        return any(_widget_key(widget_id) == key for widget_id in self.widgets)
+
+    def set(self, key, element_type=None, **value):
+        """Set a widget's value for the next run, e.g. set("search_input", string_value="x")."""
+        widget_id, _ = self.widget(key, element_type)
+        state = WidgetState(id=widget_id, **value)
+        self.states[widget_id] = state
+
+    def click(self, key):
+        self.set(key, "button", trigger_value=True)
+
+    def open(self, page=None):
+        self.run("open")
+        if page is not None:
+            self.switch(page)
+
+    def switch(self, page):
+        self.page = self.pages[PAGES.index(page)]
+        self.run(f"page.{page.split('_', 1)[1][:-3].lower()}")
+
+    def pick(self, items):
+        """The session's item of a list, so concurrent sessions spread over them."""
+        return items[self.index % len(items)]
+
+    def play(self):
+        SCENARIOS[self.scenario](self)
+
+
+def browse(s):
+    """Open the app and visit every page."""
+    s.open()
+    for page in PAGES[1:]:
+        s.switch(page)
+
+
+def animation(s):
+    """Play the season animation on a date page: the frames are the fragment's own timer reruns."""
+    s.open(s.pick(DATE_PAGES))
+    s.set("date_slider", double_array_value={"data": [_date_micros(SEASON_START + timedelta(days=10 * s.index % 30))]})
+    s.run("scrub")
+    s.click(t("play_animation", LANG))
+    s.run("animation.play", pause=0)
+    s.idle(runs=ANIMATION_FRAMES, step="animation.frame")
+    s.click(t("stop_animation", LANG))
+    s.run("animation.stop")
+
+
+def scrub(s):
+    """Drag the date slider across the season on a date page."""
+    s.open(s.pick(DATE_PAGES))
+    season_days = (SEASON_END - SEASON_START).days
+    for i in range(SCRUB_STEPS):
+        day = (s.index * 7 + i * season_days // SCRUB_STEPS) % (season_days + 1)
+        s.set("date_slider", double_array_value={"data": [_date_micros(SEASON_START + timedelta(days=day))]})
+        s.run("scrub")
+
+
+def search(s):
+    """Name, Nusuk number and filter searches on Card Tracking."""
+    s.open(TRACKING_PAGE)
+    numbers = nusuk_numbers()
+    queries = SEARCH_QUERIES + [numbers[(s.index * 7919) % len(numbers)]]
+    for query in queries:
+        s.set("search_input", string_value=query)
+        s.run("search.query")
+    s.set("search_input", string_value="")
+    s.run("search.query")
+    for key in ("track_nationality", "track_card_status"):
+        _, selectbox = s.widget(key)
+        s.set(key, string_value=s.pick(selectbox.options[1:]))
+        s.run("search.filter")
+
+
+def export(s):
+    """Card Tracking CSV/Excel exports of a search, then the Reports Excel job."""
+    s.open(TRACKING_PAGE)
+    s.set("search_input", string_value=s.pick(SEARCH_QUERIES))
+    s.run("search.query")
+    for key in ("tracking_csv", "tracking_excel"):
+        s.click(f"{key}_build")
+        s.run(f"export.{key}")
+    s.switch(REPORTS_PAGE)
+    if not s.has_widget("reports_excel_download"):
+        s.click("reports_excel_build")
+        s.run("export.reports_excel", pause=0)
+        # The page's progress fragment polls until the job is done, then reruns the page
+        if not s.idle(EXPORT_TIMEOUT, step="export.poll", until=lambda: s.has_widget("reports_excel_download")):
+            s.errors.append("export.reports_excel: not ready in time")
+
+
+SCENARIOS = {
+    "browse": browse,
+    "animation": animation,
+    "scrub": scrub,
+    "search": search,
+    "export": export,
+}
+
+_numbers = []
+
+
+def nusuk_numbers():
+    """Nusuk numbers of the dataset the server loads, read once."""
+    if not _numbers:
+        path = dataset_path()
+        compression = "gzip" if path.endswith(".gz") else None
+        _numbers.extend(pd.read_csv(path, compression=compression, usecols=["nusuk_number"],
+                                    dtype=str)["nusuk_number"])
+    return _numbers
+
+
+# ── Load ───────────────────────────────────────────────────────────────────
+def warm_up(server):
+    """Load the dataset once, so it is not billed to the first sessions."""
+    with Session(-1, "browse", server.url, think_time=0) as session:
+        session.run("open")
+    if session.errors:
+        raise SystemExit(f"app.py failed to run: {session.errors[0]}")
+
+
+def run_load(server, sessions, scenarios, think_time=THINK_TIME, ramp=0.5, log=print):
+    """Run `sessions` concurrent sessions (scenarios assigned round-robin); return the results."""
+    pool = [Session(i, scenario, server.url, think_time)
+            for i, scenario in zip(range(sessions), itertools.cycle(scenarios))]
+    if "search" in scenarios:
+        nusuk_numbers()
+    pid = server.process.pid
+    cpu_before, rss_before = proc_usage(pid)
+    started = time.perf_counter()
+    threads = []
+
+    def play(session):
+        try:
+            with session:
+                session.play()
+        except Exception as exc:  # no connection, or a scenario step found no widget to drive
+            session.errors.append(f"{session.scenario}: {exc!r}")
+
+    with ProcMonitor(pid) as rss:
+        for session in pool:
+            thread = threading.Thread(target=play, args=(session,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(ramp)
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+    cpu = proc_usage(pid)[0] - cpu_before
+    log(f"[{sessions} sessions] done in {wall:.1f} s")
+    return {
+        "sessions": pool,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "rss_before_mb": rss_before,
+        "rss_peak_mb": rss.peak,
+    }
+
+
+def _percentiles(seconds):
+    values = np.percentile(seconds, PERCENTILES) * 1000
+    return {f"p{p}_ms": round(float(v), 1) for p, v in zip(PERCENTILES, values)}
+
+
+def step_table(result):
+    """Latency percentiles of every step, over all sessions."""
+    timings = pd.DataFrame(
+        [timing for session in result["sessions"] for timing in session.timings],
+        columns=["step", "seconds"],
+    )
+    rows = []
+    for step, group in timings.groupby("step", sort=True):
+        rows.append({"step": step, "runs": len(group), **_percentiles(group["seconds"]),
+                     "max_ms": round(group["seconds"].max() * 1000, 1)})
+    return pd.DataFrame(rows)
+
+
+def session_table(result):
+    """Runs, errors and latency of every session."""
+    rows = []
+    for s in result["sessions"]:
+        seconds = [t for _, t in s.timings]
+        rows.append({
+            "session": s.index, "scenario": s.scenario, "runs": len(seconds), "errors": len(s.errors),
+            **({k: v for k, v in _percentiles(seconds).items() if k in ("p50_ms", "p95_ms")} if seconds else {}),
+        })
+    return pd.DataFrame(rows)
+
+
+def summary(result):
+    """The replica's totals: latency, throughput, CPU use and RSS."""
+    sessions = result["sessions"]
+    seconds = [t for s in sessions for _, t in s.timings]
+    rss_growth = result["rss_peak_mb"] - result["rss_before_mb"]
+    return {
+        "sessions": len(sessions),
+        "runs": len(seconds),
+        "errors": sum(len(s.errors) for s in sessions),
+        **(_percentiles(seconds) if seconds else {}),
+        "runs_per_s": round(len(seconds) / result["wall_s"], 2),
+        # Server CPU per wall second; 1.0 is one core fully busy
+        "cpu_use": round(result["cpu_s"] / result["wall_s"], 2),
+        "cpu_s": round(result["cpu_s"], 1),
+        "cpu_ms_per_run": round(result["cpu_s"] / len(seconds) * 1000, 1) if seconds else None,
+        "rss_before_mb": round(result["rss_before_mb"], 1),
+        "rss_peak_mb": round(result["rss_peak_mb"], 1),
+        "rss_growth_mb": round(rss_growth, 1),
+        # One process serves every session: an average of its growth, not a per-session measurement
+        "rss_avg_per_session_mb": round(rss_growth / len(sessions), 1),
+    }
+
+
+def _report(result):
+    print()
+    print(step_table(result).to_string(index=False))
+    print()
+    print(session_table(result).to_string(index=False))
+    errors = [(s.index, e) for s in result["sessions"] for e in s.errors]
+    if errors:
+        print(f"\n{len(errors)} error(s):")
+        for index, error in errors[:20]:
+            print(f"  [session {index}] {error}")
+    print()
+    for key, value in summary(result).items():
+        print(f"  {key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", default="4",
+                        help="concurrent sessions; a comma-separated list runs one load per count")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}, assigned round-robin")
+    parser.add_argument("--think", type=float, default=THINK_TIME, help="seconds between interactions")
+    parser.add_argument("--ramp", type=float, default=0.5, help="seconds between session starts")
+    parser.add_argument("--port", type=int, help="port for the server (default: a free one)")
+    parser.add_argument("--cold", action="store_true",
+                        help="skip the warm-up run (the first sessions load the dataset)")
+    parser.add_argument("--out", help="also write the summaries as JSON to this file")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s in SCENARIOS]
+    if not scenarios:
+        parser.error(f"no known scenario in --scenarios (choose from {','.join(SCENARIOS)})")
+    counts = [int(n) for n in args.sessions.split(",")]
+    if streamlit.__version__.rsplit(".", 1)[0] != TESTED_STREAMLIT:
+        print(f"Warning: benchmarks.loadtest was written against Streamlit {TESTED_STREAMLIT}.x; "
+              f"Streamlit {streamlit.__version__} is installed.", file=sys.stderr)
+
+    with Server(args.port) as server:
+        print(f"Server on port {server.port} (log: {server.log.name})")
+        if not args.cold:
+            print("Warming up (loading the dataset)...")
+            warm_up(server)
+
+        summaries = []
+        for count in counts:
+            result = run_load(server, count, scenarios, args.think, args.ramp)
+            _report(result)
+            summaries.append(summary(result))
+
+    if len(summaries) > 1:
+        columns = ["sessions", "runs", "errors", "p50_ms", "p95_ms", "runs_per_s", "cpu_use",
+                   "rss_peak_mb", "rss_avg_per_session_mb"]
+        print("\nCapacity:")
+        print(pd.DataFrame(summaries).reindex(columns=columns).to_string(index=False))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"scenarios": scenarios, "think_s": args.think, "results": summaries}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
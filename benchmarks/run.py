@@ -0,0 +1,278 @@
+"""
+Hajj Nusuk Dashboard - Benchmark Suite
+Times the dashboard's hot paths (loading, metrics, charts, Card Tracking
+search, stage/aging engines) on datasets of increasing size, cold (median
+of several calls, caches cleared before each) and warm (cached or repeated
+call), records peak memory of the cold call, and compares everything
+against a stored baseline. Cases over the baseline are measured a second
+time, and only the regressions that reproduce fail the run. The shared
+day matrix / core store every page builds once per dataset version is its
+own case (core_store); the other cases are timed cold with it already built.
+
+Run: python -m benchmarks.run --scales 200k,2m
+     python -m benchmarks.run --scales 200k --update-baseline
+     NUSUK_METRIC_WORKERS=4 python -m benchmarks.run --scales 2m  (sharded metrics)
+     NUSUK_STORAGE=sqlite python -m benchmarks.run --scales 2m  (SQLite storage mode)
+     NUSUK_STORAGE=events python -m benchmarks.run --scales 2m  (lifecycle event table)
+Exits with status 1 when a case regressed beyond the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import date
+
+from streamlit.logger import set_log_level
+
+# Metrics are st.cache_data functions; without a Streamlit runtime they fall
+# back to an in-memory cache and warn about it on import and on every call.
+set_log_level("error")
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from benchmarks.datasets import SCALES, dataset_dir
+from utils.data import read_dataset
+from utils.metrics import compute_metrics, compute_provider_metrics
+from utils.charts import (nationality_bar_chart, age_sex_pyramid, world_map_chart,
+                          severity_pie_chart, b2b_b2c_nationality_chart, pipeline_funnel_chart)
+from utils.query import match_positions, gather_rows
+from utils.sqlstore import use_sql, read_sql_dataset, get_sql_store
+from utils.stages import stage_codes_at, get_stage_days
+from utils.aging import get_aging_engine
+from utils.core import use_core, get_core_store, read_core_dataset
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+AS_OF = date(2025, 5, 31)
+WARM_REPEATS = 5
+# Cold calls per case (median): a single cold sample is too noisy to gate on
+COLD_REPEATS = 3
+# Allowed slowdown / memory growth over the baseline. Timings of an unchanged
+# tree drift by up to about 1.45x between runs on a shared single-CPU machine.
+TOLERANCE = 0.5
+# Differences below this many seconds are timer noise, never regressions
+# (cold calls allocate and fault in their caches, so they vary more)
+MIN_DELTA_S = 0.005
+COLD_MIN_DELTA_S = 0.02
+
+
+def _load(data_dir):
+    """The dataset as the app loads it (the zero-row header in SQLite storage mode, packed in memory mode)."""
+    if use_sql():
+        return read_sql_dataset(data_dir)
+    return read_core_dataset(data_dir) if use_core() else read_dataset(data_dir)
+
+
+def _rows(df):
+    return get_sql_store(df).n if use_sql() else len(df)
+
+
+def _cases(df):
+    """(name, function) of every benchmarked hot path on a loaded DataFrame."""
+    m = compute_metrics(df, AS_OF)
+    nusuk_number = gather_rows(df, [_rows(df) // 2], ["nusuk_number"])["nusuk_number"].iloc[0]
+    return [
+        ("compute_metrics", lambda: compute_metrics(df, AS_OF)),
+        ("compute_metrics_filtered", lambda: compute_metrics(
+            df, AS_OF, person_type_filter=["pilgrim_external"], nationality_filter=["Indonesia", "India"])),
+        ("compute_provider_metrics", lambda: compute_provider_metrics(df, AS_OF)),
+        ("chart.pipeline_funnel", lambda: pipeline_funnel_chart(m)),
+        ("chart.nationality_bar", lambda: nationality_bar_chart(df, AS_OF)),
+        ("chart.severity_pie", lambda: severity_pie_chart(df, AS_OF)),
+        ("chart.age_sex_pyramid", lambda: age_sex_pyramid(df, AS_OF)),
+        ("chart.world_map", lambda: world_map_chart(df, AS_OF)),
+        ("chart.b2b_b2c_nationality", lambda: b2b_b2c_nationality_chart(df, AS_OF)),
+        ("search.name", lambda: match_positions(df, AS_OF, search_query="moradi")),
+        ("search.nusuk_number", lambda: match_positions(df, AS_OF, search_query=nusuk_number)),
+        ("search.filters", lambda: match_positions(
+            df, AS_OF, nationality="Pakistan", card_status="at_provider")),
+        ("stage_codes", lambda: stage_codes_at(df, AS_OF)),
+        ("aging.summary", lambda: get_aging_engine(df).summary(AS_OF)),
+    ]
+
+
+def _clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def _build_core(df):
+    """Build the per-version arrays shared by metrics, search and aging."""
+    return get_core_store(df) if use_core() else get_stage_days(df)
+
+
+def _peak_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def _time(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def _cold(fn, clear):
+    clear()
+    return _time(fn)
+
+
+def measure(fn, repeats=WARM_REPEATS, clear=_clear_caches, cold_repeats=COLD_REPEATS):
+    """Median cold time (each after `clear`), median warm time and peak memory of the cold call."""
+    cold = statistics.median(_cold(fn, clear) for _ in range(cold_repeats))
+    warm = statistics.median(_time(fn) for _ in range(repeats))
+    # Memory in a separate cold pass: tracemalloc slows the traced code down
+    clear()
+    peak = _peak_mb(fn)
+    return {"cold_s": round(cold, 4), "warm_s": round(warm, 4), "peak_mb": round(peak, 1)}
+
+
+def run_scale(scale, repeats=WARM_REPEATS, cold_repeats=COLD_REPEATS, only=None, log=print):
+    """Results of every case at one scale (or of the case names in `only`)."""
+    data_dir = dataset_dir(scale)
+    results = {}
+    if only is None or "load_data" in only:
+        log(f"[{scale}] load_data")
+        # Loading has no cache of its own: every call is cold, so one warm repeat is enough
+        results["load_data"] = measure(lambda: _load(data_dir), repeats=1, clear=lambda: None,
+                                       cold_repeats=cold_repeats)
+    df = _load(data_dir)
+    if "load_data" in results:
+        results["load_data"]["rows"] = _rows(df)
+    if only is None or "core_store" in only:
+        log(f"[{scale}] core_store")
+        results["core_store"] = measure(lambda: _build_core(df), repeats, cold_repeats=cold_repeats)
+
+    def clear():
+        _clear_caches()
+        _build_core(df)
+
+    for name, fn in _cases(df):
+        if only is not None and name not in only:
+            continue
+        log(f"[{scale}] {name}")
+        results[name] = measure(fn, repeats, clear=clear, cold_repeats=cold_repeats)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Regressions as (scale, case, metric, baseline value, current value)."""
+    regressions = []
+    for scale, cases in results.items():
+        for case, current in cases.items():
+            expected = baseline.get(scale, {}).get(case)
+            if expected is None:
+                continue
+            for metric in ("cold_s", "warm_s", "peak_mb"):
+                if metric not in expected:
+                    continue
+                limit = expected[metric] * (1 + tolerance)
+                if metric != "peak_mb":
+                    noise = COLD_MIN_DELTA_S if metric == "cold_s" else MIN_DELTA_S
+                    limit = max(limit, expected[metric] + noise)
+                if current[metric] > limit:
+                    regressions.append((scale, case, metric, expected[metric], current[metric]))
+    return regressions
+
+
+def _table(results, baseline):
+    rows = []
+    for scale, cases in results.items():
+        for case, r in cases.items():
+            base = baseline.get(scale, {}).get(case, {})
+            rows.append({
+                "scale": scale, "case": case,
+                "cold_s": r["cold_s"], "warm_s": r["warm_s"], "peak_mb": r["peak_mb"],
+                "cold_vs_base": _ratio(r["cold_s"], base.get("cold_s")),
+                "warm_vs_base": _ratio(r["warm_s"], base.get("warm_s")),
+            })
+    return pd.DataFrame(rows).to_string(index=False)
+
+
+def _ratio(current, expected):
+    return f"{current / expected:.2f}x" if expected else "-"
+
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "streamlit": st.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "date": date.today().isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="200k", help=f"comma-separated subset of {','.join(SCALES)}")
+    parser.add_argument("--repeats", type=int, default=WARM_REPEATS, help="warm calls per case (median)")
+    parser.add_argument("--cold-repeats", type=int, default=COLD_REPEATS,
+                        help="cold calls per case, caches cleared before each (median)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"allowed relative slowdown / memory growth (default: {TOLERANCE})")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store these results as the baseline for the scales run")
+    parser.add_argument("--out", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    scales = [s for s in args.scales.split(",") if s in SCALES]
+    if not scales:
+        parser.error(f"no known scale in --scales (choose from {','.join(SCALES)})")
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+    baseline = stored.get("results", {})
+
+    results = {scale: run_scale(scale, args.repeats, args.cold_repeats) for scale in scales}
+    print()
+    print(_table(results, baseline))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": baseline}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        # Measure the flagged cases again: a regression must show up twice
+        flagged = {}
+        for scale, case, *_ in regressions:
+            flagged.setdefault(scale, set()).add(case)
+        print(f"\nMeasuring {sum(map(len, flagged.values()))} case(s) over the baseline again...")
+        again = {scale: run_scale(scale, args.repeats, args.cold_repeats, only=cases)
+                 for scale, cases in flagged.items()}
+        reproduced = {(scale, case, metric) for scale, case, metric, *_ in
+                      compare(again, baseline, args.tolerance)}
+        regressions = [r for r in regressions if r[:3] in reproduced]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over the baseline (+{args.tolerance:.0%}):")
+        for scale, case, metric, expected, current in regressions:
+            print(f"  [{scale}] {case} {metric}: {expected} -> {current}")
+        raise SystemExit(1)
+    print("\nNo regressions over the baseline.")
+
+
+if __name__ == "__main__":
+    main()
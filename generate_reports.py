@@ -0,0 +1,175 @@
+"""
+Hajj Nusuk Dashboard - Batch Report Generator
+Pre-renders the Reports page (daily status, weekly comparison, provider,
+overdue-cards and health reports) for every date in a range, in Arabic and
+English, as HTML / CSV / XLSX files. Dates are spread over a process pool.
+
+Run: python generate_reports.py --start 2025-04-01 --end 2025-06-30 --out reports
+"""
+
+import argparse
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from streamlit.logger import set_log_level
+
+# Metrics are st.cache_data functions; without a Streamlit runtime they fall
+# back to an in-memory cache and warn about it on import and on every call.
+set_log_level("error")
+
+from utils.data import DATA_DIR, read_dataset
+from utils.export import write_csv, write_excel
+from utils.filters import SEASON_START, SEASON_END
+from utils.i18n import t
+from utils.metrics import compute_metrics, compute_provider_metrics
+from utils.reports import (daily_report, weekly_comparison, summary_frame, report_sheets,
+                           overdue_cards, health_incidents, OVERDUE_DAYS)
+
+FORMATS = ["html", "csv", "xlsx"]
+LANGS = ["ar", "en"]
+
+HTML_STYLE = """
+body { font-family: 'Segoe UI', Tahoma, Arial, sans-serif; color: #4A3728; margin: 24px; }
+h1 { background: linear-gradient(135deg, #5C4033, #8B6914); color: white;
+     padding: 12px 20px; border-radius: 10px; text-align: center; }
+h2 { border-bottom: 2px solid #B8860B; padding-bottom: 4px; margin-top: 32px; }
+table { border-collapse: collapse; font-size: 13px; }
+th { background: #F0E6D4; }
+th, td { border: 1px solid #E8E0D0; padding: 4px 10px; }
+"""
+
+# Loaded once per worker process (see _init_worker)
+_DF = None
+
+
+def _init_worker(data_dir):
+    global _DF
+    _DF = read_dataset(data_dir)
+
+
+def _table_html(frame):
+    return frame.to_html(index=False, border=0, na_rep="")
+
+
+def render_html(report, lang):
+    """One self-contained HTML page with every report for one date."""
+    ar = lang == "ar"
+    title, sections = daily_report(report["m"], report["as_of"], lang)
+    parts = [f"<h1>{html.escape(title)}</h1>"]
+    for heading, items in sections:
+        parts.append(f"<h3>{html.escape(heading)}</h3><ul>")
+        for label, count, pct in items:
+            extra = f" ({pct:.1f}%)" if pct is not None else ""
+            parts.append(f"<li>{html.escape(label)}: <b>{count:,}</b>{extra}</li>")
+        parts.append("</ul>")
+
+    overdue_title = f"بطاقات متأخرة (أكثر من {OVERDUE_DAYS} أيام)" if ar else f"Overdue Cards (>{OVERDUE_DAYS} days)"
+    blocks = [
+        (t("weekly_comparison", lang), weekly_comparison(
+            report["m"], report["m_prev"], report["as_of"], report["week_ago"], lang)),
+        (t("provider_report", lang), report["providers"]),
+        (f"{overdue_title}: {len(report['overdue']):,}", report["overdue"]),
+        (t("health_report", lang), report["health"]),
+    ]
+    for heading, frame in blocks:
+        parts.append(f"<h2>{html.escape(heading)}</h2>")
+        parts.append(_table_html(frame))
+
+    return (
+        f'<!DOCTYPE html>\n<html lang="{lang}" dir="{"rtl" if ar else "ltr"}">\n'
+        f'<head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+        f"<style>{HTML_STYLE}</style></head>\n"
+        f"<body>\n{''.join(parts)}\n</body>\n</html>\n"
+    )
+
+
+def render_date(as_of, out_dir, formats, langs):
+    """Write every requested file for one date. Returns the paths written."""
+    df = _DF
+    week_ago = as_of - timedelta(days=7)
+    m = compute_metrics(df, as_of)
+    report = {
+        "as_of": as_of,
+        "week_ago": week_ago,
+        "m": m,
+        "m_prev": compute_metrics(df, week_ago),
+        "providers": compute_provider_metrics(df, as_of),
+        "overdue": overdue_cards(df, as_of),
+        "health": health_incidents(df, as_of),
+    }
+
+    date_dir = os.path.join(out_dir, str(as_of))
+    os.makedirs(date_dir, exist_ok=True)
+    written = []
+
+    def out(name):
+        path = os.path.join(date_dir, name)
+        written.append(path)
+        return path
+
+    if "csv" in formats:
+        for name, frame in [("providers", report["providers"]),
+                            ("overdue_cards", report["overdue"]),
+                            ("health", report["health"])]:
+            with open(out(f"{name}.csv"), "wb") as f:
+                write_csv(f, frame)
+
+    for lang in langs:
+        if "html" in formats:
+            with open(out(f"report_{lang}.html"), "w", encoding="utf-8") as f:
+                f.write(render_html(report, lang))
+        if "csv" in formats:
+            with open(out(f"summary_{lang}.csv"), "wb") as f:
+                write_csv(f, summary_frame(m, as_of, lang))
+        if "xlsx" in formats:
+            # Report sheets only; the full record dump stays an on-demand export
+            with open(out(f"report_{lang}.xlsx"), "wb") as f:
+                write_excel(f, report_sheets(df, as_of, m, lang, include_data=False))
+
+    return written
+
+
+def _date_range(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--start", type=date.fromisoformat, default=SEASON_START)
+    parser.add_argument("--end", type=date.fromisoformat, default=SEASON_END)
+    parser.add_argument("--out", default="reports", help="output directory")
+    parser.add_argument("--formats", default=",".join(FORMATS),
+                        help=f"comma-separated subset of {','.join(FORMATS)}")
+    parser.add_argument("--langs", default=",".join(LANGS),
+                        help=f"comma-separated subset of {','.join(LANGS)}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args()
+
+    formats = [f for f in args.formats.split(",") if f in FORMATS]
+    langs = [lang for lang in args.langs.split(",") if lang in LANGS]
+    dates = _date_range(args.start, args.end)
+    if not dates or not formats or not langs:
+        parser.error("nothing to generate (check --start/--end, --formats and --langs)")
+
+    print(f"Rendering {len(dates)} dates x {len(langs)} languages "
+          f"({', '.join(formats)}) with {args.workers} workers...")
+    started = time.time()
+    files = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.data_dir,)) as pool:
+        futures = [pool.submit(render_date, d, args.out, formats, langs) for d in dates]
+        for d, future in zip(dates, futures):
+            written = future.result()
+            files += len(written)
+            print(f"  {d}: {len(written)} files")
+
+    print(f"Done: {files:,} files in {args.out} ({time.time() - started:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
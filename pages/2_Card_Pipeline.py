@@ -8,6 +8,8 @@ import pandas as pd
 from datetime import datetime
 from utils.i18n import t, get_lang
 from utils.metrics import compute_metrics
+from utils.filters import live_section
+from utils.aging import get_aging_engine, STAGE_KEYS, SLA_DAYS, BUCKET_LABELS
 
 lang = get_lang()
 df = st.session_state.get("df")
@@ -15,8 +17,6 @@ filters = st.session_state.get("filters", {})
 if df is None:
     st.stop()
 
-as_of_date = filters.get("as_of_date")
-
 # ── B2B / B2C Toggle ──────────────────────────────────────────────────────
 b2b_b2c = st.radio(
     t("pilgrim_type"),
@@ -28,23 +28,6 @@ b2b_b2c = st.radio(
           "B2B: Pilgrims via authorized travel companies | B2C: Direct registration on Nusuk"),
 )
 
-# ── Header ─────────────────────────────────────────────────────────────────
-st.markdown(f'<div class="nusuk-header"><h2>{t("page_card_pipeline")}</h2></div>', unsafe_allow_html=True)
-
-# ── Overall Metrics (cached — pass filter params instead of pre-filtered df) ──
-m = compute_metrics(df, as_of_date, b2b_b2c_filter=b2b_b2c)
-
-# ── Top Alert Bar ──────────────────────────────────────────────────────────
-st.markdown(f"""
-<div style="background: linear-gradient(90deg, #5C4033, #8B6914);
-            color: white; padding: 10px 20px; border-radius: 8px; margin-bottom: 15px;
-            display: flex; justify-content: space-around; align-items: center; flex-wrap: wrap; gap: 15px;">
-    <span>👤 {t("total_arrivals")}: <strong>{m['total_arrivals']:,}</strong></span>
-    <span>📊 {t("arrival_pct")}: <strong>{m['arrival_pct']:.2f}%</strong></span>
-    <span>⚠️ {t("cards_not_delivered")}: <strong>{m['cards_not_delivered']:,}</strong></span>
-</div>
-""", unsafe_allow_html=True)
-
 
 # ── Pipeline Row Builder (using st.columns) ──────────────────────────────
 def _pipeline_row(metrics, label, show_groups=True):
@@ -80,9 +63,36 @@ def _pipeline_row(metrics, label, show_groups=True):
             st.markdown(f'<div class="pipeline-step"><div style="font-size:22px;">{icon}</div><div class="step-value">{value:,}</div><div class="step-label">{stage_label}</div>{pct_html}</div>', unsafe_allow_html=True)
 
 
-# ── Top Summary (all combined) ─────────────────────────────────────────────
-direction = "row-reverse" if lang == "ar" else "row"
-st.markdown(f"""
+def prefetch_frame(as_of_date):
+    """Cached metrics of one frame: overall and per person-type row."""
+    compute_metrics(df, as_of_date, b2b_b2c_filter=b2b_b2c)
+    for ptype in ("pilgrim_external", "pilgrim_internal", "service_worker"):
+        compute_metrics(df, as_of_date, person_type_filter=[ptype], b2b_b2c_filter=b2b_b2c)
+
+
+# ── Header ─────────────────────────────────────────────────────────────────
+st.markdown(f'<div class="nusuk-header"><h2>{t("page_card_pipeline")}</h2></div>', unsafe_allow_html=True)
+
+
+def render(as_of_date):
+    """Slider-driven part of the page (reruns on its own during the animation)."""
+    # ── Overall Metrics (cached — pass filter params instead of pre-filtered df) ──
+    m = compute_metrics(df, as_of_date, b2b_b2c_filter=b2b_b2c)
+
+    # ── Top Alert Bar ──────────────────────────────────────────────────────
+    st.markdown(f"""
+<div style="background: linear-gradient(90deg, #5C4033, #8B6914);
+            color: white; padding: 10px 20px; border-radius: 8px; margin-bottom: 15px;
+            display: flex; justify-content: space-around; align-items: center; flex-wrap: wrap; gap: 15px;">
+    <span>👤 {t("total_arrivals")}: <strong>{m['total_arrivals']:,}</strong></span>
+    <span>📊 {t("arrival_pct")}: <strong>{m['arrival_pct']:.2f}%</strong></span>
+    <span>⚠️ {t("cards_not_delivered")}: <strong>{m['cards_not_delivered']:,}</strong></span>
+</div>
+""", unsafe_allow_html=True)
+
+    # ── Top Summary (all combined) ─────────────────────────────────────────
+    direction = "row-reverse" if lang == "ar" else "row"
+    st.markdown(f"""
 <div style="background:linear-gradient(90deg,#F0E6D4,#FAF6F0); border-radius:10px; padding:15px; margin:10px 0;">
     <div style="display:flex; flex-direction:{direction};
                 justify-content:space-around; align-items:flex-start; flex-wrap:wrap; gap:10px;">
@@ -119,15 +129,67 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-# ── Per-type rows ──────────────────────────────────────────────────────────
-for ptype, label, show_g in [
-    ("pilgrim_external", "حجاج الخارج" if lang == "ar" else "External Pilgrims", True),
-    ("pilgrim_internal", "حجاج الداخل" if lang == "ar" else "Internal Pilgrims", True),
-    ("service_worker", "العاملين" if lang == "ar" else "Service Workers", False),
-]:
+    # ── Per-type rows ──────────────────────────────────────────────────────
+    for ptype, label, show_g in [
+        ("pilgrim_external", "حجاج الخارج" if lang == "ar" else "External Pilgrims", True),
+        ("pilgrim_internal", "حجاج الداخل" if lang == "ar" else "Internal Pilgrims", True),
+        ("service_worker", "العاملين" if lang == "ar" else "Service Workers", False),
+    ]:
+        st.divider()
+        pm = compute_metrics(df, as_of_date, person_type_filter=[ptype], b2b_b2c_filter=b2b_b2c)
+        _pipeline_row(pm, label, show_g)
+
+    # ── Card Aging (where each card is on the selected date) ──────────────
     st.divider()
-    pm = compute_metrics(df, as_of_date, person_type_filter=[ptype], b2b_b2c_filter=b2b_b2c)
-    _pipeline_row(pm, label, show_g)
-
-# ── Reload timestamp ──────────────────────────────────────────────────────
-st.caption(f"{t('reload_time')}: {datetime.now().strftime('%m/%d/%Y %I:%M:%S %p')}")
+    st.subheader("⏳ " + t("card_aging"))
+    aging = get_aging_engine(df)
+
+    with st.expander(t("sla_settings")):
+        sla = {}
+        for col, stage in zip(st.columns(len(STAGE_KEYS)), STAGE_KEYS):
+            with col:
+                sla[stage] = st.number_input(t(f"stage_{stage}"), min_value=0, max_value=90,
+                                             value=SLA_DAYS[stage], step=1, key=f"sla_{stage}")
+
+    days_label = "يوم" if lang == "ar" else "days"
+    aging_labels = {
+        "sla_days": "SLA",
+        "in_stage": "بالمرحلة" if lang == "ar" else "In Stage",
+        "overdue": "متأخرة" if lang == "ar" else "Overdue",
+        "overdue_pct": "نسبة التأخر %" if lang == "ar" else "Overdue %",
+        "avg_age": "متوسط الأيام" if lang == "ar" else "Avg Days",
+        "max_age": "أقصى مدة" if lang == "ar" else "Max Days",
+        **{label: f"{label} {days_label}" for label in BUCKET_LABELS},
+    }
+    overdue_pct_col = st.column_config.ProgressColumn(
+        aging_labels["overdue_pct"], min_value=0, max_value=100, format="%.1f%%")
+
+    summary = aging.summary(as_of_date, sla)
+    summary["stage"] = [t(f"stage_{s}") for s in summary["stage"]]
+    summary = summary.rename(columns={"stage": t("stage"), **aging_labels})
+    st.dataframe(summary, use_container_width=True, hide_index=True,
+        column_config={aging_labels["overdue_pct"]: overdue_pct_col})
+
+    col_a1, col_a2 = st.columns(2)
+    with col_a1:
+        aging_stage = st.selectbox(t("stage"), options=STAGE_KEYS, index=STAGE_KEYS.index("at_provider"),
+                                   format_func=lambda s: t(f"stage_{s}"), key="aging_stage")
+    with col_a2:
+        aging_by = st.radio("تصنيف حسب" if lang == "ar" else "Break down by",
+                            options=["service_provider", "nationality"], horizontal=True,
+                            format_func=lambda c: t("provider_filter") if c == "service_provider" else t("nationality_filter"),
+                            key="aging_by")
+
+    breakdown = aging.breakdown(as_of_date, aging_by, aging_stage, sla[aging_stage])
+    breakdown = breakdown.rename(columns={
+        aging_by: t("provider_filter") if aging_by == "service_provider" else t("nationality_filter"),
+        **aging_labels,
+    })
+    st.dataframe(breakdown, use_container_width=True, hide_index=True, height=400,
+        column_config={aging_labels["overdue_pct"]: overdue_pct_col})
+
+    # ── Reload timestamp ──────────────────────────────────────────────────
+    st.caption(f"{t('reload_time')}: {datetime.now().strftime('%m/%d/%Y %I:%M:%S %p')}")
+
+
+live_section(render, prefetch=prefetch_frame)
@@ -5,36 +5,49 @@ Search, filters, paginated results, individual lookup, export.
 
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 from utils.i18n import t, get_lang
+from utils.phonetic import MIN_PHONETIC_LEN, is_name_query
+from utils.query import (match_positions, gather_page, gather_rows, page_count, name_spellings,
+                         lookup_index, stage_codes_of)
+from utils.stages import STAGE_NAMES, STATUS_FLAG_STAGES, dataset_columns
+from utils.export import export_widget, export_csv, export_excel, CSV_MIME, EXCEL_MIME
+from utils.filters import live_section
+from utils.catalog import get_catalog
+from utils.profiling import span
 lang = get_lang()
 df = st.session_state.get("df")
 filters = st.session_state.get("filters", {})
 if df is None:
     st.stop()
 
-as_of_date = filters.get("as_of_date")
-
 # ── Header ─────────────────────────────────────────────────────────────────
 st.markdown(f'<div class="nusuk-header"><h2>{t("page_card_tracking")}</h2></div>', unsafe_allow_html=True)
 
 # ── Search ─────────────────────────────────────────────────────────────────
 search_query = st.text_input(t("search"), placeholder=t("search_placeholder"), key="search_input")
+if len(search_query.strip()) >= MIN_PHONETIC_LEN and is_name_query(search_query):
+    spellings = name_spellings(df, search_query)
+    if spellings:
+        st.caption(("تهجئات مطابقة" if lang == "ar" else "Matching spellings") + ": " + ", ".join(spellings[:12]))
 
 # ── Advanced Filters ───────────────────────────────────────────────────────
+catalog = get_catalog(df)
+person_type_labels = catalog["person_type"].labels(lang)
+
 with st.expander(t("advanced_filters"), expanded=False):
     col_f1, col_f2, col_f3, col_f4 = st.columns(4)
 
     with col_f1:
         selected_nationality = st.selectbox(
             t("nationality_filter"),
-            options=[t("all")] + sorted(df["nationality"].unique().tolist()),
+            options=[t("all")] + catalog["nationality"].sorted_values,
             key="track_nationality")
 
     with col_f2:
         selected_person_type = st.selectbox(
             t("person_type_filter"),
-            options=[t("all")] + df["person_type"].unique().tolist(),
+            options=[t("all")] + catalog["person_type"].values,
+            format_func=lambda x: person_type_labels.get(x, x),
             key="track_person_type")
 
     with col_f3:
@@ -52,95 +65,88 @@ with st.expander(t("advanced_filters"), expanded=False):
     with col_f4:
         selected_provider = st.selectbox(
             t("provider_filter"),
-            options=[t("all")] + sorted(df["service_provider"].dropna().unique().tolist()),
+            options=[t("all")] + catalog["service_provider"].sorted_values,
             key="track_provider")
 
 # ── Apply Filters ──────────────────────────────────────────────────────────
-as_of = pd.Timestamp(as_of_date)
-
-# Timeline filter (no .copy() needed — filtering creates new DataFrames)
-results = df[df["visa_issue_date"] <= as_of]
-
-# Search (all columns are already string from app.py load_data)
-if search_query:
-    q = search_query.lower()
-    results = results[
-        results["first_name"].str.lower().str.contains(q, na=False) |
-        results["last_name"].str.lower().str.contains(q, na=False) |
-        results["nusuk_number"].str.lower().str.contains(q, na=False) |
-        results["id_number"].str.lower().str.contains(q, na=False) |
-        results["passport_number"].str.lower().str.contains(q, na=False)
-    ]
-
-if selected_nationality != t("all"):
-    results = results[results["nationality"] == selected_nationality]
-if selected_person_type != t("all"):
-    results = results[results["person_type"] == selected_person_type]
-if selected_provider != t("all"):
-    results = results[results["service_provider"] == selected_provider]
-
-# Card status
-status_col_map = {
-    "Printed": "card_printed", "مطبوعة": "card_printed",
-    "At Center": "card_at_center", "بالمركز": "card_at_center",
-    "At Provider": "card_at_provider", "بالشركة": "card_at_provider",
-    "Received": "card_received", "مستلمة": "card_received",
-    "Activated": "card_activated", "مفعلة": "card_activated",
-}
-if selected_card_status in ("Not Printed", "لم تطبع"):
-    results = results[results["card_printed"] == False]
-elif selected_card_status in status_col_map:
-    results = results[results[status_col_map[selected_card_status]] == True]
-
-# ── Results ────────────────────────────────────────────────────────────────
-total_results = len(results)
-st.markdown(f"**{t('showing')} {min(total_results, 50)} {t('of')} {total_results:,} {t('records')}**")
-
-PAGE_SIZE = 50
-total_pages = max(1, (total_results + PAGE_SIZE - 1) // PAGE_SIZE)
-current_page = st.number_input(t("page"), min_value=1, max_value=total_pages, value=1, step=1, key="page_num")
-
-start_idx = (current_page - 1) * PAGE_SIZE
-page_results = results.iloc[start_idx:start_idx + PAGE_SIZE]
-
-display_cols = [
-    "person_id", "first_name", "last_name", "nationality", "person_type",
-    "nusuk_number", "card_printed", "card_at_center", "card_at_provider",
-    "card_received", "card_activated", "arrival_status", "service_provider",
-]
-
-col_labels = {
-    "person_id": "ID",
-    "first_name": "الاسم الأول" if lang == "ar" else "First Name",
-    "last_name": "اسم العائلة" if lang == "ar" else "Last Name",
-    "nationality": "الجنسية" if lang == "ar" else "Nationality",
-    "person_type": "النوع" if lang == "ar" else "Type",
-    "nusuk_number": "رقم النسك" if lang == "ar" else "Nusuk #",
-    "card_printed": "مطبوعة" if lang == "ar" else "Printed",
-    "card_at_center": "بالمركز" if lang == "ar" else "At Center",
-    "card_at_provider": "بالشركة" if lang == "ar" else "At Provider",
-    "card_received": "مستلمة" if lang == "ar" else "Received",
-    "card_activated": "مفعلة" if lang == "ar" else "Activated",
-    "arrival_status": "وصل" if lang == "ar" else "Arrived",
-    "service_provider": "الشركة" if lang == "ar" else "Provider",
+# Status labels (both languages) → query engine status keys
+card_status_keys = {
+    "Printed": "printed", "مطبوعة": "printed",
+    "At Center": "at_center", "بالمركز": "at_center",
+    "At Provider": "at_provider", "بالشركة": "at_provider",
+    "Received": "received", "مستلمة": "received",
+    "Activated": "activated", "مفعلة": "activated",
+    "Not Printed": "not_printed", "لم تطبع": "not_printed",
 }
 
-display_df = page_results[display_cols].copy()
-display_df.columns = [col_labels.get(c, c) for c in display_cols]
-st.dataframe(display_df, use_container_width=True, hide_index=True, height=500)
 
-# ── Individual Record Lookup ───────────────────────────────────────────────
-st.divider()
-st.subheader("🔎 " + t("details"))
-
-lookup_id = st.text_input("Person ID" if lang == "en" else "رقم الشخص", key="lookup_id")
+def render(as_of_date):
+    """Slider-driven part of the page (reruns on its own during the animation)."""
+    # Only row positions are computed here; rows are gathered per page below
+    positions = match_positions(
+        df, as_of_date,
+        search_query=search_query,
+        nationality=None if selected_nationality == t("all") else selected_nationality,
+        person_type=None if selected_person_type == t("all") else selected_person_type,
+        provider=None if selected_provider == t("all") else selected_provider,
+        card_status=card_status_keys.get(selected_card_status),
+    )
+
+    # ── Results ────────────────────────────────────────────────────────────
+    total_results = len(positions)
+
+    PAGE_SIZE = 50
+    total_pages = page_count(total_results, PAGE_SIZE)
+    current_page = st.number_input(t("page"), min_value=1, max_value=total_pages, value=1, step=1, key="page_num")
+
+    display_cols = [
+        "person_id", "first_name", "last_name", "nationality", "person_type",
+        "nusuk_number", "card_printed", "card_at_center", "card_at_provider",
+        "card_received", "card_activated", "arrival_status", "service_provider",
+    ]
 
-if lookup_id:
-    try:
-        pid = int(lookup_id)
-        person = df[df["person_id"] == pid]
-        if len(person) > 0:
-            p = person.iloc[0]
+    col_labels = {
+        "person_id": "ID",
+        "first_name": "الاسم الأول" if lang == "ar" else "First Name",
+        "last_name": "اسم العائلة" if lang == "ar" else "Last Name",
+        "nationality": "الجنسية" if lang == "ar" else "Nationality",
+        "person_type": "النوع" if lang == "ar" else "Type",
+        "nusuk_number": "رقم النسك" if lang == "ar" else "Nusuk #",
+        "card_printed": "مطبوعة" if lang == "ar" else "Printed",
+        "card_at_center": "بالمركز" if lang == "ar" else "At Center",
+        "card_at_provider": "بالشركة" if lang == "ar" else "At Provider",
+        "card_received": "مستلمة" if lang == "ar" else "Received",
+        "card_activated": "مفعلة" if lang == "ar" else "Activated",
+        "arrival_status": "وصل" if lang == "ar" else "Arrived",
+        "service_provider": "الشركة" if lang == "ar" else "Provider",
+    }
+
+    # Status columns show the state on the selected date
+    display_df = gather_page(df, positions, current_page, PAGE_SIZE, display_cols, col_labels, as_of_date)
+    st.markdown(f"**{t('showing')} {len(display_df)} {t('of')} {total_results:,} {t('records')}**")
+    with span("table"):
+        st.dataframe(display_df, use_container_width=True, hide_index=True, height=500)
+
+    # ── Individual Record Lookup ───────────────────────────────────────────
+    st.divider()
+    st.subheader("🔎 " + t("details"))
+
+    lookup_id = st.text_input(
+        "رقم الشخص أو رقم الهوية / النسك / الجواز / التأشيرة" if lang == "ar"
+        else "Person ID or ID / Nusuk / Passport / Visa number",
+        key="lookup_id")
+
+    if lookup_id:
+        id_index = lookup_index(df)
+        matches = id_index.find(lookup_id)
+        if matches:
+            _, pos = matches[0]
+            p = gather_rows(df, [pos], dataset_columns(df)).iloc[0]
+            # Linked family records, with the record's own stage code first
+            links = [(relation, rel_pos) for relation, positions in id_index.related(pos).items()
+                     for rel_pos in positions]
+            stage_codes = stage_codes_of(df, as_of_date, [pos] + [rel_pos for _, rel_pos in links])
+            stage = stage_codes[0]
             col_d1, col_d2, col_d3 = st.columns(3)
 
             with col_d1:
@@ -154,6 +160,7 @@ if lookup_id:
             with col_d2:
                 st.markdown("**" + ("حالة البطاقة" if lang == "ar" else "Card Status") + "**")
                 st.write(f"{'رقم النسك' if lang == 'ar' else 'Nusuk #'}: {p['nusuk_number']}")
+                st.write(f"{t('stage')} ({as_of_date}): {t('stage_' + STAGE_NAMES[stage])}")
                 for col_name, label in [
                     ("card_printed", "مطبوعة" if lang == "ar" else "Printed"),
                     ("card_at_center", "بالمركز" if lang == "ar" else "At Center"),
@@ -161,32 +168,64 @@ if lookup_id:
                     ("card_received", "مستلمة" if lang == "ar" else "Received"),
                     ("card_activated", "مفعلة" if lang == "ar" else "Activated"),
                 ]:
-                    st.write(f"{'✅' if p[col_name] else '❌'} {label}")
+                    st.write(f"{'✅' if stage >= STATUS_FLAG_STAGES[col_name] else '❌'} {label}")
 
             with col_d3:
                 st.markdown("**" + ("معلومات السفر" if lang == "ar" else "Travel Info") + "**")
                 st.write(f"{'الشركة' if lang == 'ar' else 'Provider'}: {p['service_provider']}")
-                st.write(f"{'وصل' if lang == 'ar' else 'Arrived'}: {'✅' if p['arrival_status'] else '❌'}")
-                if pd.notna(p['arrival_date']):
+                arrived = pd.notna(p['arrival_date']) and p['arrival_date'] <= pd.Timestamp(as_of_date)
+                st.write(f"{'وصل' if lang == 'ar' else 'Arrived'}: {'✅' if arrived else '❌'}")
+                if arrived:
                     st.write(f"{'تاريخ الوصول' if lang == 'ar' else 'Arrival Date'}: {p['arrival_date']}")
                 st.write(f"{'ميناء الوصول' if lang == 'ar' else 'Port'}: {p['arrival_port']}")
                 st.write(f"{'طريقة السفر' if lang == 'ar' else 'Travel Mode'}: {p['travel_mode']}")
+
+            # ── Linked family records ──────────────────────────────────
+            relatives = gather_rows(df, [rel_pos for _, rel_pos in links],
+                                    ["person_id", "first_name", "last_name", "nusuk_number"])
+            family_rows = [
+                (relation, rel, rel_stage)
+                for (relation, _), (_, rel), rel_stage in zip(links, relatives.iterrows(), stage_codes[1:])
+            ]
+            if family_rows:
+                relation_labels = {
+                    "spouse": "زوج/ة" if lang == "ar" else "Spouse",
+                    "father": "الأب" if lang == "ar" else "Father",
+                    "children": "ابن/ة" if lang == "ar" else "Child",
+                }
+                st.markdown("**" + ("السجلات العائلية المرتبطة" if lang == "ar" else "Linked Family Records") + "**")
+                st.dataframe(pd.DataFrame([{
+                    ("الصلة" if lang == "ar" else "Relation"): relation_labels[relation],
+                    "ID": rel["person_id"],
+                    ("الاسم" if lang == "ar" else "Name"): f"{rel['first_name']} {rel['last_name']}",
+                    ("رقم النسك" if lang == "ar" else "Nusuk #"): rel["nusuk_number"],
+                    ("مستلمة" if lang == "ar" else "Received"): rel_stage >= STATUS_FLAG_STAGES["card_received"],
+                    ("مفعلة" if lang == "ar" else "Activated"): rel_stage >= STATUS_FLAG_STAGES["card_activated"],
+                } for relation, rel, rel_stage in family_rows]), use_container_width=True, hide_index=True)
         else:
             st.warning(t("no_results"))
-    except ValueError:
-        st.warning("يرجى إدخال رقم صحيح." if lang == "ar" else "Please enter a valid numeric ID.")
-
-# ── Export ─────────────────────────────────────────────────────────────────
-st.divider()
-if st.session_state.get("playing", False):
-    st.info("⏸ " + ("أوقف التشغيل للتحميل" if lang == "ar" else "Stop animation to download"))
-else:
-    col_exp1, col_exp2, _ = st.columns([1, 1, 3])
-    with col_exp1:
-        csv_data = results[display_cols].head(50000).to_csv(index=False).encode("utf-8-sig")
-        st.download_button(t("export_csv"), data=csv_data, file_name="hajj_card_tracking.csv", mime="text/csv", use_container_width=True)
-    with col_exp2:
-        buffer = BytesIO()
-        results[display_cols].head(10000).to_excel(buffer, index=False, engine="openpyxl")
-        st.download_button(t("export_excel"), data=buffer.getvalue(), file_name="hajj_card_tracking.xlsx",
-                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+
+    # ── Export ─────────────────────────────────────────────────────────────
+    st.divider()
+    if st.session_state.get("playing", False):
+        st.info("⏸ " + ("أوقف التشغيل للتحميل" if lang == "ar" else "Stop animation to download"))
+    else:
+        col_exp1, col_exp2, _ = st.columns([1, 1, 3])
+        with col_exp1:
+            # Built only when requested; the export signature is the current result set
+            export_widget(
+                t("export_csv"), "hajj_card_tracking.csv", CSV_MIME, key="tracking_csv",
+                build=lambda progress: export_csv(df, positions, display_cols, progress, as_of_date),
+                signature=(as_of_date, search_query, selected_nationality, selected_person_type,
+                           selected_card_status, selected_provider),
+            )
+        with col_exp2:
+            export_widget(
+                t("export_excel"), "hajj_card_tracking.xlsx", EXCEL_MIME, key="tracking_excel",
+                build=lambda progress: export_excel([("Card Tracking", df, positions, display_cols)], progress, as_of_date),
+                signature=(as_of_date, search_query, selected_nationality, selected_person_type,
+                           selected_card_status, selected_provider),
+            )
+
+
+live_section(render)
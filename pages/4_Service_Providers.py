@@ -3,75 +3,125 @@ Page 4: Service Providers - شركات تقديم الخدمة
 """
 
 import streamlit as st
+from functools import partial
 import pandas as pd
 from utils.i18n import t, get_lang
-from utils.metrics import compute_provider_metrics
+from utils.metrics import compute_provider_metrics, compute_group_metrics, record_counts
+from utils.query import select_rows
 from utils.charts import provider_comparison_chart
+from utils.filters import live_section
+from utils.profiling import span
 lang = get_lang()
 df = st.session_state.get("df")
 filters = st.session_state.get("filters", {})
 if df is None:
     st.stop()
 
-as_of_date = filters.get("as_of_date")
-
 st.markdown(f'<div class="nusuk-header"><h2>{t("page_service_providers")}</h2></div>', unsafe_allow_html=True)
 
-provider_df = compute_provider_metrics(df, as_of_date)
-if provider_df.empty:
-    st.warning(t("no_results"))
-    st.stop()
 
-# ── KPIs ───────────────────────────────────────────────────────────────────
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric("الشركات" if lang == "ar" else "Total Providers", f"{len(provider_df)}")
-with col2:
-    st.metric("متوسط التسليم" if lang == "ar" else "Avg Delivery Rate", f"{provider_df['delivery_rate'].mean():.1f}%")
-with col3:
-    under = (provider_df["delivery_rate"] < 60).sum()
-    st.metric("أداء ضعيف (<60%)" if lang == "ar" else "Under-Performing", f"{under}", delta=f"-{under}" if under > 0 else "0", delta_color="inverse")
-with col4:
-    st.metric(t("health_incidents"), f"{provider_df['health_incidents'].sum():,}")
+def render(as_of_date):
+    """Slider-driven part of the page (reruns on its own during the animation)."""
+    provider_df = compute_provider_metrics(df, as_of_date)
+    if provider_df.empty:
+        st.warning(t("no_results"))
+        return
+
+    # ── KPIs ───────────────────────────────────────────────────────────────
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("الشركات" if lang == "ar" else "Total Providers", f"{len(provider_df)}")
+    with col2:
+        st.metric("متوسط التسليم" if lang == "ar" else "Avg Delivery Rate", f"{provider_df['delivery_rate'].mean():.1f}%")
+    with col3:
+        under = (provider_df["delivery_rate"] < 60).sum()
+        st.metric("أداء ضعيف (<60%)" if lang == "ar" else "Under-Performing", f"{under}", delta=f"-{under}" if under > 0 else "0", delta_color="inverse")
+    with col4:
+        st.metric(t("health_incidents"), f"{provider_df['health_incidents'].sum():,}")
+
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # ── Chart ──────────────────────────────────────────────────────────────
+    st.plotly_chart(provider_comparison_chart(provider_df), use_container_width=True)
+
+    # ── Table ──────────────────────────────────────────────────────────────
+    st.subheader(t("provider_performance"))
+    display_df = provider_df.copy()
+    display_df.columns = [
+        "الشركة" if lang == "ar" else "Provider",
+        "الحجاج" if lang == "ar" else "Pilgrims",
+        "بطاقات بالشركة" if lang == "ar" else "Cards at Provider",
+        "بطاقات مستلمة" if lang == "ar" else "Cards Received",
+        "بطاقات مفعلة" if lang == "ar" else "Cards Activated",
+        "نسبة التسليم %" if lang == "ar" else "Delivery Rate %",
+        "متوسط الأيام" if lang == "ar" else "Avg Days",
+        "حالات صحية" if lang == "ar" else "Health Incidents",
+    ]
+    with span("table"):
+        st.dataframe(display_df, use_container_width=True, hide_index=True, height=600,
+            column_config={display_df.columns[5]: st.column_config.ProgressColumn(display_df.columns[5], min_value=0, max_value=100, format="%.1f%%")})
 
-st.markdown("<br>", unsafe_allow_html=True)
+    # ── Worst Groups ───────────────────────────────────────────────────────
+    st.divider()
+    st.subheader("👥 " + ("أضعف المجموعات" if lang == "ar" else "Worst Groups"))
+    group_df = compute_group_metrics(df, as_of_date)
+    if not group_df.empty:
+        rank_options = {
+            "completion_rate": "أقل نسبة إكمال" if lang == "ar" else "Lowest completion",
+            "laggards": "أكثر المتأخرين" if lang == "ar" else "Most laggards",
+            "arrival_spread": "أطول فترة وصول" if lang == "ar" else "Widest arrival spread",
+        }
+        col_g1, col_g2 = st.columns([2, 1])
+        with col_g1:
+            rank_by = st.selectbox("ترتيب حسب" if lang == "ar" else "Rank by", options=list(rank_options),
+                format_func=rank_options.get, key="group_rank")
+        with col_g2:
+            top_n = st.number_input("عدد المجموعات" if lang == "ar" else "Groups shown", min_value=10,
+                max_value=len(group_df), value=min(50, len(group_df)), step=10, key="group_top_n")
+        if rank_by != "completion_rate":
+            group_df = group_df.sort_values(rank_by, ascending=False, kind="stable", na_position="last")
+        display_groups = group_df.head(int(top_n)).rename(columns={
+            "group_id": "المجموعة" if lang == "ar" else "Group",
+            "pilgrims": "الحجاج" if lang == "ar" else "Pilgrims",
+            "issued": "تأشيرات" if lang == "ar" else "Issued",
+            "printed": "مطبوعة" if lang == "ar" else "Printed",
+            "at_center": "بالمركز" if lang == "ar" else "At Center",
+            "at_provider": "بالشركة" if lang == "ar" else "At Provider",
+            "received": "مستلمة" if lang == "ar" else "Received",
+            "activated": "مفعلة" if lang == "ar" else "Activated",
+            "completion_rate": "نسبة الإكمال %" if lang == "ar" else "Completion %",
+            "arrived": "وصلوا" if lang == "ar" else "Arrived",
+            "arrival_spread": "مدى الوصول (أيام)" if lang == "ar" else "Arrival Spread (days)",
+            "laggards": "متأخرون" if lang == "ar" else "Laggards",
+        })
+        completion_col = display_groups.columns[8]
+        with span("group_table"):
+            st.dataframe(display_groups, use_container_width=True, hide_index=True, height=400,
+                column_config={completion_col: st.column_config.ProgressColumn(completion_col, min_value=0, max_value=100, format="%.1f%%")})
+        st.caption("المتأخرون: أفراد المجموعة الذين لم يبلغوا المرحلة الوسيطة للمجموعة" if lang == "ar"
+            else "Laggards: members behind the group's median pipeline stage.")
 
-# ── Chart ──────────────────────────────────────────────────────────────────
-st.plotly_chart(provider_comparison_chart(provider_df), use_container_width=True)
+    # ── Drill-Down ─────────────────────────────────────────────────────────
+    st.divider()
+    st.subheader("🔍 " + ("تفاصيل الشركة" if lang == "ar" else "Provider Detail"))
 
-# ── Table ──────────────────────────────────────────────────────────────────
-st.subheader(t("provider_performance"))
-display_df = provider_df.copy()
-display_df.columns = [
-    "الشركة" if lang == "ar" else "Provider",
-    "الحجاج" if lang == "ar" else "Pilgrims",
-    "بطاقات بالشركة" if lang == "ar" else "Cards at Provider",
-    "بطاقات مستلمة" if lang == "ar" else "Cards Received",
-    "بطاقات مفعلة" if lang == "ar" else "Cards Activated",
-    "نسبة التسليم %" if lang == "ar" else "Delivery Rate %",
-    "متوسط الأيام" if lang == "ar" else "Avg Days",
-    "حالات صحية" if lang == "ar" else "Health Incidents",
-]
-st.dataframe(display_df, use_container_width=True, hide_index=True, height=600,
-    column_config={display_df.columns[5]: st.column_config.ProgressColumn(display_df.columns[5], min_value=0, max_value=100, format="%.1f%%")})
+    selected_provider = st.selectbox("اختر شركة" if lang == "ar" else "Select Provider", options=provider_df["provider"].tolist(), key="provider_detail")
 
-# ── Drill-Down ─────────────────────────────────────────────────────────────
-st.divider()
-st.subheader("🔍 " + ("تفاصيل الشركة" if lang == "ar" else "Provider Detail"))
+    if selected_provider:
+        provider_filter = {"service_provider": [selected_provider]}
+        col_d1, col_d2 = st.columns(2)
+        with col_d1:
+            st.markdown("**" + ("توزيع الأنواع" if lang == "ar" else "Person Type Breakdown") + "**")
+            for ptype, count in record_counts(df, "person_type", filters=provider_filter).items():
+                st.write(f"  {t(ptype)}: {count:,}")
+        with col_d2:
+            st.markdown("**" + ("أعلى الجنسيات" if lang == "ar" else "Top Nationalities") + "**")
+            for nat, count in record_counts(df, "nationality", filters=provider_filter, limit=5).items():
+                st.write(f"  {nat}: {count:,}")
 
-selected_provider = st.selectbox("اختر شركة" if lang == "ar" else "Select Provider", options=provider_df["provider"].tolist(), key="provider_detail")
+        show_cols = ["person_id", "first_name", "last_name", "nationality", "person_type", "card_printed", "card_received", "card_activated"]
+        st.dataframe(select_rows(df, show_cols, provider_filter, limit=200),
+                     use_container_width=True, hide_index=True, height=400)
 
-if selected_provider:
-    prov_data = df[df["service_provider"] == selected_provider]
-    col_d1, col_d2 = st.columns(2)
-    with col_d1:
-        st.markdown("**" + ("توزيع الأنواع" if lang == "ar" else "Person Type Breakdown") + "**")
-        for ptype, count in prov_data["person_type"].value_counts().items():
-            st.write(f"  {t(ptype)}: {count:,}")
-    with col_d2:
-        st.markdown("**" + ("أعلى الجنسيات" if lang == "ar" else "Top Nationalities") + "**")
-        for nat, count in prov_data["nationality"].value_counts().head(5).items():
-            st.write(f"  {nat}: {count:,}")
 
-    show_cols = ["person_id", "first_name", "last_name", "nationality", "person_type", "card_printed", "card_received", "card_activated"]
-    st.dataframe(prov_data[show_cols].head(200), use_container_width=True, hide_index=True, height=400)
+live_section(render, prefetch=partial(compute_provider_metrics, df))
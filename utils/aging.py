@@ -0,0 +1,188 @@
+"""
+SLA aging for every card stage.
+For any date, each card's current stage and how many days it has waited
+there, computed from stage day offsets (utils.stages) as of that date.
+Results can be summarised per stage or broken down per provider or
+nationality, cheaply enough to recompute on every slider move. In SQLite
+storage mode the same tables are SQL aggregates (SqlAging).
+"""
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from utils.stages import get_stage_days, day_offset
+from utils.data import frame_key
+from utils.core import get_dimension_codes
+from utils.sqlstore import use_sql, get_sql_store
+
+
+# Stages a card waits in: (key, column of the date it entered, column of the date it left)
+AGING_STAGES = [
+    ("awaiting_print", "visa_issue_date", "card_printed_date"),
+    ("printed", "card_printed_date", "card_at_center_date"),
+    ("at_center", "card_at_center_date", "card_at_provider_date"),
+    ("at_provider", "card_at_provider_date", "card_received_date"),
+    ("received", "card_received_date", "card_activation_date"),
+]
+STAGE_KEYS = [key for key, _, _ in AGING_STAGES]
+
+# Default SLA per stage, in days; a card waiting longer is overdue
+SLA_DAYS = {
+    "awaiting_print": 14,
+    "printed": 5,
+    "at_center": 7,
+    "at_provider": 7,
+    "received": 7,
+}
+
+# Lower edges of the aging buckets, in days
+BUCKET_EDGES = [0, 3, 8, 15, 31]
+BUCKET_LABELS = ["0-2", "3-7", "8-14", "15-30", "31+"]
+
+GROUP_COLS = ["service_provider", "nationality"]
+
+
+def _summary_row(stage, sla, in_stage, over, age_sum, max_age, buckets):
+    """Summary table row of one stage from its aggregates."""
+    row = {
+        "stage": stage,
+        "sla_days": sla,
+        "in_stage": in_stage,
+        "overdue": over,
+        "overdue_pct": round(over / max(in_stage, 1) * 100, 1),
+        "avg_age": round(age_sum / in_stage, 1) if in_stage else 0.0,
+        "max_age": max_age,
+    }
+    row.update(zip(BUCKET_LABELS, buckets))
+    return row
+
+
+def _breakdown_frame(by, uniques, in_stage, over, age_sum, max_age, buckets):
+    """Breakdown table from per-group aggregates (`buckets`: groups x BUCKET_LABELS), most overdue first."""
+    result = pd.DataFrame({
+        by: np.asarray(uniques, dtype=object),
+        "in_stage": in_stage,
+        "overdue": over,
+        "overdue_pct": np.round(over / np.maximum(in_stage, 1) * 100, 1),
+        "avg_age": np.round(age_sum / np.maximum(in_stage, 1), 1),
+        "max_age": max_age,
+    })
+    for i, label in enumerate(BUCKET_LABELS):
+        result[label] = buckets[:, i]
+    result = result[result["in_stage"] > 0]
+    return result.sort_values(["overdue", "in_stage"], ascending=False).reset_index(drop=True)
+
+
+class AgingEngine:
+    """
+    Stage entry/exit offsets plus group codes for one loaded DataFrame.
+    Both are shared, not copied: the stage days of its version and the
+    dimension codes of its dataset file (utils.core), so a live version
+    costs no pass over the frame.
+    """
+
+    def __init__(self, df):
+        days = get_stage_days(df)
+        self.n = len(df)
+        self._stages = {key: (days[entered], days[left]) for key, entered, left in AGING_STAGES}
+        codes, categories = get_dimension_codes(df)
+        self._groups = {col: (codes[col], categories[col]) for col in GROUP_COLS}
+        self._bucket_edges = np.array(BUCKET_EDGES, dtype=np.int32)
+
+    def stage_ages(self, as_of_date, stage):
+        """(positions, ages in days) of the cards sitting in `stage` at as_of_date."""
+        d = day_offset(as_of_date)
+        entered, left = self._stages[stage]
+        positions = np.flatnonzero((entered <= d) & (left > d)).astype(np.int32)
+        ages = (d - entered[positions].astype(np.int32))
+        return positions, ages
+
+    def overdue(self, as_of_date, stage, sla=None):
+        """(positions, ages) of cards in `stage` longer than the SLA, oldest first."""
+        sla = SLA_DAYS[stage] if sla is None else sla
+        positions, ages = self.stage_ages(as_of_date, stage)
+        late = ages > sla
+        positions, ages = positions[late], ages[late]
+        order = np.argsort(-ages, kind="stable")
+        return positions[order], ages[order]
+
+    def _bucket_counts(self, ages, groups=None, n_groups=1):
+        buckets = np.searchsorted(self._bucket_edges, ages, side="right") - 1
+        if groups is None:
+            return np.bincount(buckets, minlength=len(BUCKET_EDGES)).reshape(1, -1)
+        flat = groups.astype(np.int64) * len(BUCKET_EDGES) + buckets
+        counts = np.bincount(flat, minlength=n_groups * len(BUCKET_EDGES))
+        return counts.reshape(n_groups, len(BUCKET_EDGES))
+
+    def summary(self, as_of_date, sla=None):
+        """One row per stage: cards waiting, overdue count/%, average and max age, bucket counts."""
+        sla = {**SLA_DAYS, **(sla or {})}
+        rows = []
+        for stage in STAGE_KEYS:
+            _, ages = self.stage_ages(as_of_date, stage)
+            n = len(ages)
+            rows.append(_summary_row(
+                stage, sla[stage], n, int((ages > sla[stage]).sum()), float(ages.sum()),
+                int(ages.max()) if n else 0, self._bucket_counts(ages)[0].tolist()))
+        return pd.DataFrame(rows)
+
+    def breakdown(self, as_of_date, by, stage, sla=None):
+        """
+        Aging of one stage per provider or nationality (`by`), as one row per
+        group with cards waiting, overdue count/%, average and max age and
+        bucket counts, most overdue first. Groups with no card waiting are left out.
+        """
+        sla = SLA_DAYS[stage] if sla is None else sla
+        codes, uniques = self._groups[by]
+        positions, ages = self.stage_ages(as_of_date, stage)
+        groups = codes[positions]
+        known = groups >= 0
+        groups, ages = groups[known], ages[known]
+        n_groups = len(uniques)
+
+        in_stage = np.bincount(groups, minlength=n_groups)
+        over = np.bincount(groups, weights=(ages > sla), minlength=n_groups).astype(np.int64)
+        age_sum = np.bincount(groups, weights=ages, minlength=n_groups)
+        max_age = np.zeros(n_groups, dtype=np.int64)
+        np.maximum.at(max_age, groups, ages)
+        buckets = self._bucket_counts(ages, groups, n_groups)
+        return _breakdown_frame(by, uniques, in_stage, over, age_sum, max_age, buckets)
+
+
+class SqlAging:
+    """AgingEngine tables of the SQLite store, aggregated in SQL (no per-card arrays are held)."""
+
+    def __init__(self, store):
+        self.store = store
+        self._stages = {key: (entered, left) for key, entered, left in AGING_STAGES}
+
+    def overdue(self, as_of_date, stage, sla=None):
+        """(positions, ages) of cards in `stage` longer than the SLA, oldest first."""
+        sla = SLA_DAYS[stage] if sla is None else sla
+        return self.store.stage_overdue(as_of_date, *self._stages[stage], sla)
+
+    def summary(self, as_of_date, sla=None):
+        """One row per stage: cards waiting, overdue count/%, average and max age, bucket counts."""
+        sla = {**SLA_DAYS, **(sla or {})}
+        rows = []
+        for stage in STAGE_KEYS:
+            (n, over, age_sum, max_age, *buckets), = self.store.stage_aging(
+                as_of_date, *self._stages[stage], sla[stage], BUCKET_EDGES)
+            rows.append(_summary_row(stage, sla[stage], n, over, age_sum, max_age, buckets))
+        return pd.DataFrame(rows)
+
+    def breakdown(self, as_of_date, by, stage, sla=None):
+        """Aging of one stage per provider or nationality (`by`), as AgingEngine.breakdown."""
+        sla = SLA_DAYS[stage] if sla is None else sla
+        rows = self.store.stage_aging(as_of_date, *self._stages[stage], sla, BUCKET_EDGES, by=by)
+        table = np.array([row[1:] for row in rows], dtype=np.int64).reshape(len(rows), 4 + len(BUCKET_EDGES))
+        return _breakdown_frame(by, [row[0] for row in rows], table[:, 0], table[:, 1],
+                                table[:, 2].astype(np.float64), table[:, 3], table[:, 4:])
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=2)
+def get_aging_engine(df):
+    """Build (once per dataset version) and share the aging engine (SqlAging in SQLite storage mode)."""
+    if use_sql():
+        return SqlAging(get_sql_store(df))
+    return AgingEngine(df)
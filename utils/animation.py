@@ -0,0 +1,105 @@
+"""
+Adaptive animation frame scheduler.
+Each animated frame reports its render time. From the recent frame cost of
+every session currently animating, the scheduler picks the frame interval
+and step (days per frame) that stay closest to the target pace without the
+animations together using more than CPU_BUDGET of the server.
+"""
+
+import statistics
+import threading
+import time
+from collections import deque
+import streamlit as st
+
+
+# Target pace: one day per TARGET_INTERVAL seconds
+TARGET_INTERVAL = 0.5
+# Days per frame, tried in order when frames cannot keep up
+STEP_DAYS = [1, 2, 7]
+# Render seconds per second all animations may use together. Script runs
+# share one process (and its GIL), so this is a fraction of one core.
+CPU_BUDGET = 0.6
+# Largest share of its own interval one session may spend rendering
+MAX_BUSY = 0.8
+# Frame cost is the median of the last FRAME_WINDOW frames, so one slow frame
+# (cold cache, garbage collection) does not change the plan; no plan changes
+# before MIN_FRAMES frames were measured
+FRAME_WINDOW = 5
+MIN_FRAMES = 3
+# A session with no frame for this long no longer counts as animating
+ACTIVE_SECONDS = 10.0
+# Relative interval change that re-registers the frame timer (needs a full rerun)
+RESCHEDULE_RATIO = 0.25
+
+
+def plan_frames(frame_cost, load_cost):
+    """
+    Interval and step for a session whose frames cost `frame_cost` seconds,
+    when all animating sessions together cost `load_cost` seconds per round
+    of frames. Keeps the target pace (bigger steps at longer intervals) while
+    it can, then slows down.
+    """
+    required = max(load_cost / CPU_BUDGET, frame_cost / MAX_BUSY)
+    for step in STEP_DAYS:
+        if step * TARGET_INTERVAL >= required:
+            return step * TARGET_INTERVAL, step
+    return required, STEP_DAYS[-1]
+
+
+class FrameScheduler:
+    """Recent frame costs of every animating session, shared by all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session key -> (time of last frame, recent frame costs)
+
+    def record(self, session, cost):
+        """Record one rendered frame and return the session's plan (see plan_frames)."""
+        now = time.monotonic()
+        with self._lock:
+            _, costs = self._sessions.get(session, (now, deque(maxlen=FRAME_WINDOW)))
+            costs.append(cost)
+            self._sessions[session] = (now, costs)
+            self._sessions = {
+                key: value for key, value in self._sessions.items()
+                if now - value[0] <= ACTIVE_SECONDS
+            }
+            frame_cost = statistics.median(costs)
+            load_cost = sum(statistics.median(value[1]) for value in self._sessions.values())
+            sessions = len(self._sessions)
+            measured = len(costs)
+        if measured < MIN_FRAMES:
+            interval, step = TARGET_INTERVAL, 1
+        else:
+            interval, step = plan_frames(frame_cost, load_cost)
+        return {
+            "interval": interval,
+            "step": step,
+            "frame_cost": frame_cost,
+            "load_cost": load_cost,
+            "sessions": sessions,
+            "cpu_use": load_cost / interval / CPU_BUDGET,
+        }
+
+    def forget(self, session):
+        """Stop counting a session (its animation stopped)."""
+        with self._lock:
+            self._sessions.pop(session, None)
+
+
+@st.cache_resource
+def get_frame_scheduler():
+    """The process-wide frame scheduler."""
+    return FrameScheduler()
+
+
+def render_scheduler_panel(plan):
+    """Debug panel with the scheduler's last decision for this session."""
+    with st.expander("🛠 Animation scheduler"):
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Interval", f"{plan['interval']:.2f} s")
+        col2.metric("Step", f"{plan['step']} d")
+        col3.metric("Frame cost", f"{plan['frame_cost'] * 1000:.0f} ms")
+        col4.metric("Animating sessions", plan["sessions"])
+        col5.metric("CPU budget used", f"{plan['cpu_use']:.0%}")
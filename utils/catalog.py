@@ -0,0 +1,69 @@
+"""
+Dimension catalogs for filter widgets.
+The values of each categorical column, with their counts, sort orders and
+display labels in both languages, are built once per dataset version, so
+rendering the sidebar and filter widgets never scans the DataFrame (in
+SQLite storage mode, from one GROUP BY per column).
+"""
+
+import streamlit as st
+import pandas as pd
+from utils.data import base_key
+from utils.sqlstore import use_sql, get_sql_store
+from utils.i18n import t, get_lang
+
+
+DIMENSIONS = ["person_type", "nationality", "service_provider"]
+# Dimensions whose values are i18n keys
+TRANSLATED = {"person_type"}
+LANGS = ["ar", "en"]
+
+
+class Dimension:
+    """Values of one column: first-seen, sorted and by-count orders, counts and labels."""
+
+    def __init__(self, name, values, counts):
+        """`values` in order of first appearance, `counts` as value_counts (most frequent first)."""
+        self.name = name
+        self.values = list(values)
+        self.sorted_values = sorted(self.values)
+        self.by_count = counts.index.tolist()  # most frequent first
+        self.counts = counts.to_dict()
+        self._labels = {
+            lang: {v: t(v, lang) if name in TRANSLATED else v for v in self.values}
+            for lang in LANGS
+        }
+
+    def top(self, n):
+        """The `n` most frequent values."""
+        return self.by_count[:n]
+
+    def labels(self, lang=None):
+        """value → display label in `lang` (default: the session language)."""
+        return self._labels[lang or get_lang()]
+
+    def label(self, value, lang=None):
+        return self.labels(lang).get(value, value)
+
+
+class DimensionCatalog:
+    """Dimension per categorical column of one dataset version."""
+
+    def __init__(self, df, version):
+        self.version = version
+        self.dimensions = {}
+        for name in DIMENSIONS:
+            if use_sql():
+                values, counts = get_sql_store(df).dimension(name)
+            else:
+                values, counts = df[name].dropna().unique().tolist(), df[name].value_counts(dropna=True)
+            self.dimensions[name] = Dimension(name, values, counts)
+
+    def __getitem__(self, name):
+        return self.dimensions[name]
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_catalog(df):
+    """Build (once per dataset file, shared by its live versions) and share the dimension catalog."""
+    return DimensionCatalog(df, base_key(df))
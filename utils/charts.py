@@ -8,6 +8,8 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 from utils.i18n import t, get_lang
+from utils.profiling import timed
+from utils.metrics import record_counts
 
 # ── Color Palette ──────────────────────────────────────────────────────────
 NUSUK_COLORS = {
@@ -53,6 +55,7 @@ def _chart_layout(fig, title="", rtl=False):
     return fig
 
 
+@timed("chart.arrival_trend_chart")
 def arrival_trend_chart(daily_arrivals, title=None):
     """Line chart showing daily and cumulative arrivals."""
     if daily_arrivals.empty:
@@ -90,6 +93,7 @@ def arrival_trend_chart(daily_arrivals, title=None):
     return _chart_layout(fig, title or t("total_arrivals"))
 
 
+@timed("chart.pipeline_funnel_chart")
 def pipeline_funnel_chart(metrics, title=None):
     """Funnel chart showing card pipeline stages."""
     lang = get_lang()
@@ -115,13 +119,10 @@ def pipeline_funnel_chart(metrics, title=None):
     return _chart_layout(fig, title or t("page_card_pipeline"))
 
 
-def nationality_bar_chart(df, as_of_date, top_n=10, title=None):
-    """Horizontal bar chart of top nationalities."""
-    as_of = pd.Timestamp(as_of_date)
-    visa_mask = df["visa_issue_date"] <= as_of
-    filtered = df[visa_mask]
-
-    nat_counts = filtered["nationality"].value_counts().head(top_n)
+@timed("chart.nationality_bar_chart")
+def nationality_bar_chart(df, as_of_date, top_n=10, title=None, filters=None):
+    """Horizontal bar chart of top nationalities (of the records matching `filters`, as record_counts)."""
+    nat_counts = record_counts(df, "nationality", as_of_date, filters, limit=top_n)
 
     fig = go.Figure(go.Bar(
         y=nat_counts.index,
@@ -137,6 +138,7 @@ def nationality_bar_chart(df, as_of_date, top_n=10, title=None):
     return _chart_layout(fig, title or t("arrival_by_nationality"))
 
 
+@timed("chart.health_timeline_chart")
 def health_timeline_chart(daily_health, title=None):
     """Bar chart showing daily health incidents."""
     if daily_health.empty:
@@ -152,19 +154,15 @@ def health_timeline_chart(daily_health, title=None):
     return _chart_layout(fig, title or t("health_timeline"))
 
 
+@timed("chart.severity_pie_chart")
 def severity_pie_chart(df, as_of_date, title=None):
-    """Pie chart of health severity distribution."""
-    as_of = pd.Timestamp(as_of_date)
-    health_mask = (
-        (df["health_status"] != "none") &
-        (df["health_date"] <= as_of)
-    )
-    health_df = df[health_mask]
+    """Pie chart of health severity distribution (counts from the health cube)."""
+    from utils.health import get_health_cube
+    counts = get_health_cube(df).incidents(as_of_date)["by_severity"]
 
-    if health_df.empty:
+    if counts.empty:
         return go.Figure()
 
-    counts = health_df["health_status"].value_counts()
     labels = [t(s) for s in counts.index]
 
     fig = go.Figure(go.Pie(
@@ -178,22 +176,20 @@ def severity_pie_chart(df, as_of_date, title=None):
     return _chart_layout(fig, title or t("severity_distribution"))
 
 
+@timed("chart.age_sex_pyramid")
 def age_sex_pyramid(df, as_of_date, title=None):
     """Population pyramid by age and sex."""
-    as_of = pd.Timestamp(as_of_date)
-    visa_mask = df["visa_issue_date"] <= as_of
-    filtered = df[visa_mask]
+    counts = record_counts(df, ["sex", "age"], as_of_date).reset_index()
 
-    if filtered.empty:
+    if counts.empty:
         return go.Figure()
 
     bins = list(range(15, 95, 5))
     labels = [f"{b}-{b+4}" for b in bins[:-1]]
-    filtered = filtered.copy()
-    filtered["age_group"] = pd.cut(filtered["age"], bins=bins, labels=labels, right=False)
+    counts["age_group"] = pd.cut(counts["age"], bins=bins, labels=labels, right=False)
 
-    male = filtered[filtered["sex"] == "M"]["age_group"].value_counts().sort_index()
-    female = filtered[filtered["sex"] == "F"]["age_group"].value_counts().sort_index()
+    male = counts[counts["sex"] == "M"].groupby("age_group", observed=False)["count"].sum()
+    female = counts[counts["sex"] == "F"].groupby("age_group", observed=False)["count"].sum()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -221,16 +217,12 @@ def age_sex_pyramid(df, as_of_date, title=None):
     return _chart_layout(fig, title or t("age_pyramid"))
 
 
+@timed("chart.world_map_chart")
 def world_map_chart(df, as_of_date, title=None):
     """Choropleth map of pilgrim origins."""
-    as_of = pd.Timestamp(as_of_date)
-    ext_mask = (
-        (df["person_type"] == "pilgrim_external") &
-        (df["visa_issue_date"] <= as_of)
-    )
-    ext_df = df[ext_mask]
+    ext_counts = record_counts(df, "nationality", as_of_date, {"person_type": ["pilgrim_external"]})
 
-    if ext_df.empty:
+    if ext_counts.empty:
         return go.Figure()
 
     # Country name to ISO-3 mapping (simplified)
@@ -249,7 +241,7 @@ def world_map_chart(df, as_of_date, title=None):
         "Saudi Arabia": "SAU",
     }
 
-    nat_counts = ext_df["nationality"].value_counts().reset_index()
+    nat_counts = ext_counts.reset_index()
     nat_counts.columns = ["country", "count"]
     nat_counts["iso"] = nat_counts["country"].map(country_iso)
     nat_counts = nat_counts.dropna(subset=["iso"])
@@ -278,6 +270,7 @@ def world_map_chart(df, as_of_date, title=None):
     return _chart_layout(fig, title or t("world_map"))
 
 
+@timed("chart.provider_comparison_chart")
 def provider_comparison_chart(provider_df, title=None):
     """Bar chart comparing provider performance."""
     if provider_df.empty:
@@ -304,20 +297,16 @@ def provider_comparison_chart(provider_df, title=None):
     return _chart_layout(fig, title or t("provider_performance"))
 
 
+@timed("chart.b2b_b2c_nationality_chart")
 def b2b_b2c_nationality_chart(df, as_of_date, title=None):
     """Stacked bar chart of B2B/B2C by top nationalities."""
-    as_of = pd.Timestamp(as_of_date)
-    visa_mask = df["visa_issue_date"] <= as_of
-    filtered = df[visa_mask]
+    top_nats = record_counts(df, "nationality", as_of_date, limit=10).index
 
-    if filtered.empty:
+    if top_nats.empty:
         return go.Figure()
 
-    top_nats = filtered["nationality"].value_counts().head(10).index
-    subset = filtered[filtered["nationality"].isin(top_nats)]
-
-    cross = pd.crosstab(subset["nationality"], subset["b2b_b2c"])
-    cross = cross.loc[top_nats]
+    cross = record_counts(df, ["nationality", "b2b_b2c"], as_of_date, {"nationality": top_nats.tolist()})
+    cross = cross.unstack(fill_value=0).loc[top_nats]
 
     fig = go.Figure()
     if "B2B" in cross.columns:
@@ -0,0 +1,145 @@
+"""
+Packed core store: the in-memory representation of the lifecycle columns.
+In memory storage mode (NUSUK_STORAGE=memory, the default) the loaded
+frame is packed (read_core_dataset): its 12 date columns and the 8 status
+flags derived from them are dropped, and live only in the int16 N x 12 day
+matrix of utils.stages. Flags are derived from their dates when asked for,
+and page rows, exports, reports, aging and health read dates and flags back
+from the matrix. Alongside it the store keeps int16 codes of the dimension
+columns. Metric counts over all date columns are one pass over the matrix
+rows, at day resolution (every date in the data is at midnight).
+NUSUK_STORAGE=frame keeps the wide frame and the pandas passes.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import STORAGE, DATA_DIR, read_dataset, base_key, frame_key
+from utils.stages import get_stage_days, pack_frame, day_offset, DAY_ZERO, NEVER, FLAG_DATES
+from utils.sharded import DATE_COUNTS, CODE_COLUMNS
+
+
+def use_core():
+    return STORAGE == "memory"
+
+
+def read_core_dataset(data_dir=DATA_DIR):
+    """The dataset as memory storage mode holds it: packed, its dates and flags in the day matrix."""
+    return pack_frame(read_dataset(data_dir))
+
+
+class CoreStore:
+    """Day matrix plus dimension codes of one dataset version."""
+
+    def __init__(self, df):
+        self.n = len(df)
+        self.days = get_stage_days(df)
+        self.codes, self.categories = get_dimension_codes(df)
+        # Matrix columns counted by compute_metrics, in DATE_COUNTS order, then health and death
+        self._count_cols = [self.days.columns[col] for col in DATE_COUNTS.values()]
+        self._count_cols += [self.days.columns["health_date"], self.days.columns["death_date"]]
+
+    @property
+    def nbytes(self):
+        return self.days.matrix.nbytes + sum(codes.nbytes for codes in self.codes.values())
+
+    def flag(self, name, as_of_date=None):
+        """A status flag (see FLAG_DATES) per record: its date is set, or has passed on as_of_date."""
+        days = self.days[FLAG_DATES[name]]
+        return days <= day_offset(as_of_date) if as_of_date is not None else days != NEVER
+
+    def _persons(self, filters):
+        """Boolean mask of the records matching {dimension column: values}, or None for all."""
+        mask = None
+        for col, values in filters.items():
+            index = {v: i for i, v in enumerate(self.categories[col])}
+            keep = np.zeros(len(self.categories[col]) + 1, dtype=bool)  # last slot: missing (-1)
+            keep[[index[v] for v in values if v in index]] = True
+            selected = keep[self.codes[col]]
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    @staticmethod
+    def _daily(days, name):
+        if len(days) == 0:
+            return pd.Series([], index=pd.Index([], dtype=object, name=name), name="count", dtype=np.int64)
+        first = int(days.min())
+        histogram = np.bincount(days.astype(np.int64) - first)
+        present = np.flatnonzero(histogram)
+        index = pd.Index([(DAY_ZERO + pd.Timedelta(days=int(d) + first)).date() for d in present],
+                         dtype=object, name=name)
+        return pd.Series(histogram[present].astype(np.int64), index=index, name="count")
+
+    def metrics(self, as_of_date, person_type_filter=None, nationality_filter=None,
+                provider_filter=None, b2b_b2c_filter=None):
+        """(counts, daily_arrivals, daily_health) of the filtered records, as compute_metrics sees them."""
+        filters = {name: values for name, values in (
+            ("b2b_b2c", [b2b_b2c_filter] if b2b_b2c_filter else None),
+            ("person_type", person_type_filter),
+            ("nationality", nationality_filter),
+            ("service_provider", provider_filter)) if values}
+        persons = self._persons(filters)
+        d = day_offset(as_of_date)
+        matrix = self.days.matrix if persons is None else self.days.matrix[persons]
+
+        # Health and death dates are only recorded for incidents and deaths
+        reached = (matrix <= d).sum(axis=0)[self._count_cols]
+        keys = list(DATE_COUNTS) + ["health_incidents", "deaths"]
+        # Same scalar types as the pandas pass: numpy sums, and len() for the row count
+        counts = {"total_records": len(matrix)}
+        counts.update({key: np.int64(count) for key, count in zip(keys, reached)})
+
+        arrivals = matrix[:, self.days.columns["arrival_date"]]
+        health = matrix[:, self.days.columns["health_date"]]
+        return (counts,
+                self._daily(arrivals[arrivals <= d], "arrival_date"),
+                self._daily(health[health <= d], "health_date"))
+
+    def provider_totals(self, as_of_date):
+        """{provider: per-provider totals} (as ShardedColumns.provider_totals), in first-appearance order."""
+        d = day_offset(as_of_date)
+        codes = self.codes["service_provider"]
+        providers = len(self.categories["service_provider"])
+        assigned = codes >= 0
+
+        def per_provider(mask, weights=None):
+            mask = assigned & mask
+            return np.bincount(codes[mask], weights=None if weights is None else weights[mask],
+                               minlength=providers)
+
+        at_provider = self.days["card_at_provider_date"]
+        received = self.days["card_received_date"]
+        both = (at_provider != NEVER) & (received != NEVER)
+        totals = {
+            "pilgrims_assigned": per_provider(assigned),
+            "cards_at_provider": per_provider(at_provider <= d),
+            "cards_received": per_provider(received <= d),
+            "cards_activated": per_provider(self.days["card_activation_date"] <= d),
+            "health_incidents": per_provider(self.days["health_date"] <= d),
+            "delivery_days": per_provider(both, (received.astype(np.float64) - at_provider)),
+            "delivered": per_provider(both),
+        }
+        return {provider: {key: values[i] for key, values in totals.items()}
+                for i, provider in enumerate(self.categories["service_provider"])}
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_dimension_codes(df):
+    """
+    ({column: codes}, {column: categories}) of the dimension columns, built
+    once per dataset file: live events never change them.
+    """
+    codes, categories = {}, {}
+    for col in CODE_COLUMNS:
+        col_codes, uniques = pd.factorize(df[col])  # first-appearance order, NaN -> -1
+        col_codes = col_codes.astype(np.int16 if len(uniques) < np.iinfo(np.int16).max else np.int32)
+        col_codes.flags.writeable = False
+        codes[col] = col_codes
+        categories[col] = list(uniques)
+    return codes, categories
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=2)
+def get_core_store(df):
+    """Build (once per dataset version) and share the core store."""
+    return CoreStore(df)
@@ -0,0 +1,105 @@
+"""
+Dataset loading, shared by the app and offline tools.
+Has no Streamlit dependency so it can run outside a script run.
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import pandas as pd
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+# Where metrics are computed from: memory (packed core arrays, utils/core.py),
+# frame (pandas passes over the DataFrame), sqlite (utils/sqlstore.py) or
+# events (utils/lifecycle.py)
+STORAGE = os.environ.get("NUSUK_STORAGE", "memory")
+
+DATE_COLS = [
+    "visa_issue_date", "group_formation_date", "travel_date", "arrival_date",
+    "card_printed_date", "card_at_center_date", "card_at_provider_date",
+    "card_received_date", "card_activation_date", "proof_picture_date",
+    "health_date", "death_date",
+]
+BOOL_COLS = [
+    "arrival_status", "card_printed", "card_at_center", "card_at_provider",
+    "card_received", "card_activated", "proof_picture_received", "death_status",
+]
+# String columns used by search
+STR_COLS = ["id_number", "passport_number", "nusuk_number", "first_name", "last_name"]
+
+
+def dataset_path(data_dir=DATA_DIR):
+    """Path of the dataset file, generating the data first if none exists."""
+    gz_path = os.path.join(data_dir, "hajj_data.csv.gz")
+    csv_path = os.path.join(data_dir, "hajj_data.csv")
+    if os.path.exists(gz_path):
+        return gz_path
+    if not os.path.exists(csv_path):
+        gen_script = os.path.join(data_dir, "generate_data.py")
+        subprocess.run([sys.executable, gen_script], check=True)
+    return csv_path
+
+
+def read_dataset(data_dir=DATA_DIR):
+    """Read and type the dataset. The result carries its data version in `df.attrs`."""
+    path = dataset_path(data_dir)
+    compression = "gzip" if path.endswith(".gz") else None
+    df = type_columns(pd.read_csv(path, compression=compression, low_memory=False))
+    df.attrs["source"] = path
+    df.attrs["data_version"] = _file_version(path)
+    return df
+
+
+def read_dataset_chunks(path, chunk_rows):
+    """Typed DataFrames of `chunk_rows` records each, for imports that never hold the whole file."""
+    compression = "gzip" if path.endswith(".gz") else None
+    for chunk in pd.read_csv(path, compression=compression, low_memory=False, chunksize=chunk_rows):
+        yield type_columns(chunk)
+
+
+def type_columns(df):
+    """Parse dates and normalise flags and search strings, in place (returns df)."""
+    for col in DATE_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in BOOL_COLS:
+        if col in df.columns:
+            df[col] = df[col].fillna(False).astype(bool)
+    for col in STR_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).replace("nan", "")
+    return df
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    token = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(token.encode("utf-8")).hexdigest()[:12]
+
+
+def data_version(df):
+    """Identifier of the data a DataFrame was loaded from (changes when the file does)."""
+    return df.attrs.get("data_version", "")
+
+
+def frame_key(df):
+    """
+    Cache key of a DataFrame: its data version, so every frame of one version
+    shares cached results and a new version never reuses an old one's (as a
+    recycled id() could). Frames without a version fall back to their id.
+    Only for whole datasets: frames derived from one keep its attrs.
+    """
+    return data_version(df) or id(df)
+
+
+def base_key(df):
+    """
+    Cache key of resources built only from columns the live event feed
+    (utils/ingest.py) never changes: identifiers, names, family links,
+    groups and dimensions. Live versions of a dataset keep the key of the
+    file they were derived from, so those resources carry forward instead
+    of being rebuilt for every batch of events.
+    """
+    return df.attrs.get("base_version") or frame_key(df)
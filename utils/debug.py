@@ -0,0 +1,11 @@
+"""
+Developer diagnostics.
+Debug panels are hidden unless the app is opened with ?debug=1.
+"""
+
+import streamlit as st
+
+
+def debug_enabled():
+    """Whether this session asked for the debug panels (?debug=1 in the URL)."""
+    return st.query_params.get("debug") == "1"
@@ -0,0 +1,180 @@
+"""
+On-demand, chunked data exports.
+Files are only built when the user asks for them, written a fixed number of
+rows at a time into spooled temp files (small exports stay in memory, large
+ones roll over to disk), and served through a deferred download button.
+In SQLite storage mode the dataset's rows stream from a database cursor.
+"""
+
+import codecs
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.i18n import t
+from utils.query import gather_rows
+from utils.sqlstore import is_stored, get_sql_store
+
+EXPORT_CHUNK_ROWS = 20_000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "nusuk_exports")
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Excel's hard sheet limit (including the header row)
+EXCEL_MAX_ROWS = 1_048_576
+
+CSV_MIME = "text/csv"
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _row_total(df, positions):
+    if positions is not None:
+        return len(positions)
+    return get_sql_store(df).n if is_stored(df) else len(df)
+
+
+def iter_chunks(df, positions=None, columns=None, chunk_rows=EXPORT_CHUNK_ROWS, as_of_date=None):
+    """
+    Yield (chunk, rows_done, rows_total) over `df`, or over the rows at
+    `positions`, restricted to `columns`. Only one chunk is alive at a time.
+    With `as_of_date`, status flag columns hold their value on that date.
+    """
+    columns = list(columns) if columns is not None else list(df.columns)
+    total = _row_total(df, positions)
+    if is_stored(df):
+        done = 0
+        for chunk in get_sql_store(df).iter_rows(positions, columns, chunk_rows, as_of_date):
+            done += len(chunk)
+            yield chunk, done, total
+        return
+    for start in range(0, total, chunk_rows):
+        stop = min(start + chunk_rows, total)
+        if positions is not None:
+            chunk = gather_rows(df, positions[start:stop], columns, as_of_date=as_of_date)
+        elif as_of_date is None and all(col in df.columns for col in columns):
+            chunk = df.iloc[start:stop][columns]
+        else:
+            # Flags on a date, or dates and flags a packed frame keeps in its day matrix
+            chunk = gather_rows(df, np.arange(start, stop), columns, as_of_date=as_of_date)
+        yield chunk, stop, total
+
+
+def write_csv(file, df, positions=None, columns=None, progress=None,
+              chunk_rows=EXPORT_CHUNK_ROWS, as_of_date=None):
+    """Stream rows as UTF-8 CSV (with BOM, so Excel detects Arabic text) into a binary file."""
+    columns = list(columns) if columns is not None else list(df.columns)
+    file.write(codecs.BOM_UTF8)
+    file.write(pd.DataFrame(columns=columns).to_csv(index=False).encode("utf-8"))
+    for chunk, done, total in iter_chunks(df, positions, columns, chunk_rows, as_of_date):
+        file.write(chunk.to_csv(index=False, header=False).encode("utf-8"))
+        if progress:
+            progress(done / total)
+
+
+def new_export_file():
+    """Spooled temp file for one export (rolls over to EXPORT_DIR when large)."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir=EXPORT_DIR)
+
+
+def export_csv(df, positions=None, columns=None, progress=None, as_of_date=None):
+    """Write a CSV export into a new spooled file and return it."""
+    f = new_export_file()
+    write_csv(f, df, positions, columns, progress, as_of_date=as_of_date)
+    return f
+
+
+def _excel_rows(chunk):
+    """Plain Python row tuples for openpyxl (NaN/NaT → empty cell)."""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def write_excel(file, sheets, progress=None, chunk_rows=EXPORT_CHUNK_ROWS, as_of_date=None):
+    """
+    Stream one or more sheets into an .xlsx file with an openpyxl write-only
+    workbook (rows are written straight out, no cell objects are kept).
+    `sheets` is a list of (sheet_name, df, positions, columns); `positions`
+    and `columns` may be None. Sheets longer than Excel's row limit
+    continue on "<name> (2)", "<name> (3)", ... `as_of_date` applies to
+    status flag columns as in iter_chunks.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    grand_total = sum(_row_total(df, pos) for _, df, pos, _ in sheets)
+    written = 0
+
+    for name, df, positions, columns in sheets:
+        columns = list(columns) if columns is not None else list(df.columns)
+        part = 1
+        ws = wb.create_sheet(name[:31])
+        ws.append(columns)
+        sheet_rows = 1
+        for chunk, _, _ in iter_chunks(df, positions, columns, chunk_rows, as_of_date):
+            for row in _excel_rows(chunk):
+                if sheet_rows >= EXCEL_MAX_ROWS:
+                    part += 1
+                    ws = wb.create_sheet(f"{name[:25]} ({part})")
+                    ws.append(columns)
+                    sheet_rows = 1
+                ws.append(row)
+                sheet_rows += 1
+            written += len(chunk)
+            if progress and grand_total:
+                progress(written / grand_total)
+
+    wb.save(file)
+
+
+def export_excel(sheets, progress=None, as_of_date=None):
+    """Write an .xlsx export into a new spooled file and return it."""
+    f = new_export_file()
+    write_excel(f, sheets, progress, as_of_date=as_of_date)
+    return f
+
+
+def _read_file(f):
+    def read():
+        f.seek(0)
+        return f.read()
+    return read
+
+
+def _discard(f):
+    if f is not None and not f.closed:
+        f.close()
+
+
+def export_widget(label, file_name, mime, key, build, signature=None):
+    """
+    Two-step export control.
+    The first button builds the file on demand via `build(progress)` (which
+    returns a file object), showing a progress bar; a download button then
+    serves that file. The file is only read when the download is clicked.
+    A prepared file is dropped when `signature` (e.g. the active filters) changes.
+    """
+    state_key = f"_export_{key}"
+    prepared = st.session_state.get(state_key)
+    if prepared and prepared["signature"] != signature:
+        _discard(prepared["file"])
+        st.session_state.pop(state_key)
+        prepared = None
+
+    if st.button(label, key=f"{key}_build", use_container_width=True):
+        bar = st.progress(0.0, text=t("preparing_export"))
+        f = build(lambda frac: bar.progress(min(frac, 1.0), text=t("preparing_export")))
+        bar.empty()
+        if prepared:
+            _discard(prepared["file"])
+        f.seek(0, os.SEEK_END)
+        prepared = {"file": f, "size": f.tell(), "signature": signature}
+        st.session_state[state_key] = prepared
+
+    if prepared and not prepared["file"].closed:
+        size_mb = prepared["size"] / (1024 * 1024)
+        st.download_button(
+            f"📥 {t('download')} {file_name} ({size_mb:.1f} MB)",
+            data=_read_file(prepared["file"]), file_name=file_name, mime=mime,
+            key=f"{key}_download", use_container_width=True,
+        )
@@ -0,0 +1,162 @@
+"""
+Family graph index for household-level metrics.
+Spouse and father links become an undirected graph over row positions,
+stored as CSR arrays (indptr / indices) of each record's direct relatives.
+Households are its connected components, labelled by a vectorized
+union-find (hooking every edge to the smaller root, then pointer jumping)
+and stored as a second CSR of household -> member positions. The graph
+only depends on the link columns, which live events never change, so it is
+shared by every live version of a dataset. Per version, per-household
+reduceats over the stage day offsets give the day a household was issued
+and the day every member held a card, so the household metrics for any date
+are binary searches over two sorted arrays. In SQLite storage mode the
+households are labelled at import and both days are indexed columns.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import base_key, frame_key
+from utils.identifiers import get_identifier_index
+from utils.stages import get_stage_days, day_offset, NEVER
+from utils.sqlstore import use_sql, get_sql_store
+
+
+# Link columns that join records into one household
+FAMILY_LINKS = ["spouse_id", "father_id"]
+PILGRIM_TYPES = ["pilgrim_external", "pilgrim_internal"]
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def _csr(groups, n_groups):
+    """(indptr, positions) listing the positions of every group, in position order within a group."""
+    order = np.argsort(groups, kind="stable").astype(np.int32)
+    indptr = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=n_groups), out=indptr[1:])
+    return _readonly(indptr), _readonly(order)
+
+
+def connected_components(n, src, dst):
+    """Component label (smallest member position) of each of n nodes, for the edges src-dst."""
+    parent = np.arange(n, dtype=np.int64)
+    while True:
+        # Hook: both ends of every edge point at the smaller of their roots
+        root = np.minimum(parent[src], parent[dst])
+        before = parent.copy()
+        np.minimum.at(parent, parent[src], root)
+        np.minimum.at(parent, parent[dst], root)
+        # Compress: jump pointers until every node points at a root
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+        if np.array_equal(parent, before):
+            return parent
+
+
+class FamilyGraph:
+    """Direct links and households of one dataset file (row positions)."""
+
+    def __init__(self, df):
+        self.n = len(df)
+        ids = get_identifier_index(df)
+        src, dst = [], []
+        for col in FAMILY_LINKS:
+            linked = df[col].to_numpy(dtype=np.float64)
+            has = np.flatnonzero(~np.isnan(linked))
+            pos = ids.position_of(linked[has].astype(np.int64))
+            src.append(has[pos >= 0])
+            dst.append(pos[pos >= 0].astype(np.int64))  # links to unknown ids are dropped
+        # Spouses link each other: keep every pair once
+        pairs = np.unique(np.sort(np.column_stack([np.concatenate(src), np.concatenate(dst)]), axis=1), axis=0)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        src, dst = pairs[:, 0], pairs[:, 1]
+
+        # ── Direct relatives (both directions of every link) ───────────
+        ends = np.concatenate([src, dst])
+        self.indptr, order = _csr(ends, self.n)
+        self.indices = _readonly(np.concatenate([dst, src])[order].astype(np.int32))
+
+        # ── Households (connected components) ─────────────────────────
+        roots = connected_components(self.n, src, dst)
+        _, household = np.unique(roots, return_inverse=True)
+        self.household = _readonly(household.astype(np.int32))
+        self.n_households = int(household.max()) + 1 if self.n else 0
+        self.member_ptr, self.members = _csr(self.household, self.n_households)
+        self.sizes = _readonly(np.diff(self.member_ptr).astype(np.int32))
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in (self.indptr, self.indices, self.household,
+                                          self.member_ptr, self.members, self.sizes))
+
+    def relatives(self, pos):
+        """Row positions directly linked to the record at `pos`."""
+        return self.indices[self.indptr[pos]:self.indptr[pos + 1]]
+
+    def household_of(self, pos):
+        """Row positions of every member of the household of the record at `pos` (itself included)."""
+        h = self.household[pos]
+        return self.members[self.member_ptr[h]:self.member_ptr[h + 1]]
+
+
+class HouseholdDays:
+    """Sorted issue and completion days of the family households (2+ members) of one dataset version."""
+
+    def __init__(self, graph, days):
+        # A member holds a card from the earlier of receipt and activation
+        holds = np.minimum(days["card_received_date"], days["card_activation_date"])
+        starts = graph.member_ptr[:-1]
+        families = graph.sizes > 1
+        issued = np.minimum.reduceat(days["visa_issue_date"][graph.members], starts)[families] if graph.n else []
+        done = np.maximum.reduceat(holds[graph.members], starts)[families] if graph.n else []
+        self._issued_days = _readonly(np.sort(np.asarray(issued, dtype=np.int16)))
+        self._done_days = _readonly(np.sort(np.asarray(done, dtype=np.int16)))
+
+    def metrics(self, as_of_date):
+        """
+        Family households (2+ linked records) as of as_of_date: "families"
+        with a member's visa issued by then, "complete" where every member
+        held a received or activated card.
+        """
+        d = day_offset(as_of_date)
+        issued = int(np.searchsorted(self._issued_days, d, side="right"))
+        complete = int(np.searchsorted(self._done_days, min(d, NEVER - 1), side="right"))
+        return {
+            "families": issued,
+            "complete": complete,
+            "complete_pct": complete / issued * 100 if issued else 0.0,
+        }
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_family_graph(df):
+    """Build (once per dataset file, shared by its live versions) and share the family graph."""
+    return FamilyGraph(df)
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=2)
+def get_household_days(df):
+    """Build (once per dataset version) and share the household days."""
+    return HouseholdDays(get_family_graph(df), get_stage_days(df))
+
+
+def household_metrics(df, as_of_date):
+    """Family household metrics as of as_of_date (see HouseholdDays.metrics)."""
+    if use_sql():
+        return get_sql_store(df).household_metrics(as_of_date)
+    return get_household_days(df).metrics(as_of_date)
+
+
+def pilgrim_links(df, as_of_date):
+    """(pilgrims issued by as_of_date, those with a spouse, those with a father) on record."""
+    if use_sql():
+        return get_sql_store(df).link_counts(as_of_date, PILGRIM_TYPES)
+    issued = get_stage_days(df)["visa_issue_date"] <= day_offset(as_of_date)
+    pilgrims = df[issued & df["person_type"].isin(PILGRIM_TYPES).to_numpy()]
+    return len(pilgrims), int(pilgrims["spouse_id"].notna().sum()), int(pilgrims["father_id"].notna().sum())
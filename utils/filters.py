@@ -4,9 +4,15 @@ Used across all pages for consistent filtering.
 """
 
 import streamlit as st
+import time
+import uuid
 from datetime import datetime, date, timedelta
 from utils.i18n import t, get_lang
-import time
+from utils.prefetch import get_prefetcher, PREFETCH_FRAMES
+from utils.animation import get_frame_scheduler, render_scheduler_panel, TARGET_INTERVAL, RESCHEDULE_RATIO
+from utils.debug import debug_enabled
+from utils.catalog import get_catalog
+from utils.profiling import profiled_run, span
 
 
 # Season phase presets
@@ -27,13 +33,15 @@ SEASON_END = date(2025, 6, 30)
 def render_sidebar(df):
     """Render the shared sidebar with all filter controls."""
 
-    # Advance animation BEFORE any widget reads the state
-    if st.session_state.get("playing", False):
-        current = st.session_state.get("date_slider", SEASON_START)
-        if current < SEASON_END:
-            st.session_state["date_slider"] = current + timedelta(days=1)
-        else:
-            st.session_state["playing"] = False
+    # Bring the slider to the animation date BEFORE the widget reads the state
+    anim_date = st.session_state.get("anim_date")
+    if anim_date is not None:
+        st.session_state["date_slider"] = anim_date
+        if not st.session_state.get("playing", False):
+            del st.session_state["anim_date"]
+    st.session_state["_full_run"] = True
+    # Filters may have changed: prefetch again from the current frame
+    get_prefetcher().cancel(session_key())
 
     with st.sidebar:
         # ── Nusuk Logo / Branding ──────────────────────────────────────
@@ -103,14 +111,21 @@ def render_sidebar(df):
 
         if play_btn:
             st.session_state["playing"] = True
+            st.session_state["anim_date"] = selected_date
+            # Start at the target pace; the scheduler adapts from the first frames
+            for key in ("anim_interval", "anim_step", "anim_plan"):
+                st.session_state.pop(key, None)
         if stop_btn:
-            st.session_state["playing"] = False
+            _stop_animation()
+            st.session_state.pop("anim_date", None)
 
         st.divider()
 
         # ── Person Type Filter ─────────────────────────────────────────
-        person_types = df["person_type"].unique().tolist()
-        person_type_labels = {pt: t(pt) for pt in person_types}
+        # Options come from the dimension catalog; the sidebar never scans df
+        catalog = get_catalog(df)
+        person_types = catalog["person_type"].values
+        person_type_labels = catalog["person_type"].labels(lang)
 
         selected_types = st.multiselect(
             t("person_type_filter"),
@@ -121,21 +136,18 @@ def render_sidebar(df):
         )
 
         # ── Nationality Filter ─────────────────────────────────────────
-        top_nationalities = df["nationality"].value_counts().head(15).index.tolist()
-
         selected_nationalities = st.multiselect(
             t("nationality_filter"),
-            options=top_nationalities,
+            options=catalog["nationality"].top(15),
             default=[],
             key="nationality_filter",
             placeholder=t("all")
         )
 
         # ── Provider Filter ────────────────────────────────────────────
-        providers = sorted(df["service_provider"].dropna().unique().tolist())
         selected_providers = st.multiselect(
             t("provider_filter"),
-            options=providers,
+            options=catalog["service_provider"].sorted_values,
             default=[],
             key="provider_filter",
             placeholder=t("all")
@@ -154,10 +166,90 @@ def render_sidebar(df):
     }
 
 
-def animate_slider():
-    """Trigger a rerun to keep the animation going.
-    Uses 2.0s sleep to reduce memory pressure on Streamlit Cloud.
+def live_section(render, prefetch=None):
     """
-    if st.session_state.get("playing", False):
-        time.sleep(2.0)
+    Run `render(as_of_date)` as a fragment. While the animation plays, the
+    fragment reruns on its own timer with the next date, so app.py (CSS,
+    sidebar, navigation) and the page's static parts are not rerun. The timer
+    interval and days per frame come from the frame scheduler (utils.animation).
+    `prefetch(as_of_date)` runs the cached computations of one frame; it is
+    called ahead on a worker thread for the next PREFETCH_FRAMES frames.
+    """
+    playing = st.session_state.get("playing", False)
+    interval = st.session_state.get("anim_interval", TARGET_INTERVAL)
+
+    @st.fragment(run_every=interval if playing else None)
+    def _live():
+        # Full runs render the current date; reruns of the fragment alone (the
+        # animation timer) advance it, and are profiled as runs of their own
+        fragment_run = not st.session_state.pop("_full_run", False)
+        if not fragment_run:
+            _render_frame(render, prefetch, interval, fragment_run)
+            return
+        with profiled_run("fragment", st.session_state.get("page_title")):
+            _render_frame(render, prefetch, interval, fragment_run)
+
+    _live()
+
+
+def _render_frame(render, prefetch, interval, fragment_run):
+    if not st.session_state.get("playing", False):
+        with span("render"):
+            render(st.session_state.get("filters", {}).get("as_of_date"))
+        return
+
+    if fragment_run:
+        _advance_animation()
+    as_of_date = st.session_state["anim_date"]
+    st.caption(f"▶ {t('date_slider')}: {as_of_date}")
+    if prefetch is not None:
+        _prefetch_frames(prefetch, as_of_date)
+
+    # CPU time of this thread, so waiting on the prefetch worker (GIL) is not counted
+    started = time.thread_time()
+    with span("render"):
+        render(as_of_date)
+    # Full-run frames also pay for the app script; only fragment reruns are measured
+    if fragment_run:
+        _schedule_frames(time.thread_time() - started, interval)
+    if debug_enabled() and "anim_plan" in st.session_state:
+        render_scheduler_panel(st.session_state["anim_plan"])
+
+
+def session_key():
+    """Stable id of this session in process-wide registries (scheduler, memory report)."""
+    return st.session_state.setdefault("_session_key", uuid.uuid4().hex)
+
+
+def _advance_animation():
+    anim_date = st.session_state["anim_date"]
+    if anim_date >= SEASON_END:
+        # Last frame shown: stop and rerun the whole app so the slider shows the final date
+        _stop_animation()
         st.rerun()
+    step = st.session_state.get("anim_step", 1)
+    st.session_state["anim_date"] = min(anim_date + timedelta(days=step), SEASON_END)
+
+
+def _stop_animation():
+    st.session_state["playing"] = False
+    get_frame_scheduler().forget(session_key())
+    get_prefetcher().cancel(session_key())
+
+
+def _schedule_frames(frame_cost, interval):
+    """Feed one frame's render time to the scheduler and apply its plan."""
+    plan = get_frame_scheduler().record(session_key(), frame_cost)
+    st.session_state["anim_plan"] = plan
+    st.session_state["anim_step"] = plan["step"]
+    if abs(plan["interval"] - interval) > RESCHEDULE_RATIO * interval:
+        # run_every is fixed when the fragment is registered: rerun the app to change it
+        st.session_state["anim_interval"] = plan["interval"]
+        st.rerun()
+
+
+def _prefetch_frames(prefetch, as_of_date):
+    """Queue the upcoming frames (and drop queued ones the animation has passed)."""
+    step = st.session_state.get("anim_step", 1)
+    frames = {min(as_of_date + timedelta(days=step * k), SEASON_END) for k in range(1, PREFETCH_FRAMES + 1)}
+    get_prefetcher().schedule(session_key(), prefetch, [d for d in frames if d > as_of_date])
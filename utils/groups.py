@@ -0,0 +1,97 @@
+"""
+Group-level pipeline analytics.
+Pilgrim records are sorted by group_id once per dataset version, so every
+group is a contiguous segment of that order and a per-group count, minimum
+or maximum on a date is one reduceat over the segment starts. The
+segments only depend on group_id, which live events never change, so they
+are shared by every live version of a dataset; the stage days are passed
+in per version. Group 0 (workers, government and healthcare staff) is not
+a pilgrim group and is left out. In SQLite storage mode the per-group
+counts are one GROUP BY (utils/sqlstore.py), tabled by group_table.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import base_key
+from utils.stages import day_offset, STAGE_CODE, NEVER
+
+
+# Stages counted per group (members at or past each one)
+GROUP_STAGES = ["issued", "printed", "at_center", "at_provider", "received", "activated"]
+GROUP_COLUMNS = (["group_id", "pilgrims"] + GROUP_STAGES +
+                 ["completion_rate", "arrived", "arrival_spread", "laggards"])
+
+
+def group_table(group_ids, reached, arrived, spread):
+    """
+    Group metrics table from per-group counts: `reached` holds the group
+    sizes, then the members at or past each of GROUP_STAGES; `arrived` the
+    arrivals and `spread` the days from the first to the latest (NaN if none).
+    Laggards are the members behind the group's median stage.
+    """
+    if len(group_ids) == 0:
+        return pd.DataFrame(columns=GROUP_COLUMNS)
+    sizes = reached[:, 0]
+    median = (reached >= (sizes // 2 + 1)[:, None]).sum(axis=1) - 1  # lower median
+    laggards = sizes - reached[np.arange(len(reached)), median]
+
+    table = pd.DataFrame({"group_id": group_ids, "pilgrims": sizes})
+    for i, stage in enumerate(GROUP_STAGES, start=1):
+        table[stage] = reached[:, i]
+    table["completion_rate"] = (table["received"] / table["pilgrims"] * 100).round(1)
+    table["arrived"] = arrived
+    table["arrival_spread"] = spread
+    table["laggards"] = laggards
+    return table[GROUP_COLUMNS]
+
+
+class GroupIndex:
+    """Row positions of one dataset file sorted into group segments."""
+
+    def __init__(self, df):
+        groups = pd.to_numeric(df["group_id"], errors="coerce").to_numpy(dtype=np.float64)
+        pilgrims = np.flatnonzero(groups > 0)
+        self.order = pilgrims[np.argsort(groups[pilgrims], kind="stable")].astype(np.int32)
+        sorted_groups = groups[self.order].astype(np.int64)
+        boundary = np.ones(len(sorted_groups), dtype=bool)
+        boundary[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        self.starts = np.flatnonzero(boundary)
+        self.group_ids = sorted_groups[self.starts]
+        self.sizes = np.diff(np.r_[self.starts, len(self.order)])
+        for arr in (self.order, self.starts, self.group_ids, self.sizes):
+            arr.flags.writeable = False
+
+    def _sum(self, values):
+        return np.add.reduceat(values, self.starts, dtype=np.int64)
+
+    def metrics(self, days, as_of_date):
+        """
+        One row per group on as_of_date, from the StageDays `days` of the
+        dataset version shown: members at or past each of
+        GROUP_STAGES, the share holding a received card, arrivals and their
+        spread (days from the first to the latest arrival), and laggards:
+        members behind the group's median stage.
+        """
+        if len(self.starts) == 0:
+            return pd.DataFrame(columns=GROUP_COLUMNS)
+        d = day_offset(as_of_date)
+        codes = days.stage_codes(d)[self.order]
+        arrivals = days["arrival_date"][self.order]
+
+        # Members at or past every stage code (column 0: everyone)
+        reached = np.column_stack([self.sizes] + [self._sum(codes >= STAGE_CODE[s]) for s in GROUP_STAGES])
+
+        arrived = arrivals <= d
+        n_arrived = self._sum(arrived)
+        first = np.minimum.reduceat(np.where(arrived, arrivals, NEVER), self.starts)
+        last = np.maximum.reduceat(np.where(arrived, arrivals, -NEVER), self.starts)
+
+        spread = np.where(n_arrived > 0, last.astype(np.int64) - first, np.nan)
+        return group_table(self.group_ids, reached, n_arrived, spread)
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_group_index(df):
+    """Build (once per dataset file, shared by its live versions) and share the group index."""
+    return GroupIndex(df)
@@ -0,0 +1,189 @@
+"""
+Precomputed health incidence cube for the Health & Safety page.
+Incidents are counted once per dataset file into a day x severity x
+nationality x age band x person type array, accumulated along the day
+axis, so the counts up to any date are one slice of it whatever the
+dataset size. Deaths get the same treatment per nationality and cause
+(health notes), with running age sums for the average age. Live card
+events never touch these columns, so the cube is shared by every live
+version; only the at-risk count reads their stage days. Dates are
+compared at day resolution, like utils.stages. The cube is built from the
+incident and death records alone (read from the database in SQLite
+storage mode, where the at-risk count is an SQL count).
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import base_key
+from utils.stages import DAY_ZERO, NEVER, day_offset, get_stage_days
+from utils.query import gather_rows
+from utils.sqlstore import use_sql, get_sql_store
+
+
+# Age bands (lower edges, right-open) of the incidents-by-age chart
+AGE_BINS = [0, 30, 40, 50, 60, 65, 70, 75, 80, 100]
+AGE_LABELS = ["<30", "30-39", "40-49", "50-59", "60-64", "65-69", "70-74", "75-79", "80+"]
+# Elderly pilgrims who arrived without an activated card (end-of-season flags)
+AT_RISK_TYPES = ["pilgrim_external", "pilgrim_internal"]
+AT_RISK_AGE = 65
+# Columns the cube is built from
+CUBE_COLS = ["person_type", "nationality", "age", "health_status", "health_date", "health_notes",
+             "death_status", "death_date"]
+
+
+def _codes(values):
+    """(codes, uniques) in first-appearance order, with missing values in the extra last slot."""
+    codes, uniques = pd.factorize(values)
+    codes = np.where(codes < 0, len(uniques), codes)
+    return codes, list(uniques)
+
+
+def _day_offsets(dates):
+    return (dates.dt.normalize() - DAY_ZERO).dt.days.to_numpy(dtype=np.int64)
+
+
+def _first_seen(days, codes, shape):
+    """
+    Row position of the first record of each code among the records up to
+    each day (a days x codes array), so ranked counts
+    break ties the way value_counts does on the rows up to that day.
+    """
+    first = np.full(shape, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, (days, codes), np.arange(len(codes)))
+    return np.minimum.accumulate(first, axis=0)
+
+
+def _ranked(counts, labels, first):
+    """Non-zero counts as a Series, largest first (ties in order of first_seen), like value_counts."""
+    counts = np.asarray(counts[:len(labels)])
+    order = np.lexsort((first[:len(labels)], -counts))
+    order = order[counts[order] > 0]
+    return pd.Series(counts[order].astype(np.int64), index=[labels[i] for i in order], name="count")
+
+
+class HealthCube:
+    """
+    Cumulative incident and death counts of one dataset file, from its
+    records (at least every dated incident and death), and the row
+    positions of its elderly pilgrims in the dataset (for at_risk).
+    """
+
+    def __init__(self, df, elderly=None):
+        ill = ((df["health_status"] != "none") & df["health_date"].notna()).to_numpy()
+        incidents = df[ill]
+        days = _day_offsets(incidents["health_date"])
+        severity, self.severities = _codes(incidents["health_status"])
+        nationality, self.nationalities = _codes(incidents["nationality"])
+        person_type, self.person_types = _codes(incidents["person_type"])
+        age = incidents["age"].to_numpy(dtype=np.float64)
+        band = np.searchsorted(AGE_BINS, age, side="right") - 1
+        band = np.where((age >= AGE_BINS[0]) & (age < AGE_BINS[-1]), band, len(AGE_LABELS))
+
+        self.day0 = int(days.min()) if len(days) else 0
+        shape = (int(days.max()) - self.day0 + 1 if len(days) else 1,
+                 len(self.severities) + 1, len(self.nationalities) + 1,
+                 len(AGE_LABELS) + 1, len(self.person_types) + 1)
+        cube = np.zeros(shape, dtype=np.int32)
+        np.add.at(cube, (days - self.day0, severity, nationality, band, person_type), 1)
+        self.cube = np.cumsum(cube, axis=0, dtype=np.int32)
+        self._first_severity = _first_seen(days - self.day0, severity, shape[:2])
+        self._first_nationality = _first_seen(days - self.day0, nationality, (shape[0], shape[2]))
+
+        # ── Deaths ─────────────────────────────────────────────────────
+        dead = ((df["death_status"] == True) & df["death_date"].notna()).to_numpy()
+        deaths = df[dead]
+        days = _day_offsets(deaths["death_date"])
+        death_nat, self.death_nationalities = _codes(deaths["nationality"])
+        cause, self.causes = _codes(deaths["health_notes"])
+        ages = deaths["age"].to_numpy(dtype=np.float64)
+        self.death_day0 = int(days.min()) if len(days) else 0
+        n_days = int(days.max()) - self.death_day0 + 1 if len(days) else 1
+        by_nat = np.zeros((n_days, len(self.death_nationalities) + 1), dtype=np.int32)
+        by_cause = np.zeros((n_days, len(self.causes) + 1), dtype=np.int32)
+        age_sum = np.zeros(n_days)
+        age_count = np.zeros(n_days, dtype=np.int32)
+        np.add.at(by_nat, (days - self.death_day0, death_nat), 1)
+        np.add.at(by_cause, (days - self.death_day0, cause), 1)
+        known = ~np.isnan(ages)
+        np.add.at(age_sum, days[known] - self.death_day0, ages[known])
+        np.add.at(age_count, days[known] - self.death_day0, 1)
+        self.deaths_by_nationality = np.cumsum(by_nat, axis=0, dtype=np.int32)
+        self.deaths_by_cause = np.cumsum(by_cause, axis=0, dtype=np.int32)
+        self.death_age_sum = np.cumsum(age_sum)
+        self.death_age_count = np.cumsum(age_count)
+        self._first_death_nationality = _first_seen(days - self.death_day0, death_nat, by_nat.shape)
+        self._first_cause = _first_seen(days - self.death_day0, cause, by_cause.shape)
+
+        self._elderly = elderly
+
+    def at_risk(self, days):
+        """
+        Elderly pilgrims who arrived without an activated card, from the
+        stage days of a version (utils.stages). Not date-dependent: the
+        flags are end-of-season values.
+        """
+        arrived = days["arrival_date"][self._elderly] != NEVER
+        activated = days["card_activation_date"][self._elderly] != NEVER
+        return int(np.count_nonzero(arrived & ~activated))
+
+    @staticmethod
+    def _index(d, day0, days):
+        """Row of a cumulative array holding everything up to day offset d (-1: nothing yet)."""
+        return min(d - day0, days - 1)
+
+    def incidents(self, as_of_date, person_types=None):
+        """
+        Incident counts up to as_of_date: {"total", "by_severity",
+        "by_nationality", "by_age"}. Series are ordered like value_counts
+        (by age band: in band order, empty bands included).
+        """
+        i = self._index(day_offset(as_of_date), self.day0, len(self.cube))
+        counts = self.cube[i] if i >= 0 else np.zeros(self.cube.shape[1:], dtype=np.int32)
+        i = max(i, 0)
+        if person_types is not None:
+            keep = [self.person_types.index(p) for p in person_types if p in self.person_types]
+            counts = counts[..., keep]
+        by_age = counts.sum(axis=(0, 1, 3))
+        return {
+            "total": int(counts.sum()),
+            "by_severity": _ranked(counts.sum(axis=(1, 2, 3)), self.severities, self._first_severity[i]),
+            "by_nationality": _ranked(counts.sum(axis=(0, 2, 3)), self.nationalities, self._first_nationality[i]),
+            "by_age": pd.Series(by_age[:len(AGE_LABELS)].astype(np.int64), index=AGE_LABELS, name="count"),
+        }
+
+    def deaths(self, as_of_date):
+        """Deaths up to as_of_date: {"total", "avg_age", "by_nationality", "by_cause"}."""
+        i = self._index(day_offset(as_of_date), self.death_day0, len(self.deaths_by_nationality))
+        if i < 0:
+            none = _ranked(np.zeros(0), [], np.zeros(0))
+            return {"total": 0, "avg_age": float("nan"), "by_nationality": none, "by_cause": none}
+        count = self.death_age_count[i]
+        return {
+            "total": int(self.deaths_by_nationality[i].sum()),
+            "avg_age": self.death_age_sum[i] / count if count else float("nan"),
+            "by_nationality": _ranked(self.deaths_by_nationality[i], self.death_nationalities,
+                                      self._first_death_nationality[i]),
+            "by_cause": _ranked(self.deaths_by_cause[i], self.causes, self._first_cause[i]),
+        }
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_health_cube(df):
+    """Build (once per dataset file, shared by its live versions) and share the health cube."""
+    if use_sql():
+        # Only the incident and death records: the at-risk count is asked of the store
+        return HealthCube(get_sql_store(df).health_records(CUBE_COLS))
+    # Only the incident and death records too, their dates gathered from the day matrix
+    days = get_stage_days(df)
+    ill = (df["health_status"] != "none").to_numpy() & (days["health_date"] != NEVER)
+    records = gather_rows(df, np.flatnonzero(ill | (days["death_date"] != NEVER)), CUBE_COLS)
+    elderly = np.flatnonzero((df["person_type"].isin(AT_RISK_TYPES) & (df["age"] >= AT_RISK_AGE)).to_numpy())
+    return HealthCube(records, elderly)
+
+
+def count_at_risk(df):
+    """Elderly pilgrims who arrived without an activated card (see HealthCube.at_risk)."""
+    if use_sql():
+        return get_sql_store(df).at_risk(AT_RISK_TYPES, AT_RISK_AGE)
+    return get_health_cube(df).at_risk(get_stage_days(df))
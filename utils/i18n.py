@@ -71,6 +71,17 @@ LABELS = {
     "b2b": {"ar": "B2B", "en": "B2B"},
     "b2c": {"ar": "B2C", "en": "B2C"},
     "pilgrim_type": {"ar": "نوع الحاج", "en": "Pilgrim Type"},
+    "card_aging": {"ar": "تقادم البطاقات", "en": "Card Aging"},
+    "sla_settings": {"ar": "حدود مستوى الخدمة (أيام)", "en": "SLA Thresholds (days)"},
+    "stage": {"ar": "المرحلة", "en": "Stage"},
+    "stage_not_issued": {"ar": "لم تصدر التأشيرة", "en": "Visa Not Issued"},
+    "stage_issued": {"ar": "صدرت التأشيرة ولم تطبع البطاقة", "en": "Visa Issued, Card Not Printed"},
+    "stage_awaiting_print": {"ar": "بانتظار الطباعة", "en": "Awaiting Print"},
+    "stage_printed": {"ar": "مطبوعة بانتظار المركز", "en": "Printed, Awaiting Center"},
+    "stage_at_center": {"ar": "بمركز التوزيع", "en": "At Distribution Center"},
+    "stage_at_provider": {"ar": "لدى الشركة", "en": "At Provider"},
+    "stage_received": {"ar": "مستلمة غير مفعلة", "en": "Received, Not Activated"},
+    "stage_activated": {"ar": "مفعلة", "en": "Activated"},
 
     # ── Card Tracking ──────────────────────────────────────────────────
     "search": {"ar": "بحث", "en": "Search"},
@@ -80,6 +91,8 @@ LABELS = {
     "date_range": {"ar": "نطاق التاريخ", "en": "Date Range"},
     "export_csv": {"ar": "تصدير CSV", "en": "Export CSV"},
     "export_excel": {"ar": "تصدير Excel", "en": "Export Excel"},
+    "download": {"ar": "تحميل", "en": "Download"},
+    "preparing_export": {"ar": "جاري تجهيز الملف...", "en": "Preparing file..."},
     "results": {"ar": "النتائج", "en": "Results"},
     "no_results": {"ar": "لا توجد نتائج", "en": "No results found"},
     "showing": {"ar": "عرض", "en": "Showing"},
@@ -149,9 +162,9 @@ def get_lang():
     return st.session_state.get("lang", "ar")
 
 
-def t(key):
-    """Translate a key to the current language."""
-    lang = get_lang()
+def t(key, lang=None):
+    """Translate a key to the current language (or to `lang`, outside a session)."""
+    lang = lang or get_lang()
     if key in LABELS:
         return LABELS[key].get(lang, LABELS[key].get("en", key))
     return key
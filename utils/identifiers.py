@@ -0,0 +1,179 @@
+"""
+Identifier index for exact record lookup.
+Document numbers are packed into int64 codes and kept in sorted arrays,
+so resolving a pilgrim by any identifier is a binary search instead of a scan.
+"""
+
+import re
+import streamlit as st
+import pandas as pd
+import numpy as np
+from utils.data import base_key
+
+
+# Identifier columns that can be searched, in display order
+ID_FIELDS = ["id_number", "nusuk_number", "passport_number", "visa_number"]
+# Letter prefixes of searched document numbers (Nusuk cards: NSK-25-1297468)
+ID_PREFIXES = ("NSK",)
+
+# Packing alphabet: 0 is padding, then digits, then letters (base 37).
+# 12 characters fit in a signed int64 (37**12 < 2**63).
+_PACK_WIDTH = 12
+_PACK_BASE = 37
+_CHAR_CODES = np.zeros(256, dtype=np.int64)
+_CHAR_CODES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(1, 11)
+_CHAR_CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)] = np.arange(11, 37)
+
+
+def pack_identifiers(values):
+    """
+    Pack identifier strings into int64 codes.
+    Case and separators are ignored ("NSK-25-1297468" == "nsk251297468").
+    Missing or blank values pack to 0; values longer than 12 characters
+    keep their last 12 characters.
+    """
+    s = pd.Series(values, dtype="object").astype(str).str.upper()
+    s = s.str.replace(r"[^0-9A-Z]", "", regex=True)
+    s = s.where(~s.isin(["", "NAN", "NONE"]), "")
+    s = s.str[-_PACK_WIDTH:]
+
+    raw = np.array(s.tolist(), dtype=f"S{_PACK_WIDTH}")
+    chars = raw.view(np.uint8).reshape(len(raw), _PACK_WIDTH)
+    digits = _CHAR_CODES[chars]
+
+    codes = np.zeros(len(raw), dtype=np.int64)
+    for i in range(_PACK_WIDTH):
+        codes = codes * _PACK_BASE + digits[:, i]
+    return codes
+
+
+def pack_identifier(value):
+    """Pack a single identifier string (scalar fast path of pack_identifiers)."""
+    s = re.sub(r"[^0-9A-Z]", "", str(value).upper())
+    if s in ("", "NAN", "NONE"):
+        return 0
+    code = 0
+    for ch in s[-_PACK_WIDTH:].ljust(_PACK_WIDTH, "\0"):
+        code = code * _PACK_BASE + int(_CHAR_CODES[ord(ch)])
+    return code
+
+
+def is_identifier_query(query):
+    """
+    Whether free text can be (part of) a document number: it has a digit,
+    or it is letters starting with a known document prefix ("NSK", "nsk-").
+    Other letter-only queries are names.
+    """
+    query = str(query).strip()
+    if any(ch.isdigit() for ch in query):
+        return True
+    letters = query.replace("-", "").upper()
+    return letters.isascii() and letters.isalpha() and letters.startswith(ID_PREFIXES)
+
+
+def _sorted_index(codes):
+    """Return (sorted codes, row positions) for binary-search lookup."""
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    return _readonly(codes[order]), _readonly(order)
+
+
+def _readonly(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+def _range_lookup(sorted_codes, order, code):
+    lo = np.searchsorted(sorted_codes, code, side="left")
+    hi = np.searchsorted(sorted_codes, code, side="right")
+    return order[lo:hi]
+
+
+class IdentifierIndex:
+    """
+    Read-only lookup structure over one loaded DataFrame.
+    All arrays are immutable, so a single instance is shared safely
+    across sessions and threads.
+    """
+
+    def __init__(self, df):
+        self.n = len(df)
+
+        # ── person_id → row position (direct table, O(1)) ──────────────
+        pids = df["person_id"].to_numpy(dtype=np.int64)
+        self.person_ids = _readonly(pids)
+        table_size = int(pids.max()) + 1 if len(pids) else 1
+        pos_by_pid = np.full(table_size, -1, dtype=np.int32)
+        pos_by_pid[pids] = np.arange(len(pids), dtype=np.int32)
+        self._pos_by_pid = _readonly(pos_by_pid)
+
+        # ── Document numbers → row positions (sorted, O(log n)) ────────
+        self._fields = {}
+        for col in ID_FIELDS:
+            if col in df.columns:
+                self._fields[col] = _sorted_index(pack_identifiers(df[col].to_numpy()))
+
+        # ── Family links (stored as row positions, -1 = none) ──────────
+        self._spouse_pos = _readonly(self._link_positions(df, "spouse_id"))
+        self._father_pos = _readonly(self._link_positions(df, "father_id"))
+        has_father = np.flatnonzero(self._father_pos >= 0)
+        child_order = np.argsort(self._father_pos[has_father], kind="stable")
+        self._children_by_father = _readonly(self._father_pos[has_father][child_order])
+        self._children_pos = _readonly(has_father[child_order].astype(np.int32))
+
+    def _link_positions(self, df, col):
+        if col not in df.columns:
+            return np.full(self.n, -1, dtype=np.int32)
+        linked = df[col].to_numpy(dtype=np.float64)
+        out = np.full(self.n, -1, dtype=np.int32)
+        valid = ~np.isnan(linked)
+        out[valid] = self.position_of(linked[valid].astype(np.int64))
+        return out
+
+    def position_of(self, person_id):
+        """Row position(s) for person_id(s); -1 where the id is unknown."""
+        pid = np.asarray(person_id, dtype=np.int64)
+        in_range = (pid >= 0) & (pid < len(self._pos_by_pid))
+        pos = np.where(in_range, self._pos_by_pid[np.where(in_range, pid, 0)], -1)
+        return int(pos) if pos.ndim == 0 else pos
+
+    def find_by(self, field, value):
+        """Row positions whose `field` identifier equals `value`."""
+        code = pack_identifier(value)
+        if code == 0 or field not in self._fields:
+            return np.empty(0, dtype=np.int32)
+        sorted_codes, order = self._fields[field]
+        return _range_lookup(sorted_codes, order, code)
+
+    def find(self, query):
+        """
+        Resolve a person_id or any document number to row positions.
+        Returns a list of (field, position) pairs, person_id first.
+        """
+        query = str(query).strip()
+        matches = []
+        if query.isdigit():
+            pos = self.position_of(int(query))
+            if pos >= 0:
+                matches.append(("person_id", pos))
+        for field in self._fields:
+            for pos in self.find_by(field, query):
+                matches.append((field, int(pos)))
+        return matches
+
+    def related(self, pos):
+        """Row positions of family members linked to the record at `pos`."""
+        spouse = int(self._spouse_pos[pos])
+        father = int(self._father_pos[pos])
+        lo = np.searchsorted(self._children_by_father, pos, side="left")
+        hi = np.searchsorted(self._children_by_father, pos, side="right")
+        return {
+            "spouse": [spouse] if spouse >= 0 else [],
+            "father": [father] if father >= 0 else [],
+            "children": self._children_pos[lo:hi].tolist(),
+        }
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_identifier_index(df):
+    """Build (once per dataset file, shared by its live versions) and share the identifier index."""
+    return IdentifierIndex(df)
@@ -0,0 +1,308 @@
+"""
+Live card events from an append-only log.
+Event files (CSV with a person_id,stage,date header) in NUSUK_EVENTS_DIR
+stand in for the live feed: every file is read from where the last poll
+stopped, and each batch of events is applied to a new version of the
+frame that shares every column the batch did not touch. The cumulative
+per-date counts behind the unfiltered metrics, the stage day matrix and
+(in event storage mode) the event table are patched by the same batch,
+so the headline numbers never rescan the frame; indexes over columns
+events never change (identifiers, names, family links, groups,
+dimensions, the health cube) are carried over to the new version
+(utils.data.base_key); sharded metrics are not used (utils/sharded.py).
+Card events that would put a record's card stages out of order are
+rejected. Off unless NUSUK_EVENTS_DIR is set; not used in SQLite storage
+mode (the database is imported from the dataset file).
+"""
+
+import io
+import os
+import threading
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import data_version
+from utils.i18n import get_lang
+from utils.sharded import DATE_COUNTS
+from utils.lifecycle import use_events, get_event_table, hand_over_event_table
+from utils.sqlstore import use_sql
+from utils.stages import (get_stage_days, hand_over_stage_days, column, day_dates,
+                          DAY_ZERO, STAGE_DATE_COLS)
+
+
+EVENTS_DIR = os.environ.get("NUSUK_EVENTS_DIR", "")
+POLL_SECONDS = 2.0
+EVENT_COLUMNS = ["person_id", "stage", "date"]
+
+# Event stage -> (date column it sets, status flag it raises)
+EVENT_STAGES = {
+    "issued": ("visa_issue_date", None),
+    "group_formed": ("group_formation_date", None),
+    "printed": ("card_printed_date", "card_printed"),
+    "at_center": ("card_at_center_date", "card_at_center"),
+    "at_provider": ("card_at_provider_date", "card_at_provider"),
+    "received": ("card_received_date", "card_received"),
+    "activated": ("card_activation_date", "card_activated"),
+    "proof_picture": ("proof_picture_date", "proof_picture_received"),
+    "arrived": ("arrival_date", "arrival_status"),
+}
+# Card stage dates, which must stay in pipeline order (utils.stages counts them)
+CARD_DATE_COLS = STAGE_DATE_COLS[1:]
+
+
+def live_enabled():
+    return bool(EVENTS_DIR) and not use_sql()
+
+
+# ── Event log ──────────────────────────────────────────────────────────────
+class EventLog:
+    """Reads the complete lines appended to the event files since the last read."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._offsets = {}  # file name -> bytes consumed
+
+    def read(self):
+        """New events as a DataFrame of EVENT_COLUMNS (strings), in file then line order."""
+        if not os.path.isdir(self.directory):
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        parts = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".csv"):
+                continue
+            path = os.path.join(self.directory, name)
+            offset = self._offsets.get(name, 0)
+            size = os.path.getsize(path)
+            if size < offset:
+                offset = 0  # truncated or replaced: read it again (events are idempotent)
+            if size == offset:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            # A line still being written waits for the next read
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                continue
+            self._offsets[name] = offset + end
+            chunk = pd.read_csv(io.BytesIO(data[:end]), header=None, names=EVENT_COLUMNS,
+                                dtype=str, skip_blank_lines=True)
+            parts.append(chunk[chunk["person_id"] != "person_id"])  # header line
+        if not parts:
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        return pd.concat(parts, ignore_index=True)
+
+
+# ── Cumulative counts ──────────────────────────────────────────────────────
+class CumulativeCounts:
+    """
+    Records per date value of every metric date column (unfiltered), so the
+    count on or before a date is a sum over the distinct dates, and moving
+    one record's date is two counter updates.
+    """
+
+    def __init__(self, df):
+        self.total = len(df)
+        self.dates = {col: self._counter(column(df, col)) for col in DATE_COUNTS.values()}
+        ill = (df["health_status"] != "none").to_numpy()
+        self.health = self._counter(column(df, "health_date")[ill])
+        self.deaths = self._counter(column(df, "death_date")[column(df, "death_status").to_numpy()])
+
+    @staticmethod
+    def _counter(dates):
+        values, counts = np.unique(dates.dropna().to_numpy(dtype="datetime64[ns]"), return_counts=True)
+        return Counter(dict(zip(values.astype(np.int64).tolist(), counts.tolist())))
+
+    def move(self, col, old, new):
+        """Move records of `col` from the `old` dates to the `new` ones (int64 ns, NaT for none)."""
+        counter = self.dates.get(col)
+        if counter is None:
+            return
+        nat = np.iinfo(np.int64).min
+        counter.subtract(Counter(v for v in old.tolist() if v != nat))
+        counter.update(Counter(v for v in new.tolist() if v != nat))
+
+    @staticmethod
+    def _through(counter, as_of):
+        return sum(n for when, n in counter.items() if when <= as_of)
+
+    @staticmethod
+    def _daily(counter, as_of, name):
+        per_day = Counter()
+        for when, n in counter.items():
+            if when <= as_of and n:
+                per_day[pd.Timestamp(when).date()] += n
+        days = sorted(d for d, n in per_day.items() if n)
+        return pd.Series([per_day[d] for d in days], index=pd.Index(days, dtype=object, name=name),
+                         name="count", dtype=np.int64)
+
+    def metrics(self, as_of_date):
+        """(counts, daily_arrivals, daily_health) as compute_metrics sees them, unfiltered."""
+        as_of = pd.Timestamp(as_of_date).as_unit("ns").value
+        # Same scalar types as the pandas pass: numpy sums, and len() for the row count
+        counts = {"total_records": self.total}
+        for key, col in DATE_COUNTS.items():
+            counts[key] = np.int64(self._through(self.dates[col], as_of))
+        counts["health_incidents"] = np.int64(self._through(self.health, as_of))
+        counts["deaths"] = np.int64(self._through(self.deaths, as_of))
+        return (counts,
+                self._daily(self.dates["arrival_date"], as_of, "arrival_date"),
+                self._daily(self.health, as_of, "health_date"))
+
+
+# ── Live dataset ───────────────────────────────────────────────────────────
+class LiveDataset:
+    """The loaded dataset with the logged events applied, shared by all sessions."""
+
+    def __init__(self, directory):
+        self._lock = threading.Lock()
+        self._log = EventLog(directory)
+        self._base_version = None
+        self._rows = None  # person_id -> row position
+        self._days = None  # StageDays of self.frame
+        self._events = None  # EventTable of self.frame, in event storage mode
+        self.frame = None
+        self.counts = None
+        self.applied = 0
+        self.rejected = 0
+        self.last_event = None  # time.time() of the last batch applied
+        self._last_poll = 0.0
+
+    def _reset(self, base):
+        self._log = EventLog(self._log.directory)
+        self._base_version = data_version(base)
+        self.frame = base
+        self._rows = pd.Index(base["person_id"])
+        self._days = get_stage_days(base)
+        self._events = get_event_table(base) if use_events() else None
+        self.counts = CumulativeCounts(base)
+        self.applied = self.rejected = 0
+
+    def refresh(self, base):
+        """The current frame; reads the event log first when POLL_SECONDS have passed."""
+        with self._lock:
+            if data_version(base) != self._base_version:
+                self._reset(base)  # the dataset file was reloaded: replay the log on it
+                self._last_poll = 0.0
+            if time.monotonic() - self._last_poll >= POLL_SECONDS:
+                self._last_poll = time.monotonic()
+                events = self._log.read()
+                if len(events):
+                    self._apply(events)
+            return self.frame
+
+    def _apply(self, events):
+        positions = self._rows.get_indexer(pd.to_numeric(events["person_id"], errors="coerce"))
+        # Day resolution, like the day matrix the events are checked against
+        dates = pd.to_datetime(events["date"], errors="coerce").dt.normalize()
+        valid = (positions >= 0) & dates.notna().to_numpy() & events["stage"].isin(EVENT_STAGES).to_numpy()
+        self.rejected += int((~valid).sum())
+        events = pd.DataFrame({"pos": positions[valid], "stage": events["stage"][valid].to_numpy(),
+                               "date": dates[valid].to_numpy(dtype="datetime64[ns]")})
+        if events.empty:
+            return
+        # Later events of one record and stage replace earlier ones
+        events = events.drop_duplicates(["pos", "stage"], keep="last")
+
+        # A new frame: sessions still rendering the previous one keep a consistent view.
+        # Stages are applied in pipeline order, so a card event is checked
+        # against the earlier stages of the same batch. A packed frame
+        # (utils.stages.pack_frame) has no date or flag columns to rewrite:
+        # only its day matrix changes.
+        frame = self.frame.copy(deep=False)
+        days = self._days
+        updates = {}
+        applied = 0
+        batches = dict(list(events.groupby("stage", sort=False)))
+        for stage in [stage for stage in EVENT_STAGES if stage in batches]:
+            date_col, flag_col = EVENT_STAGES[stage]
+            pos = batches[stage]["pos"].to_numpy()
+            new = batches[stage]["date"].to_numpy()
+            if date_col in CARD_DATE_COLS:
+                in_order = self._in_order(days, date_col, pos, new)
+                self.rejected += int((~in_order).sum())
+                pos, new = pos[in_order], new[in_order]
+                if len(pos) == 0:
+                    continue
+            old = day_dates(days[date_col][pos], "ns")
+            self.counts.move(date_col, old.view(np.int64), new.view(np.int64))
+            if date_col in frame.columns:
+                values = frame[date_col].to_numpy(dtype="datetime64[ns]", copy=True)
+                values[pos] = new
+                frame[date_col] = pd.Series(values, index=frame.index).astype(self.frame[date_col].dtype)
+            if flag_col in frame.columns:
+                flags = frame[flag_col].to_numpy(copy=True)
+                flags[pos] = True
+                frame[flag_col] = flags
+            days = days.patched({date_col: (pos, new)})
+            updates[date_col] = (pos, new)
+            applied += len(pos)
+        if not applied:
+            return
+
+        self.applied += applied
+        frame.attrs["data_version"] = f"{self._base_version}+{self.applied}"
+        frame.attrs["base_version"] = self._base_version
+        # Only the touched rows of the day matrix changed; the rest was copied over
+        self._days = days
+        hand_over_stage_days(frame, self._days)
+        if self._events is not None:
+            self._events = self._events.patched(updates)
+            hand_over_event_table(frame, self._events)
+        self.frame = frame
+        self.last_event = time.time()
+
+    @staticmethod
+    def _in_order(days, date_col, pos, new):
+        """
+        Whether each card event keeps the record's card stages in order (at
+        day resolution, on the StageDays `days`): every earlier stage
+        reached on or before its date, every later stage reached, if at
+        all, on or after it (an unreached stage is NEVER, after every day).
+        """
+        i = CARD_DATE_COLS.index(date_col)
+        day = (new.astype("datetime64[D]") - np.datetime64(DAY_ZERO.date(), "D")).astype(np.int64)
+        ok = np.ones(len(pos), dtype=bool)
+        for col in CARD_DATE_COLS[:i]:
+            ok &= days[col][pos] <= day
+        for col in CARD_DATE_COLS[i + 1:]:
+            ok &= days[col][pos] >= day
+        return ok
+
+    def metrics(self, df, as_of_date):
+        """Unfiltered (counts, daily_arrivals, daily_health) when df is the current frame, else None."""
+        with self._lock:
+            if self.frame is None or data_version(df) != data_version(self.frame):
+                return None
+            return self.counts.metrics(as_of_date)
+
+
+@st.cache_resource
+def get_live_dataset():
+    """The process-wide live dataset over NUSUK_EVENTS_DIR."""
+    return LiveDataset(EVENTS_DIR)
+
+
+def live_metrics(df, as_of_date):
+    """Unfiltered metric counts from the incremental aggregates, or None when they do not apply to df."""
+    if not live_enabled():
+        return None
+    return get_live_dataset().metrics(df, as_of_date)
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def render_live_status(base, shown_version):
+    """Sidebar status of the event feed; reruns the app when a newer frame is available."""
+    lang = get_lang()
+    live = get_live_dataset()
+    frame = live.refresh(base)
+    if data_version(frame) != shown_version:
+        st.rerun()
+    if live.last_event is None:
+        st.caption("🔴 " + ("بانتظار الأحداث" if lang == "ar" else "Live: waiting for events"))
+        return
+    ago = int(time.time() - live.last_event)
+    st.caption("🔴 " + (f"مباشر: {live.applied:,} حدث · آخر تحديث قبل {ago} ث" if lang == "ar"
+                       else f"Live: {live.applied:,} events · last update {ago}s ago"))
@@ -0,0 +1,181 @@
+"""
+Background export jobs.
+Exports run on a shared worker pool instead of the Streamlit script thread.
+Finished files are kept on disk, keyed by (export type, parameters, data
+version), so an identical request from any session reuses the same file.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from utils.export import EXPORT_DIR
+from utils.i18n import t, get_lang
+
+
+JOB_WORKERS = 2
+CACHE_DIR = os.path.join(EXPORT_DIR, "cache")
+# Finished files kept on disk (oldest are removed first)
+CACHE_MAX_FILES = 40
+POLL_SECONDS = 1.0
+
+
+def job_key(kind, params, data_version):
+    """Stable cache key for one export request."""
+    payload = json.dumps([kind, params, data_version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+
+class ExportJob:
+    """State of one export. Updated by the worker, read by script runs."""
+
+    def __init__(self, key, path, status="queued"):
+        self.key = key
+        self.path = path
+        self.status = status  # queued | running | done | failed
+        self.progress = 1.0 if status == "done" else 0.0
+        self.error = None
+        self.submitted = time.time()
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+
+class ExportJobs:
+    """Worker pool and on-disk result cache shared by all sessions."""
+
+    def __init__(self, workers=JOB_WORKERS, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def path_for(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get(self, key, ext):
+        """The job for `key`, a finished job for a cached file, or None."""
+        path = self.path_for(key, ext)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status == "done" and not os.path.exists(path):
+                # Pruned from the cache since it finished
+                del self._jobs[key]
+                job = None
+        if job is None and os.path.exists(path):
+            job = ExportJob(key, path, status="done")
+        return job
+
+    def submit(self, key, ext, write):
+        """
+        Queue `write(file, progress=...)` unless the same export is already
+        cached or in progress. Returns the job.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status in ("queued", "running"):
+                return job
+            path = self.path_for(key, ext)
+            if os.path.exists(path):
+                job = ExportJob(key, path, status="done")
+            else:
+                job = ExportJob(key, path)
+                self._pool.submit(self._run, job, write)
+            self._jobs[key] = job
+            return job
+
+    def _run(self, job, write):
+        job.status = "running"
+        part = f"{job.path}.{threading.get_ident()}.part"
+
+        def progress(frac):
+            job.progress = min(frac, 1.0)
+
+        try:
+            with open(part, "wb") as f:
+                write(f, progress=progress)
+            os.replace(part, job.path)  # readers never see a half-written file
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as exc:
+            job.error = str(exc)
+            job.status = "failed"
+            if os.path.exists(part):
+                os.remove(part)
+        finally:
+            self._prune()
+
+    def _prune(self):
+        files = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+            if not name.endswith(".part")
+        ]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[CACHE_MAX_FILES:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+@st.cache_resource
+def get_export_jobs():
+    """The process-wide export job queue."""
+    return ExportJobs()
+
+
+def _read_path(path):
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def _job_progress(key, ext):
+    """Progress of a running job; polls on its own so the rest of the page stays idle."""
+    job = get_export_jobs().get(key, ext)
+    if job is None or job.status not in ("queued", "running"):
+        st.rerun()
+    st.progress(job.progress, text=t("preparing_export"))
+
+
+def export_job_widget(label, file_name, mime, kind, params, build, data_version):
+    """
+    Export control backed by the background job queue.
+    `build()` runs in the script thread when the export is requested and
+    returns `write(file, progress=...)`, which fills the file on a worker
+    thread (so it must not touch st.session_state). `params` is everything
+    besides the data version that changes the file's content (date, filters,
+    language).
+    """
+    lang = get_lang()
+    jobs = get_export_jobs()
+    ext = os.path.splitext(file_name)[1]
+    key = job_key(kind, params, data_version)
+    job = jobs.get(key, ext)
+
+    if job is not None and job.status in ("queued", "running"):
+        _job_progress(key, ext)
+        return
+
+    if job is not None and job.status == "done":
+        size_mb = job.size / (1024 * 1024)
+        st.download_button(
+            f"📥 {t('download')} {file_name} ({size_mb:.1f} MB)",
+            data=_read_path(job.path), file_name=file_name, mime=mime,
+            key=f"{kind}_download", use_container_width=True,
+        )
+        return
+
+    if job is not None and job.status == "failed":
+        st.error(("فشل التصدير: " if lang == "ar" else "Export failed: ") + job.error)
+
+    if st.button(label, key=f"{kind}_build", use_container_width=True):
+        jobs.submit(key, ext, build())
+        st.rerun()
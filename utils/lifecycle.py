@@ -0,0 +1,224 @@
+"""
+Lifecycle dates as a long event table.
+Instead of 12 wide date columns (mostly NaT for later stages) and the 8
+status flags derived from them, every reached date is one event: int32
+person (row position), int8 stage (index into EVENT_COLS) and int16 day
+(offset from DAY_ZERO, as in utils.stages), sorted by day. Everything on or
+before a day is a prefix of the table and everything between two days a
+contiguous slice, so metrics are bincounts over a prefix. Dates are kept
+at day resolution. Used for metrics with NUSUK_STORAGE=events; with live
+event ingestion each batch is merged into the previous version's table.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import STORAGE, DATE_COLS, data_version, frame_key
+from utils.stages import DAY_ZERO, FLAG_DATES, day_offset
+from utils.sharded import DATE_COUNTS, CODE_COLUMNS
+
+
+EVENT_COLS = DATE_COLS
+EVENT_CODE = {col: code for code, col in enumerate(EVENT_COLS)}
+# Day offset of a date that was never reached, in full-length per-person arrays
+NEVER = np.iinfo(np.int16).max
+
+
+def use_events():
+    return STORAGE == "events"
+
+
+class EventTable:
+    """Reached lifecycle dates of one dataset as (person, stage, day) events, sorted by day."""
+
+    def __init__(self, person, stage, day, n):
+        order = np.lexsort((person, stage, day))
+        self._set(person[order], stage[order], day[order], n)
+        self.categories = {}
+        self._codes = {}
+
+    def _set(self, person, stage, day, n):
+        self.n = n
+        self.person = np.ascontiguousarray(person, dtype=np.int32)
+        self.stage = np.ascontiguousarray(stage, dtype=np.int8)
+        self.day = np.ascontiguousarray(day, dtype=np.int16)
+        for arr in (self.person, self.stage, self.day):
+            arr.flags.writeable = False
+
+    @classmethod
+    def from_frame(cls, df):
+        """Event table of the date columns of a wide frame (with its dimension codes, for filters)."""
+        people, stages, days = [], [], []
+        for col in EVENT_COLS:
+            dates = df[col]
+            present = np.flatnonzero(dates.notna().to_numpy())
+            offsets = (dates.iloc[present].dt.normalize() - DAY_ZERO).dt.days.to_numpy()
+            people.append(present)
+            stages.append(np.full(len(present), EVENT_CODE[col]))
+            days.append(offsets.clip(-NEVER + 1, NEVER - 1))
+        table = cls(np.concatenate(people), np.concatenate(stages), np.concatenate(days), len(df))
+        for col in CODE_COLUMNS:
+            codes, uniques = pd.factorize(df[col])  # first-appearance order, NaN -> -1
+            table._codes[col] = codes.astype(np.int32)
+            table.categories[col] = list(uniques)
+        return table
+
+    @staticmethod
+    def _sort_key(person, stage, day):
+        """One int64 per event that sorts like (day, stage, person), the table's order."""
+        return ((day.astype(np.int64) + NEVER) << 40) | (stage.astype(np.int64) << 32) | person
+
+    def patched(self, updates):
+        """
+        New EventTable with {date column: (positions, datetime64 values)}
+        replacing those records' events of that column. The events are
+        merged into a copy of this (sorted) table, which stays unchanged for
+        readers of its own version.
+        """
+        replaced = np.zeros(len(self.person), dtype=bool)
+        people, stages, days = [], [], []
+        for col, (positions, values) in updates.items():
+            code = EVENT_CODE[col]
+            replaced |= (self.stage == code) & np.isin(self.person, positions)
+            offsets = (np.asarray(values, dtype="datetime64[D]") - np.datetime64(DAY_ZERO.date(), "D")).astype(np.int64)
+            people.append(np.asarray(positions))
+            stages.append(np.full(len(positions), code))
+            days.append(offsets.clip(-NEVER + 1, NEVER - 1))
+        keep = ~replaced
+        person, stage, day = self.person[keep], self.stage[keep], self.day[keep]
+        new_person, new_stage, new_day = (np.concatenate(a) for a in (people, stages, days))
+        order = np.lexsort((new_person, new_stage, new_day))
+        new_person, new_stage, new_day = new_person[order], new_stage[order], new_day[order]
+        at = np.searchsorted(self._sort_key(person, stage, day),
+                             self._sort_key(new_person, new_stage, new_day))
+
+        table = EventTable.__new__(EventTable)
+        table._set(np.insert(person, at, new_person), np.insert(stage, at, new_stage),
+                   np.insert(day, at, new_day), self.n)
+        # Events never change the dimension columns
+        table.categories, table._codes = self.categories, self._codes
+        return table
+
+    def to_frame(self, dtype="datetime64[us]"):
+        """The wide date columns and status flags, one row per person (NaT / False where not reached)."""
+        wide = {}
+        for col in EVENT_COLS:
+            days = self.stage_days(col)
+            offsets = pd.to_timedelta(np.where(days == NEVER, 0, days), unit="D")
+            wide[col] = pd.Series(DAY_ZERO + offsets).where(days != NEVER).astype(dtype)
+        for flag, col in FLAG_DATES.items():
+            wide[flag] = self.stage_days(col) != NEVER
+        return pd.DataFrame(wide)
+
+    @property
+    def nbytes(self):
+        return self.person.nbytes + self.stage.nbytes + self.day.nbytes
+
+    def _end(self, d):
+        """Length of the prefix of events on or before day offset d."""
+        return int(np.searchsorted(self.day, d, side="right"))
+
+    def through(self, d):
+        """(person, stage, day) views of every event on or before day offset d."""
+        end = self._end(d)
+        return self.person[:end], self.stage[:end], self.day[:end]
+
+    def between(self, a, b):
+        """(person, stage, day) views of the events from day offset a to b, inclusive."""
+        start = int(np.searchsorted(self.day, a, side="left"))
+        end = self._end(b)
+        return self.person[start:end], self.stage[start:end], self.day[start:end]
+
+    def stage_days(self, col):
+        """int16 day offset of `col` per person (NEVER where it was not reached)."""
+        days = np.full(self.n, NEVER, dtype=np.int16)
+        sel = self.stage == EVENT_CODE[col]
+        days[self.person[sel]] = self.day[sel]
+        return days
+
+    # ── Metrics ────────────────────────────────────────────────────────
+    def _persons(self, filters):
+        """Boolean mask of the persons matching {dimension column: values}, or None for all."""
+        mask = None
+        for col, values in filters.items():
+            index = {v: i for i, v in enumerate(self.categories[col])}
+            keep = np.zeros(len(self.categories[col]) + 1, dtype=bool)  # last slot: missing (-1)
+            keep[[index[v] for v in values if v in index]] = True
+            selected = keep[self._codes[col]]
+            mask = selected if mask is None else mask & selected
+        return mask
+
+    def _daily(self, days, name):
+        histogram = np.bincount(days.astype(np.int64) - days.min(), minlength=1) if len(days) else np.zeros(0)
+        present = np.flatnonzero(histogram)
+        index = pd.Index([(DAY_ZERO + pd.Timedelta(days=int(d + days.min()))).date() for d in present],
+                         dtype=object, name=name)
+        return pd.Series(histogram[present].astype(np.int64), index=index, name="count")
+
+    def metrics(self, as_of_date, person_type_filter=None, nationality_filter=None,
+                provider_filter=None, b2b_b2c_filter=None):
+        """(counts, daily_arrivals, daily_health) of the filtered persons, as compute_metrics sees them."""
+        filters = {name: values for name, values in (
+            ("b2b_b2c", [b2b_b2c_filter] if b2b_b2c_filter else None),
+            ("person_type", person_type_filter),
+            ("nationality", nationality_filter),
+            ("service_provider", provider_filter)) if values}
+        persons = self._persons(filters)
+        person, stage, day = self.through(day_offset(as_of_date))
+        if persons is not None:
+            keep = persons[person]
+            person, stage, day = person[keep], stage[keep], day[keep]
+
+        # Health and death dates are only recorded for incidents and deaths
+        per_stage = np.bincount(stage, minlength=len(EVENT_COLS))
+        counts = {"total_records": self.n if persons is None else int(np.count_nonzero(persons))}
+        for key, col in DATE_COUNTS.items():
+            counts[key] = np.int64(per_stage[EVENT_CODE[col]])
+        counts["health_incidents"] = np.int64(per_stage[EVENT_CODE["health_date"]])
+        counts["deaths"] = np.int64(per_stage[EVENT_CODE["death_date"]])
+        return (counts,
+                self._daily(day[stage == EVENT_CODE["arrival_date"]], "arrival_date"),
+                self._daily(day[stage == EVENT_CODE["health_date"]], "health_date"))
+
+    def provider_totals(self, as_of_date):
+        """{provider: per-provider totals} (as ShardedColumns.provider_totals), in first-appearance order."""
+        codes = self._codes["service_provider"]
+        providers = len(self.categories["service_provider"])
+        person, stage, _ = self.through(day_offset(as_of_date))
+
+        def per_provider(col):
+            owners = codes[person[stage == EVENT_CODE[col]]]
+            return np.bincount(owners[owners >= 0], minlength=providers)
+
+        at_provider = self.stage_days("card_at_provider_date").astype(np.int64)
+        received = self.stage_days("card_received_date").astype(np.int64)
+        both = (at_provider != NEVER) & (received != NEVER) & (codes >= 0)
+        totals = {
+            "pilgrims_assigned": np.bincount(codes[codes >= 0], minlength=providers),
+            "cards_at_provider": per_provider("card_at_provider_date"),
+            "cards_received": per_provider("card_received_date"),
+            "cards_activated": per_provider("card_activation_date"),
+            "health_incidents": per_provider("health_date"),
+            "delivery_days": np.bincount(codes[both], weights=(received - at_provider)[both].astype(np.float64),
+                                         minlength=providers),
+            "delivered": np.bincount(codes[both], minlength=providers),
+        }
+        return {provider: {key: values[i] for key, values in totals.items()}
+                for i, provider in enumerate(self.categories["service_provider"])}
+
+
+# Patched event table of the latest live version, by data version (see hand_over_event_table)
+_handed_over = {}
+
+
+def hand_over_event_table(df, table):
+    """Serve `table` (patched by the live feed) as the event table of the live frame `df`."""
+    _handed_over.clear()
+    _handed_over[data_version(df)] = table
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=2)
+def get_event_table(df):
+    """Build (once per dataset version) and share the lifecycle event table."""
+    table = _handed_over.get(data_version(df))
+    return table if table is not None else EventTable.from_frame(df)
@@ -0,0 +1,280 @@
+"""
+Memory accounting.
+Reports the bytes held by the shared dataset, every st.cache_data and
+st.cache_resource function, every session's state and the largest single
+objects among them, and takes tracemalloc snapshots on demand. Each session
+records its own state size at most once per SESSION_SAMPLE_SECONDS of full
+runs (the shared frame is not counted); everything else is only measured
+from the debug panel. Cache sizes read Streamlit's private cache registries,
+so they show as n/a on releases where those are laid out differently.
+"""
+
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+import numpy as np
+import pandas as pd
+import streamlit as st
+try:
+    from streamlit.runtime.caching.cache_data_api import _data_caches
+    from streamlit.runtime.caching.cache_resource_api import _resource_caches
+except ImportError:  # private modules: not every release has them
+    _data_caches = _resource_caches = None
+
+
+# Sessions with no run for this long are dropped from the report
+SESSION_TTL = 600
+# A session's state is measured on a full run at most this often
+SESSION_SAMPLE_SECONDS = 60
+# Objects at least this large are listed on their own
+LARGE_OBJECT_BYTES = 1024 * 1024
+# Allocation sites shown per tracemalloc snapshot
+TOP_ALLOCATIONS = 15
+TRACE_FRAMES = 1
+MB = 1024 * 1024
+
+
+def object_bytes(obj, seen=None):
+    """
+    Deep size of `obj` in bytes. Objects whose id is in `seen` count zero, so
+    sharing one `seen` across calls counts every object once. Functions,
+    classes and modules count only themselves (their globals are not followed).
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        if obj.base is not None:
+            # A view: the memory belongs to its base
+            return sys.getsizeof(obj) + object_bytes(obj.base, seen)
+        return obj.nbytes + sys.getsizeof(obj)
+    if isinstance(obj, tempfile.SpooledTemporaryFile):
+        # Spooled exports hold their bytes in memory until they roll over to disk
+        if obj.closed or obj._rolled:
+            return sys.getsizeof(obj)
+        return sys.getsizeof(obj) + len(obj._file.getbuffer())
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    if isinstance(obj, (type, types.ModuleType)) or callable(obj):
+        return sys.getsizeof(obj)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(object_bytes(k, seen) + object_bytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(object_bytes(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += object_bytes(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += object_bytes(getattr(obj, slot), seen)
+    return size
+
+
+# ── Sessions ───────────────────────────────────────────────────────────────
+class SessionMemory:
+    """Last measured session_state size of every session, shared by all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # session key -> (time of last run, {state key: bytes})
+
+    def record(self, session, sizes):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session] = (now, sizes)
+            self._sessions = {
+                key: value for key, value in self._sessions.items()
+                if now - value[0] <= SESSION_TTL
+            }
+
+    def sessions(self):
+        """{session key: {state key: bytes}} of the sessions seen recently."""
+        with self._lock:
+            return {key: sizes for key, (_, sizes) in self._sessions.items()}
+
+
+@st.cache_resource
+def get_session_memory():
+    """The process-wide session memory registry."""
+    return SessionMemory()
+
+
+def record_session_memory(session, shared=()):
+    """
+    Measure this session's state (without the `shared` objects, e.g. the
+    dataset), unless it was measured less than SESSION_SAMPLE_SECONDS ago.
+    """
+    now = time.monotonic()
+    if now - st.session_state.get("_memory_recorded_at", -SESSION_SAMPLE_SECONDS) < SESSION_SAMPLE_SECONDS:
+        return
+    st.session_state["_memory_recorded_at"] = now
+    seen = {id(obj) for obj in shared}
+    sizes = {key: object_bytes(value, seen) for key, value in st.session_state.to_dict().items()}
+    get_session_memory().record(session, sizes)
+
+
+# ── Caches ─────────────────────────────────────────────────────────────────
+def _function_caches(caches):
+    """Every function cache of a cache registry (flat, or scoped per key in newer releases)."""
+    with caches._caches_lock:
+        values = list(caches._function_caches.values())
+    return [cache for value in values
+            for cache in (value.values() if isinstance(value, dict) else [value])]
+
+
+def cache_usage(seen):
+    """
+    (caches, large objects): one row per cached function with its entries
+    and bytes, and one row per entry of at least LARGE_OBJECT_BYTES.
+    st.cache_data entries are pickled, so their size is the stored bytes.
+    None for the caches when Streamlit's cache internals are not readable.
+    """
+    rows, large = [], []
+    try:
+        for cache in _function_caches(_data_caches):
+            sizes = [stat.byte_length for stats in cache.get_stats().values() for stat in stats]
+            rows.append(_cache_row("cache_data", cache.display_name, sizes, cache.max_entries))
+            large += [("cache_data", cache.display_name, size) for size in sizes if size >= LARGE_OBJECT_BYTES]
+        for cache in _function_caches(_resource_caches):
+            with cache._mem_cache_lock:
+                entries = list(cache._mem_cache.values())
+            sizes = [object_bytes(entry.value, seen) for entry in entries]
+            rows.append(_cache_row("cache_resource", cache.display_name, sizes, cache._mem_cache.maxsize))
+            large += [("cache_resource", f"{cache.display_name} ({type(entry.value).__name__})", size)
+                      for entry, size in zip(entries, sizes) if size >= LARGE_OBJECT_BYTES]
+    except (AttributeError, TypeError):
+        # Private internals laid out differently in this Streamlit release
+        return None, []
+    return rows, large
+
+
+def _cache_row(kind, name, sizes, max_entries):
+    return {
+        "kind": kind,
+        "function": name.rsplit(".", 1)[-1],
+        "entries": len(sizes),
+        "max_entries": max_entries if max_entries is not None and max_entries != float("inf") else None,
+        "MB": sum(sizes) / MB,
+        "largest_MB": max(sizes, default=0) / MB,
+    }
+
+
+def memory_report(df):
+    """Tables of the dataset, caches, sessions and large objects. Objects are counted once."""
+    seen = set()
+    dataset_bytes = object_bytes(df, seen)
+    caches, large = cache_usage(seen)
+    large.insert(0, ("dataset", "df", dataset_bytes))
+
+    sessions = []
+    for session, sizes in get_session_memory().sessions().items():
+        total = sum(sizes.values())
+        biggest = max(sizes, key=sizes.get) if sizes else None
+        sessions.append({
+            "session": session[:8], "keys": len(sizes), "MB": total / MB,
+            "largest_key": biggest, "largest_MB": sizes[biggest] / MB if biggest else 0.0,
+        })
+        large += [("session_state", f"{session[:8]}.{key}", size)
+                  for key, size in sizes.items() if size >= LARGE_OBJECT_BYTES]
+
+    return {
+        "dataset_MB": dataset_bytes / MB,
+        "caches": (None if caches is None else
+                   pd.DataFrame(caches).sort_values("MB", ascending=False) if caches else pd.DataFrame()),
+        "sessions": pd.DataFrame(sessions).sort_values("MB", ascending=False) if sessions else pd.DataFrame(),
+        "large": pd.DataFrame(
+            [{"where": where, "object": name, "MB": size / MB} for where, name, size in large]
+        ).sort_values("MB", ascending=False),
+    }
+
+
+# ── tracemalloc ────────────────────────────────────────────────────────────
+class AllocationTracer:
+    """On-demand tracemalloc snapshots, each compared with the previous one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        # Tracing slows every allocation down: only while someone is looking
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+            self._previous = None
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+
+    def snapshot(self):
+        """(top allocation sites, growth since the previous snapshot or None, traced MB)."""
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ])
+            previous, self._previous = self._previous, snapshot
+        top = pd.DataFrame([
+            {"site": str(stat.traceback), "MB": stat.size / MB, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ])
+        growth = None
+        if previous is not None:
+            growth = pd.DataFrame([
+                {"site": str(stat.traceback), "MB": stat.size / MB, "growth_MB": stat.size_diff / MB}
+                for stat in snapshot.compare_to(previous, "lineno")[:TOP_ALLOCATIONS]
+            ])
+        return top, growth, tracemalloc.get_traced_memory()[0] / MB
+
+
+@st.cache_resource
+def get_allocation_tracer():
+    """The process-wide tracemalloc controller."""
+    return AllocationTracer()
+
+
+def render_memory_panel(df):
+    """Debug panel: memory by dataset, cache, session and object, and tracemalloc snapshots."""
+    with st.expander("🛠 Memory"):
+        if st.button("Measure memory", key="_memory_measure", use_container_width=True):
+            report = memory_report(df)
+            st.caption(f"Dataset: {report['dataset_MB']:.1f} MB. "
+                       "Each object is counted once: dataset, then caches, then sessions.")
+            if report["caches"] is None:
+                st.caption("Cache sizes: n/a (this Streamlit release keeps its caches differently)")
+            for title in ("caches", "sessions", "large"):
+                if report[title] is not None and not report[title].empty:
+                    st.dataframe(report[title].round(2), use_container_width=True, hide_index=True)
+
+        tracer = get_allocation_tracer()
+        if not tracer.tracing:
+            if st.button("Start tracemalloc", key="_memory_trace_start", use_container_width=True):
+                tracer.start()
+                st.rerun()
+            return
+        col1, col2 = st.columns(2)
+        snapshot = col1.button("Snapshot", key="_memory_snapshot", use_container_width=True)
+        if col2.button("Stop", key="_memory_trace_stop", use_container_width=True):
+            tracer.stop()
+            st.rerun()
+        if snapshot:
+            top, growth, traced = tracer.snapshot()
+            st.caption(f"Traced since start: {traced:.1f} MB")
+            st.dataframe(top.round(3), use_container_width=True, hide_index=True)
+            if growth is not None:
+                st.caption("Growth since the previous snapshot")
+                st.dataframe(growth.round(3), use_container_width=True, hide_index=True)
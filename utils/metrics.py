@@ -2,13 +2,29 @@
 Compute dashboard metrics as of a given date.
 All pipeline metrics are calculated by filtering date columns <= as_of_date.
 Results are cached by (date, filters) to avoid redundant computation during animation.
+On very large datasets the counts can be computed by a process pool (see utils/sharded.py),
+in SQLite storage mode they are SQL aggregates (see utils/sqlstore.py), and in
+event storage mode prefix counts over the lifecycle event table (utils/lifecycle.py).
+Otherwise they are counted on the packed core arrays (utils/core.py), or with pandas
+passes over the DataFrame when NUSUK_STORAGE=frame.
+With live event ingestion, unfiltered counts come from aggregates kept current by utils/ingest.py.
 """
 
 import streamlit as st
 import pandas as pd
 import numpy as np
-
-
+from utils.profiling import timed, cache_miss
+from utils.sharded import use_shards, get_sharded_columns
+from utils.sqlstore import use_sql, get_sql_store
+from utils.ingest import live_enabled, live_metrics
+from utils.lifecycle import use_events, get_event_table
+from utils.core import use_core, get_core_store
+from utils.groups import get_group_index, group_table
+from utils.stages import get_stage_days, day_offset, column, column_frame
+from utils.data import frame_key
+
+
+@timed("compute_metrics")
 def compute_metrics(df, as_of_date, person_type_filter=None, nationality_filter=None,
                     provider_filter=None, b2b_b2c_filter=None):
     """
@@ -24,10 +40,24 @@ def compute_metrics(df, as_of_date, person_type_filter=None, nationality_filter=
     )
 
 
-@st.cache_data(hash_funcs={pd.DataFrame: id}, max_entries=500)
+@st.cache_data(hash_funcs={pd.DataFrame: frame_key}, max_entries=500)
+@cache_miss("compute_metrics")
 def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filter,
                             provider_filter, b2b_b2c_filter):
     """Cached implementation — only recomputes when parameters change."""
+    if not (person_type_filter or nationality_filter or provider_filter or b2b_b2c_filter):
+        live = live_metrics(df, as_of_date)
+        if live is not None:
+            return _metrics_from_counts(*live)
+
+    store = _metric_store(df)
+    if store is not None:
+        counts, daily_arrivals, daily_health = store.metrics(
+            as_of_date, person_type_filter, nationality_filter, provider_filter, b2b_b2c_filter)
+        if counts["total_records"] == 0:
+            return _empty_metrics()
+        return _metrics_from_counts(counts, daily_arrivals, daily_health)
+
     filtered = df
 
     if b2b_b2c_filter:
@@ -63,7 +93,6 @@ def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filt
     # ── Arrivals ───────────────────────────────────────────────────────
     arrival_mask = filtered["arrival_date"] <= as_of
     total_arrivals = arrival_mask.sum()
-    arrival_pct = total_arrivals / max(total_visas, 1) * 100
 
     # ── Card Pipeline ──────────────────────────────────────────────────
     printed_mask = filtered["card_printed_date"] <= as_of
@@ -84,17 +113,6 @@ def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filt
     proof_mask = filtered["proof_picture_date"] <= as_of
     proof_pictures = proof_mask.sum()
 
-    # Cards at provider but NOT delivered to pilgrims
-    cards_not_delivered = cards_at_provider - cards_received
-
-    # ── Percentages (each as % of previous stage) ─────────────────────
-    formation_pct = groups_formed / max(total_visas, 1) * 100
-    printed_pct = cards_printed / max(total_visas, 1) * 100
-    center_pct = cards_at_center / max(cards_printed, 1) * 100
-    provider_pct = cards_at_provider / max(cards_at_center, 1) * 100
-    received_pct = cards_received / max(cards_at_provider, 1) * 100
-    activated_pct = cards_activated / max(cards_received, 1) * 100
-
     # ── Health ─────────────────────────────────────────────────────────
     health_mask = (
         (filtered["health_status"] != "none") &
@@ -116,8 +134,63 @@ def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filt
     health_dates = filtered.loc[health_mask, "health_date"]
     daily_health = health_dates.dt.date.value_counts().sort_index()
 
-    return {
+    counts = {
         "total_records": n,
+        "total_visas": total_visas,
+        "groups_formed": groups_formed,
+        "total_arrivals": total_arrivals,
+        "cards_printed": cards_printed,
+        "cards_at_center": cards_at_center,
+        "cards_at_provider": cards_at_provider,
+        "cards_received": cards_received,
+        "cards_activated": cards_activated,
+        "proof_pictures": proof_pictures,
+        "health_incidents": health_incidents,
+        "deaths": deaths,
+    }
+    return _metrics_from_counts(counts, daily_arrivals, daily_health)
+
+
+def _metric_store(df):
+    """The store answering metric counts instead of the pandas pass, if any."""
+    if use_sql():
+        return get_sql_store(df)
+    if use_events():
+        return get_event_table(df)
+    # Live batches are new versions each: the shared columns would be copied again per batch
+    if use_shards(df) and not live_enabled():
+        return get_sharded_columns(df)
+    if use_core():
+        return get_core_store(df)
+    return None
+
+
+def _metrics_from_counts(counts, daily_arrivals, daily_health):
+    """Metrics dict (with stage percentages) from the stage counts and daily series."""
+    total_visas = counts["total_visas"]
+    groups_formed = counts["groups_formed"]
+    total_arrivals = counts["total_arrivals"]
+    cards_printed = counts["cards_printed"]
+    cards_at_center = counts["cards_at_center"]
+    cards_at_provider = counts["cards_at_provider"]
+    cards_received = counts["cards_received"]
+    cards_activated = counts["cards_activated"]
+
+    arrival_pct = total_arrivals / max(total_visas, 1) * 100
+
+    # Cards at provider but NOT delivered to pilgrims
+    cards_not_delivered = cards_at_provider - cards_received
+
+    # ── Percentages (each as % of previous stage) ─────────────────────
+    formation_pct = groups_formed / max(total_visas, 1) * 100
+    printed_pct = cards_printed / max(total_visas, 1) * 100
+    center_pct = cards_at_center / max(cards_printed, 1) * 100
+    provider_pct = cards_at_provider / max(cards_at_center, 1) * 100
+    received_pct = cards_received / max(cards_at_provider, 1) * 100
+    activated_pct = cards_activated / max(cards_received, 1) * 100
+
+    return {
+        "total_records": counts["total_records"],
         "total_visas": int(total_visas),
         "groups_formed": int(groups_formed),
         "total_arrivals": int(total_arrivals),
@@ -127,7 +200,7 @@ def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filt
         "cards_at_provider": int(cards_at_provider),
         "cards_received": int(cards_received),
         "cards_activated": int(cards_activated),
-        "proof_pictures": int(proof_pictures),
+        "proof_pictures": int(counts["proof_pictures"]),
         "cards_not_delivered": int(cards_not_delivered),
         "formation_pct": round(formation_pct, 2),
         "printed_pct": round(printed_pct, 2),
@@ -135,8 +208,8 @@ def _compute_metrics_cached(df, as_of_date, person_type_filter, nationality_filt
         "provider_pct": round(provider_pct, 2),
         "received_pct": round(received_pct, 2),
         "activated_pct": round(activated_pct, 2),
-        "health_incidents": int(health_incidents),
-        "deaths": int(deaths),
+        "health_incidents": int(counts["health_incidents"]),
+        "deaths": int(counts["deaths"]),
         "daily_arrivals": daily_arrivals,
         "daily_health": daily_health,
     }
@@ -150,9 +223,15 @@ def compute_metrics_by_type(df, as_of_date):
     return results
 
 
-@st.cache_data(hash_funcs={pd.DataFrame: id}, max_entries=100)
+@timed("compute_provider_metrics")
+@st.cache_data(hash_funcs={pd.DataFrame: frame_key}, max_entries=100)
+@cache_miss("compute_provider_metrics")
 def compute_provider_metrics(df, as_of_date):
     """Compute metrics per service provider (cached)."""
+    store = _metric_store(df)
+    if store is not None:
+        return _provider_metrics_from_totals(store.provider_totals(as_of_date))
+
     as_of = pd.Timestamp(as_of_date)
     providers = df["service_provider"].dropna().unique()
     rows = []
@@ -200,6 +279,68 @@ def compute_provider_metrics(df, as_of_date):
     return pd.DataFrame(rows).sort_values("pilgrims_assigned", ascending=False)
 
 
+@timed("compute_group_metrics")
+@st.cache_data(hash_funcs={pd.DataFrame: frame_key}, max_entries=100)
+@cache_miss("compute_group_metrics")
+def compute_group_metrics(df, as_of_date):
+    """Compute pipeline metrics per pilgrim group (cached), worst completion first."""
+    if use_sql():
+        table = group_table(*get_sql_store(df).group_totals(as_of_date))
+    else:
+        table = get_group_index(df).metrics(get_stage_days(df), as_of_date)
+    return table.sort_values(["completion_rate", "laggards"], ascending=[True, False], kind="stable")
+
+
+@timed("record_counts")
+@st.cache_data(hash_funcs={pd.DataFrame: frame_key}, max_entries=500)
+@cache_miss("record_counts")
+def record_counts(df, by, as_of_date=None, filters=None, limit=None):
+    """
+    Records per value of `by` (a column, or a list of columns for a
+    MultiIndex) as value_counts orders them, at most `limit` values (cached):
+    only records whose visa was issued by as_of_date, if given, and whose
+    columns hold one of the values in `filters` ({column: values}).
+    """
+    if use_sql():
+        return get_sql_store(df).counts(by, as_of_date, filters, limit)
+    conditions = [column(df, col).isin(values) for col, values in (filters or {}).items()]
+    if as_of_date is not None:
+        issued = get_stage_days(df)["visa_issue_date"] <= day_offset(as_of_date)
+        conditions.append(pd.Series(issued, index=df.index))
+    selected = column(df, by) if isinstance(by, str) else column_frame(df, by)
+    if conditions:
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask = mask & condition
+        selected = selected[mask]
+    counts = selected.value_counts()
+    return counts if limit is None else counts.head(limit)
+
+
+def _provider_metrics_from_totals(totals):
+    """Provider table from the per-provider totals of a metric store (see _metric_store)."""
+    rows = []
+    for provider, tot in totals.items():
+        n = int(tot["pilgrims_assigned"])
+        if provider == "Government" or n == 0:
+            continue
+        at_provider = tot["cards_at_provider"]
+        delivery_rate = tot["cards_received"] / max(at_provider, 1) * 100
+        avg_days = tot["delivery_days"] / tot["delivered"] if tot["delivered"] > 0 else 0
+        rows.append({
+            "provider": provider,
+            "pilgrims_assigned": n,
+            "cards_at_provider": int(at_provider),
+            "cards_received": int(tot["cards_received"]),
+            "cards_activated": int(tot["cards_activated"]),
+            "delivery_rate": round(delivery_rate, 1),
+            "avg_delivery_days": round(avg_days, 1),
+            "health_incidents": int(tot["health_incidents"]),
+        })
+
+    return pd.DataFrame(rows).sort_values("pilgrims_assigned", ascending=False)
+
+
 def _empty_metrics():
     """Return empty metrics dict."""
     return {
@@ -0,0 +1,261 @@
+"""
+Transliteration-aware name keys for fuzzy pilgrim search.
+Arabic-script and variant Latin spellings reduce to the same consonant
+skeleton (Mohammed / Mohamed / Muhammad / محمد → "mhmt"), so a fuzzy lookup
+is one key computation plus an index read instead of an edit-distance scan.
+"""
+
+import re
+import unicodedata
+import streamlit as st
+import pandas as pd
+import numpy as np
+from utils.data import base_key
+
+
+NAME_COLS = ["first_name", "last_name"]
+
+# Latin search terms shorter than this are matched by substring only
+MIN_PHONETIC_LEN = 4
+# Bumped whenever the key rules change (stored keys, e.g. in SQLite, are rebuilt)
+KEY_REVISION = 2
+
+_VOWEL = "*"
+
+# ── Latin rules ────────────────────────────────────────────────────────────
+_LATIN_DIGRAPHS = [
+    ("kh", "k"), ("gh", "G"), ("sh", "S"), ("ch", "S"),
+    ("th", "t"), ("dh", "d"), ("ph", "f"),
+]
+_LATIN_SINGLE = str.maketrans({"q": "k", "c": "k", "x": "k", "v": "w", "g": "j"})
+
+# ── Arabic / Persian letters → same symbols as the Latin rules ────────────
+_ARABIC_MAP = {
+    "ا": _VOWEL, "أ": _VOWEL, "إ": _VOWEL, "آ": _VOWEL, "ٱ": _VOWEL, "ى": _VOWEL,
+    "ء": _VOWEL, "ئ": _VOWEL, "ؤ": _VOWEL, "ع": _VOWEL, "ة": "",
+    "ب": "b", "ت": "t", "ث": "t", "ج": "j", "ح": "h", "خ": "k", "د": "d",
+    "ذ": "d", "ر": "r", "ز": "z", "س": "s", "ش": "S", "ص": "s", "ض": "d",
+    "ط": "t", "ظ": "z", "غ": "G", "ف": "f", "ق": "k", "ك": "k", "ل": "l",
+    "م": "m", "ن": "n", "ه": "h", "و": "w", "ي": "y",
+    "پ": "b", "چ": "S", "ژ": "z", "گ": "j", "ک": "k", "ی": "y",
+}
+_ARABIC_DIACRITICS = re.compile("[\u064B-\u065F\u0670\u0640]")  # harakat, tatweel
+_ARTICLES = {"al", "el", "ال"}
+# "Abd" compounds: Abdul / Abdel / Abdur(-Rahman) carry the next word's article
+_LATIN_ABD = re.compile(r"abd([aeiou])(l|r(?=r|$))?(.*)$")
+
+
+def _is_arabic(token):
+    return any("\u0600" <= ch <= "\u06FF" for ch in token)
+
+
+def _latin_symbols(token):
+    token = unicodedata.normalize("NFKD", token).encode("ascii", "ignore").decode().lower()
+    token = re.sub(r"[^a-z]", "", token)
+    # Attached article: "Alghamdi" → "ghamdi" (but not "Ali", "Alireza", "Elham")
+    if token[:2] in ("al", "el") and len(token) >= 6 and token[2] not in "aeiou":
+        token = token[2:]
+    # Silent final h after a vowel (ta marbuta, Allah): "Fatimah" → "Fatima"
+    if len(token) > 2 and token.endswith("h") and token[-2] in "aeiou":
+        token = token[:-1]
+    for src, dst in _LATIN_DIGRAPHS:
+        token = token.replace(src, dst)
+    token = token.translate(_LATIN_SINGLE)
+    return [
+        _VOWEL if ch in "aeiou" or (ch in "wy" and i > 0) else ch
+        for i, ch in enumerate(token)
+    ]
+
+
+def _arabic_symbols(token):
+    token = _ARABIC_DIACRITICS.sub("", token)
+    if token.startswith("ال") and len(token) > 3:
+        token = token[2:]
+    # Silent final ha after lam or a long vowel (Allah, ...)
+    if len(token) >= 2 and token.endswith("ه") and token[-2] in "لاوي":
+        token = token[:-1]
+    symbols = []
+    for i, ch in enumerate(token):
+        sym = _ARABIC_MAP.get(ch, "")
+        if sym in ("w", "y") and i > 0:
+            sym = _VOWEL
+        if sym:
+            symbols.append(sym)
+    return symbols
+
+
+def _split_compound(token):
+    """
+    Split "Abd" compounds into "abd" and the name they join, in either
+    script (Abdulrahman / Abdul Rahman / عبدالرحمن / عبد الرحمن all give
+    "abd" + "rahman"), so separate and joined spellings share a key.
+    """
+    if _is_arabic(token):
+        if token.startswith("عبد") and len(token) > 3:
+            return ["عبد", token[3:]]
+        return [token]
+    m = _LATIN_ABD.match(token.lower())
+    # A bare vowel link only splits before a full name (Abdikarim, not Abdou)
+    if m and (m.group(2) or (len(m.group(3)) >= 3 and m.group(3)[0] not in "aeiou")):
+        return ["abd"] + ([m.group(3)] if m.group(3) else [])
+    return [token]
+
+
+def is_name_query(query):
+    """Whether a search query can be a name (identifiers carry digits, names do not)."""
+    return not any(ch.isdigit() for ch in str(query))
+
+
+def _token_key(token):
+    symbols = _arabic_symbols(token) if _is_arabic(token) else _latin_symbols(token)
+    if not symbols:
+        return ""
+    head = "A" if symbols[0] == _VOWEL else symbols[0]
+    seq = [head] + [s for s in symbols[1:] if s != _VOWEL]
+    # Final d/t are interchangeable across transliterations (Ahmed / Ahmet)
+    if len(seq) > 1 and seq[-1] == "d":
+        seq[-1] = "t"
+    return "".join(seq)
+
+
+def phonetic_key(name):
+    """
+    Transliteration-insensitive key for a name in Arabic or Latin script.
+    Separate words are keyed individually and concatenated; the article
+    "Al-" / "El-" / "ال" is ignored, and "Abd" compounds are keyed as two words.
+    """
+    tokens = [
+        part for tok in re.split(r"[\s\-'’.]+", str(name).strip())
+        if tok and tok.lower() not in _ARTICLES
+        for part in _split_compound(tok)
+    ]
+    key = "".join(_token_key(tok) for tok in tokens)
+    return re.sub(r"(.)\1+", r"\1", key)
+
+
+def _vocabulary():
+    """Every known name spelling from the generator's NAME_DATABASE."""
+    from data.generate_data import NAME_DATABASE
+    names = set()
+    for region in NAME_DATABASE.values():
+        for name_list in region.values():
+            names.update(name_list)
+    return names
+
+
+class NameIndex:
+    """
+    Per-row phonetic key codes for the name columns, with a CSR index
+    (key code → row positions) per column. Built once per dataset version.
+    """
+
+    def __init__(self, df, cols=NAME_COLS):
+        cols = [c for c in cols if c in df.columns]
+        names_by_col = {col: pd.factorize(df[col], use_na_sentinel=True) for col in cols}
+
+        # ── Key vocabulary (names in the data + NAME_DATABASE) ─────────
+        spellings = set(_vocabulary())
+        for _, uniques in names_by_col.values():
+            spellings.update(str(u) for u in uniques)
+        spellings.discard("")
+        self._key_of_name = {name: phonetic_key(name) for name in spellings}
+        keys = sorted(set(self._key_of_name.values()) - {""})
+        self._key_codes = {key: code for code, key in enumerate(keys)}
+        self._spellings_by_key = {}
+        for name, key in self._key_of_name.items():
+            self._spellings_by_key.setdefault(key, []).append(name)
+
+        code_dtype = np.int16 if len(keys) < np.iinfo(np.int16).max else np.int32
+
+        # ── Compact code column + CSR index per name column ────────────
+        self.codes = {}
+        self._csr = {}
+        self._uniques = {}
+        for col, (name_codes, uniques) in names_by_col.items():
+            unique_key_codes = np.array(
+                [self._key_codes.get(self._key_of_name.get(str(u), ""), -1) for u in uniques] + [-1],
+                dtype=np.int32,
+            )
+            row_codes = unique_key_codes[name_codes].astype(code_dtype)  # -1 sentinel → last slot
+            row_codes.flags.writeable = False
+            self.codes[col] = row_codes
+
+            valid = np.flatnonzero(row_codes >= 0)
+            order = valid[np.argsort(row_codes[valid], kind="stable")].astype(np.int32)
+            offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(row_codes[valid], minlength=len(keys)), out=offsets[1:])
+            order.flags.writeable = False
+            offsets.flags.writeable = False
+            self._csr[col] = (offsets, order)
+            self._uniques[col] = [str(u) for u in uniques]
+
+    def key_code(self, name):
+        """Key code for a name, or -1 if no known name shares its key."""
+        return self._key_codes.get(phonetic_key(name), -1)
+
+    def spellings(self, name):
+        """Known spellings sharing the phonetic key of `name`."""
+        return sorted(self._spellings_by_key.get(phonetic_key(name), []))
+
+    def _term_key_codes(self, term):
+        """Key codes matching one search term: same sound, or a spelling containing it."""
+        codes = set()
+        arabic = _is_arabic(term)
+        # Very short Latin fragments are still being typed: substring only
+        if arabic or len(term) >= MIN_PHONETIC_LEN:
+            code = self.key_code(term)
+            if code >= 0:
+                codes.add(code)
+        term_lower = term.lower()
+        if len(term_lower) >= 2 and not arabic:
+            for col in self._uniques:
+                for name in self._uniques[col]:
+                    key = self._key_of_name.get(name, "")
+                    if key and term_lower in name.lower():
+                        codes.add(self._key_codes[key])
+        return codes
+
+    def _positions_for_codes(self, codes):
+        parts = []
+        for offsets, order in self._csr.values():
+            for code in codes:
+                parts.append(order[offsets[code]:offsets[code + 1]])
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(parts))
+
+    def search(self, query):
+        """
+        Row positions (ascending) whose first or last name matches every
+        word of `query` phonetically or as a substring of a known spelling.
+        A query that is itself one multi-word name ("Abdul Rahman") also matches.
+        """
+        query = str(query).strip()
+        if not query:
+            return np.empty(0, dtype=np.int32)
+
+        whole = self.key_code(query)
+        whole_hits = self._positions_for_codes([whole]) if whole >= 0 else None
+
+        terms = [
+            term for term in re.split(r"\s+", query)
+            if term and term.lower() not in _ARTICLES
+        ]
+        result = None
+        for term in terms:
+            hits = self._positions_for_codes(self._term_key_codes(term))
+            result = hits if result is None else np.intersect1d(result, hits, assume_unique=True)
+            if len(result) == 0:
+                break
+
+        if result is None:
+            result = np.empty(0, dtype=np.int32)
+        if whole_hits is not None and len(terms) > 1:
+            result = np.union1d(result, whole_hits)
+        return result.astype(np.int32)
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: base_key}, max_entries=2)
+def get_name_index(df):
+    """Build (once per dataset file, shared by its live versions) and share the phonetic name index."""
+    return NameIndex(df)
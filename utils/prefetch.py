@@ -0,0 +1,64 @@
+"""
+Background prefetch of upcoming animation frames.
+While the animation plays, each page hands live_section() the cached
+computations one frame needs. The next few dates are computed on a worker
+thread while the current frame is shown, so the results are already in the
+metrics caches (st.cache_data is shared across threads) when their frame runs.
+Dates a session has moved past are cancelled before they start, so the worker
+never works through a backlog of stale frames.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+
+# Frames computed ahead of the one being shown
+PREFETCH_FRAMES = 5
+PREFETCH_WORKERS = 1
+
+
+class FramePrefetcher:
+    """Worker thread that warms the caches for upcoming frames."""
+
+    def __init__(self, workers=PREFETCH_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._queued = {}  # session key -> {date: future}
+
+    def schedule(self, session, compute, dates):
+        """
+        Make `dates` the session's upcoming frames: queue `compute(date)` for
+        the new ones and cancel the queued ones no longer wanted. `compute`
+        runs off the script thread, so it must only call cached functions and
+        not touch st.session_state or render anything.
+        """
+        wanted = set(dates)
+        with self._lock:
+            queued = self._queued.get(session, {})
+            for d, future in queued.items():
+                if d not in wanted:
+                    future.cancel()  # no-op once running or done
+            queued = {d: future for d, future in queued.items() if d in wanted}
+            for d in sorted(wanted - queued.keys()):
+                queued[d] = self._pool.submit(self._run, compute, d)
+            self._queued[session] = queued
+
+    def cancel(self, session):
+        """Cancel every frame still queued for the session (its animation stopped)."""
+        with self._lock:
+            for future in self._queued.pop(session, {}).values():
+                future.cancel()
+
+    def _run(self, compute, d):
+        try:
+            compute(d)
+        except Exception:
+            # The frame recomputes in the script thread and shows the error there
+            pass
+
+
+@st.cache_resource
+def get_prefetcher():
+    """The process-wide frame prefetcher."""
+    return FramePrefetcher()
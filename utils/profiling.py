@@ -0,0 +1,186 @@
+"""
+Timing spans and cache counters for profiling page runs.
+A Profile collects, for one script run (or one fragment rerun), the call
+count and total time of every named span and the hits/misses of cached
+functions. Profiling is on with ?debug=1 (the sidebar panel shows the current
+run) or with NUSUK_PROFILE=1 in the environment; every profiled run is
+appended as one JSON line to PROFILE_LOG. Outside a profiled run (e.g. on
+worker threads) a span costs one context variable lookup.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import streamlit as st
+import pandas as pd
+from utils.debug import debug_enabled
+
+
+PROFILE_LOG = os.environ.get("NUSUK_PROFILE_LOG", os.path.join(tempfile.gettempdir(), "nusuk_profile.jsonl"))
+ALWAYS_PROFILE = os.environ.get("NUSUK_PROFILE") == "1"
+
+_current = contextvars.ContextVar("nusuk_profile", default=None)
+_log_lock = threading.Lock()
+# Names of cached functions (see cache_miss), whose calls count as hits or misses
+_cached_names = set()
+
+
+class Profile:
+    """Span timings and cache counters of one run."""
+
+    def __init__(self, kind, page=None):
+        self.kind = kind  # app | fragment
+        self.page = page
+        self.timestamp = datetime.now().isoformat(timespec="seconds")
+        self.started = time.perf_counter()
+        self.total = None
+        self.spans = {}  # name -> [calls, seconds]
+        self.cache = {}  # name -> [hits, misses]
+
+    def add(self, name, seconds):
+        entry = self.spans.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def misses(self, name):
+        return self.cache.get(name, [0, 0])[1]
+
+    def count_cache(self, name, hit):
+        self.cache.setdefault(name, [0, 0])[0 if hit else 1] += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def to_record(self):
+        return {
+            "time": self.timestamp,
+            "kind": self.kind,
+            "page": self.page,
+            "total_ms": round(self.total * 1000, 2),
+            "spans": {name: {"calls": calls, "ms": round(seconds * 1000, 2)}
+                      for name, (calls, seconds) in self.spans.items()},
+            "cache": {name: {"hits": hits, "misses": misses}
+                      for name, (hits, misses) in self.cache.items()},
+        }
+
+
+def profiling_enabled():
+    return ALWAYS_PROFILE or debug_enabled()
+
+
+def start_profile(kind, page=None):
+    """Profile the rest of this run, if profiling is on. Replaces any unfinished profile."""
+    profile = Profile(kind, page) if profiling_enabled() else None
+    _current.set(profile)
+    return profile
+
+
+def finish_profile():
+    """Finish and log the current run's profile. Returns it (None when not profiling)."""
+    profile = _current.get()
+    _current.set(None)
+    if profile is not None:
+        profile.finish()
+        _write(profile)
+    return profile
+
+
+@contextmanager
+def profiled_run(kind, page=None):
+    """Profile a block as its own run (a fragment rerun); restores the outer profile after."""
+    if not profiling_enabled():
+        yield None
+        return
+    profile = Profile(kind, page)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.finish()
+        _write(profile)
+
+
+def _write(profile):
+    line = json.dumps(profile.to_record(), ensure_ascii=False)
+    with _log_lock:
+        with open(PROFILE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def span(name):
+    """Time a block under `name` in the current run's profile."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    Decorator: time every call under `name`. Put it above st.cache_data, with
+    cache_miss(name) below, to also count cache hits and misses.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            misses = profile.misses(name)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.add(name, time.perf_counter() - started)
+                # A miss was counted by cache_miss during the call
+                if name in _cached_names and profile.misses(name) == misses:
+                    profile.count_cache(name, hit=True)
+        return wrapper
+    return decorate
+
+
+def cache_miss(name):
+    """Decorator for the body of a cached function: it only runs on a cache miss."""
+    _cached_names.add(name)
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is not None:
+                profile.count_cache(name, hit=False)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render_profile_panel(profile):
+    """Debug panel with the span timings and cache counters of one run."""
+    with st.expander(f"🛠 Profile: {profile.total * 1000:.0f} ms"):
+        spans = pd.DataFrame(
+            [(name, calls, seconds * 1000) for name, (calls, seconds) in profile.spans.items()],
+            columns=["span", "calls", "ms"],
+        ).sort_values("ms", ascending=False)
+        spans["% of run"] = (spans["ms"] / (profile.total * 1000) * 100).round(1)
+        spans["ms"] = spans["ms"].round(1)
+        st.dataframe(spans, use_container_width=True, hide_index=True)
+        if profile.cache:
+            cache = pd.DataFrame(
+                [(name, hits, misses) for name, (hits, misses) in profile.cache.items()],
+                columns=["cache", "hits", "misses"],
+            )
+            st.dataframe(cache, use_container_width=True, hide_index=True)
+        st.caption(f"Spans nest (page > render > metrics/charts). Log: {PROFILE_LOG}")
@@ -0,0 +1,166 @@
+"""
+Paginated query engine for Card Tracking.
+Filters resolve to an array of matching row positions (cached per query);
+card status is the stage on the selected date (utils.stages), names are
+matched through the phonetic name index, identifiers by substring (queries
+with digits are identifiers only; a document prefix such as "NSK" is
+searched both ways, other letter-only queries as names only);
+only the rows of the requested page are gathered, and only for the display columns.
+In SQLite storage mode the matching is an indexed query and rows, lookups
+and stage codes are read from the database (utils/sqlstore.py).
+"""
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from utils.phonetic import get_name_index, is_name_query
+from utils.identifiers import is_identifier_query, get_identifier_index
+from utils.stages import (get_stage_days, stage_codes_at, flag_at, column, column_at, day_offset,
+                          STAGE_CODE, AS_OF_FLAG_COLS)
+from utils.profiling import timed, cache_miss
+from utils.sqlstore import use_sql, get_sql_store
+from utils.data import frame_key
+
+
+# Identifier columns covered by the free-text search box (names go through the phonetic index)
+SEARCH_ID_COLS = ["nusuk_number", "id_number", "passport_number"]
+
+# Card status filter values → range of stage codes (on the selected date)
+CARD_STATUS_STAGES = {
+    "printed": (STAGE_CODE["printed"], STAGE_CODE["activated"]),
+    "at_center": (STAGE_CODE["at_center"], STAGE_CODE["activated"]),
+    "at_provider": (STAGE_CODE["at_provider"], STAGE_CODE["activated"]),
+    "received": (STAGE_CODE["received"], STAGE_CODE["activated"]),
+    "activated": (STAGE_CODE["activated"], STAGE_CODE["activated"]),
+    "not_printed": (STAGE_CODE["not_issued"], STAGE_CODE["issued"]),
+}
+
+
+@timed("match_positions")
+def match_positions(df, as_of_date, search_query="", nationality=None,
+                    person_type=None, provider=None, card_status=None):
+    """
+    Row positions (ascending, read-only int32 array) of records matching
+    the Card Tracking filters. `None` means "all" for every filter.
+    """
+    return _match_positions_cached(
+        df, pd.Timestamp(as_of_date), (search_query or "").strip().lower(),
+        nationality, person_type, provider, card_status,
+    )
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=64)
+@cache_miss("match_positions")
+def _match_positions_cached(df, as_of, q, nationality, person_type, provider, card_status):
+    """Cached implementation — a single boolean pass, no intermediate frames."""
+    if use_sql():
+        filters = {col: value for col, value in (("nationality", nationality),
+                                                 ("person_type", person_type),
+                                                 ("service_provider", provider)) if value is not None}
+        positions = get_sql_store(df).match_positions(
+            as_of, q, filters, CARD_STATUS_STAGES.get(card_status), SEARCH_ID_COLS)
+        positions = positions.astype(np.int32)
+        positions.flags.writeable = False
+        return positions
+
+    d = day_offset(as_of)
+    mask = get_stage_days(df)["visa_issue_date"] <= d
+
+    if nationality is not None:
+        mask = mask & (df["nationality"] == nationality).to_numpy()
+    if person_type is not None:
+        mask = mask & (df["person_type"] == person_type).to_numpy()
+    if provider is not None:
+        mask = mask & (df["service_provider"] == provider).to_numpy()
+
+    if card_status in CARD_STATUS_STAGES:
+        lo, hi = CARD_STATUS_STAGES[card_status]
+        codes = stage_codes_at(df, as_of)
+        mask = mask & (codes >= lo) & (codes <= hi)
+
+    if q:
+        # Names: phonetic / spelling-variant match through the name index
+        positions = np.empty(0, dtype=np.int32)
+        if is_name_query(q):
+            name_hits = get_name_index(df).search(q)
+            positions = name_hits[mask[name_hits]]
+
+        # Identifiers: substring match, only on rows that survived the cheap filters
+        if is_identifier_query(q):
+            candidates = np.flatnonzero(mask)
+            hit = np.zeros(len(candidates), dtype=bool)
+            for col in SEARCH_ID_COLS:
+                values = df[col].iloc[candidates]
+                hit |= values.str.contains(q, case=False, regex=False, na=False).to_numpy()
+            positions = np.union1d(positions, candidates[hit])
+    else:
+        positions = np.flatnonzero(mask)
+
+    positions = positions.astype(np.int32)
+    positions.flags.writeable = False
+    return positions
+
+
+def name_spellings(df, query):
+    """Known spellings of a name query (for the search hint), from the name index or SQLite."""
+    if use_sql():
+        return get_sql_store(df).spellings(query)
+    return get_name_index(df).spellings(query)
+
+
+def page_count(total, page_size):
+    """Number of pages needed for `total` rows (at least 1)."""
+    return max(1, (total + page_size - 1) // page_size)
+
+
+@timed("gather_page")
+def gather_page(df, positions, page, page_size, columns, labels=None, as_of_date=None):
+    """
+    Build the display frame for one page (1-based) from matching positions.
+    Only `page_size` rows of `columns` are copied, whatever the result size.
+    """
+    start = (page - 1) * page_size
+    return gather_rows(df, positions[start:start + page_size], columns, labels, as_of_date)
+
+
+def gather_rows(df, positions, columns, labels=None, as_of_date=None):
+    """
+    Gather `columns` at the given row positions into a new frame.
+    With `as_of_date`, status flag columns (card_printed, ..., arrival_status)
+    hold their value on that date instead of the end-of-season value.
+    Dates and flags of a packed frame are read from its day matrix.
+    """
+    labels = labels or {}
+    if use_sql():
+        rows = get_sql_store(df).rows(positions, columns, as_of_date)
+        return rows.rename(columns=labels)
+    return pd.DataFrame({
+        labels.get(col, col): (
+            flag_at(df, as_of_date, col, positions)
+            if as_of_date is not None and col in AS_OF_FLAG_COLS
+            else column_at(df, col, positions)
+        )
+        for col in columns
+    })
+
+
+def select_rows(df, columns, filters=None, limit=None):
+    """`columns` of the first `limit` records whose columns hold one of the given values ({column: values})."""
+    if use_sql():
+        return get_sql_store(df).select(columns, filters, limit)
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in (filters or {}).items():
+        mask &= column(df, col).isin(values).to_numpy()
+    return gather_rows(df, np.flatnonzero(mask)[:limit], columns)
+
+
+def lookup_index(df):
+    """Exact lookups (find, related): the identifier index, or the SQLite store in SQLite storage mode."""
+    return get_sql_store(df) if use_sql() else get_identifier_index(df)
+
+
+def stage_codes_of(df, as_of_date, positions):
+    """Stage codes on as_of_date of the records at `positions`."""
+    if use_sql():
+        return get_sql_store(df).stage_codes(as_of_date, positions)
+    return stage_codes_at(df, as_of_date)[positions]
@@ -0,0 +1,124 @@
+"""
+Report tables shared by the Reports page and its exports.
+"""
+
+import numpy as np
+import pandas as pd
+from utils.i18n import t, get_lang
+from utils.metrics import compute_metrics, compute_provider_metrics
+from utils.aging import get_aging_engine, SLA_DAYS
+from utils.query import gather_rows, match_positions
+from utils.sqlstore import use_sql, get_sql_store
+from utils.stages import get_stage_days, day_offset, dataset_columns
+
+# Cards held by a provider longer than this are reported as overdue
+OVERDUE_DAYS = SLA_DAYS["at_provider"]
+
+OVERDUE_COLS = ["person_id", "first_name", "last_name", "nationality", "service_provider", "days_overdue"]
+HEALTH_COLS = ["person_id", "first_name", "last_name", "nationality", "age",
+               "health_status", "health_date", "health_notes"]
+
+# Scalar metrics listed on the summary sheet, in order
+SUMMARY_KEYS = [
+    "total_visas", "groups_formed", "total_arrivals", "arrival_pct",
+    "cards_printed", "cards_at_center", "cards_at_provider", "cards_received",
+    "cards_activated", "proof_pictures", "cards_not_delivered",
+    "health_incidents", "deaths",
+]
+
+
+def overdue_cards(df, as_of_date):
+    """Cards still at a provider on as_of_date after more than OVERDUE_DAYS days, oldest first."""
+    positions, ages = get_aging_engine(df).overdue(as_of_date, "at_provider", OVERDUE_DAYS)
+    overdue = gather_rows(df, positions, OVERDUE_COLS[:-1])
+    overdue["days_overdue"] = ages
+    return overdue
+
+
+def health_incidents(df, as_of_date):
+    """Health incidents recorded up to as_of_date, most recent first."""
+    if use_sql():
+        return get_sql_store(df).health_incidents(as_of_date, HEALTH_COLS)
+    days = get_stage_days(df)["health_date"]
+    ill = (df["health_status"] != "none").to_numpy() & (days <= day_offset(as_of_date))
+    positions = np.flatnonzero(ill)
+    # Most recent first; one day's incidents in record order
+    positions = positions[np.argsort(-days[positions].astype(np.int32), kind="stable")]
+    return gather_rows(df, positions, HEALTH_COLS)
+
+
+def summary_frame(m, as_of_date, lang=None):
+    """Two-column (metric, value) table of the headline metrics."""
+    lang = lang or get_lang()
+    rows = [(t("date", lang), str(as_of_date))] + [(t(k, lang), m[k]) for k in SUMMARY_KEYS]
+    return pd.DataFrame(rows, columns=[
+        "المؤشر" if lang == "ar" else "Metric",
+        "القيمة" if lang == "ar" else "Value",
+    ])
+
+
+def daily_report(m, as_of_date, lang=None):
+    """
+    Daily status report as (title, sections); each section is
+    (heading, [(label, count, pct or None)]).
+    """
+    lang = lang or get_lang()
+    ar = lang == "ar"
+    title = f"{'تقرير الحالة اليومي' if ar else 'Daily Status Report'} - {as_of_date}"
+    return title, [
+        ("ملخص عام" if ar else "Overall Summary", [
+            ("إجمالي التأشيرات والتصاريح" if ar else "Total Visas & Permits", m["total_visas"], None),
+            ("إجمالي الواصلين" if ar else "Total Arrivals", m["total_arrivals"], m["arrival_pct"]),
+            ("البطاقات المطبوعة" if ar else "Cards Printed", m["cards_printed"], m["printed_pct"]),
+            ("البطاقات المفعلة" if ar else "Cards Activated", m["cards_activated"], m["activated_pct"]),
+        ]),
+        ("نقاط تحتاج اهتمام" if ar else "Attention Required", [
+            ("بطاقات عند الشركات لم تسلم" if ar else "Cards NOT delivered", m["cards_not_delivered"], None),
+            ("حالات صحية" if ar else "Health incidents", m["health_incidents"], None),
+            ("وفيات" if ar else "Deaths", m["deaths"], None),
+        ]),
+    ]
+
+
+def daily_report_markdown(m, as_of_date, lang=None):
+    """The daily status report as Markdown."""
+    title, sections = daily_report(m, as_of_date, lang)
+    lines = [f"### {title}"]
+    for i, (heading, items) in enumerate(sections):
+        if i:
+            lines.append("")
+        lines.append(f"**{heading}:**")
+        for label, count, pct in items:
+            lines.append(f"- {label}: **{count:,}**" + (f" ({pct:.1f}%)" if pct is not None else ""))
+    return "\n".join(lines)
+
+
+def weekly_comparison(m, m_prev, as_of_date, week_ago, lang=None):
+    """Headline counts at as_of_date next to the week before, with the change."""
+    lang = lang or get_lang()
+    keys = ["total_arrivals", "cards_printed", "cards_at_center", "cards_at_provider",
+            "cards_received", "cards_activated", "health_incidents"]
+    return pd.DataFrame({
+        ("المؤشر" if lang == "ar" else "Metric"): [t(k, lang) for k in keys],
+        str(as_of_date): [f"{m[k]:,}" for k in keys],
+        str(week_ago): [f"{m_prev[k]:,}" for k in keys],
+        ("التغيير" if lang == "ar" else "Change"): [f"{m[k] - m_prev[k]:+,}" for k in keys],
+    })
+
+
+def report_sheets(df, as_of_date, m=None, lang=None, include_data=True):
+    """
+    Sheets of the full Excel report for write_excel: summary, provider
+    metrics, overdue cards, health incidents and (unless `include_data` is
+    False) every record issued to date.
+    """
+    m = m or compute_metrics(df, as_of_date)
+    sheets = [
+        ("Summary", summary_frame(m, as_of_date, lang), None, None),
+        ("Providers", compute_provider_metrics(df, as_of_date), None, None),
+        ("Overdue Cards", overdue_cards(df, as_of_date), None, None),
+        ("Health", health_incidents(df, as_of_date), None, None),
+    ]
+    if include_data:
+        sheets.append(("Data", df, match_positions(df, as_of_date), dataset_columns(df)))
+    return sheets
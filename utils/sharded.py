@@ -0,0 +1,238 @@
+"""
+Sharded metric computation for very large seasons.
+The columns the metrics read are copied once per dataset version into
+shared memory: dates as int64 nanoseconds (NaT stored as the largest value,
+so `<= as_of` is false for it), categories as integer codes, health and
+death as flags. A process pool attached to those blocks computes partial
+counts over row ranges; the partials are summed here. Off unless
+NUSUK_METRIC_WORKERS is above 1 and the dataset has PARALLEL_MIN_ROWS rows:
+on smaller data the process round trips cost more than the pass they split.
+Not used with live event ingestion (utils/ingest.py): every batch is a new
+dataset version, which would copy the columns and start a pool again.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import data_version
+from utils.stages import column
+
+
+METRIC_WORKERS = int(os.environ.get("NUSUK_METRIC_WORKERS", "0"))
+PARALLEL_MIN_ROWS = 1_000_000
+# Row ranges per worker, so one slow shard does not hold the merge up
+SHARDS_PER_WORKER = 2
+
+NAT = np.iinfo(np.int64).max
+DAY_NS = 86_400 * 10**9
+
+# Metric key -> date column counted when <= as_of
+DATE_COUNTS = {
+    "total_visas": "visa_issue_date",
+    "groups_formed": "group_formation_date",
+    "total_arrivals": "arrival_date",
+    "cards_printed": "card_printed_date",
+    "cards_at_center": "card_at_center_date",
+    "cards_at_provider": "card_at_provider_date",
+    "cards_received": "card_received_date",
+    "cards_activated": "card_activation_date",
+    "proof_pictures": "proof_picture_date",
+}
+DATE_COLUMNS = list(DATE_COUNTS.values()) + ["health_date", "death_date"]
+CODE_COLUMNS = ["person_type", "nationality", "service_provider", "b2b_b2c"]
+
+
+def use_shards(df):
+    return METRIC_WORKERS > 1 and len(df) >= PARALLEL_MIN_ROWS
+
+
+# ── Worker side ────────────────────────────────────────────────────────────
+_columns = {}  # column name -> array over its shared block (in each worker)
+_blocks = []
+
+
+def _attach(specs):
+    """Pool initializer: map every shared column once per worker process."""
+    for name, (block_name, dtype, rows) in specs.items():
+        # Spawned workers share the parent's resource tracker, which unlinks
+        # the blocks once, when the parent closes them
+        block = shared_memory.SharedMemory(name=block_name)
+        _blocks.append(block)
+        _columns[name] = np.ndarray(rows, dtype=dtype, buffer=block.buf)
+
+
+def _metrics_shard(start, stop, as_of, filters, day0, days):
+    """Counts and per-day histograms of the filtered rows in [start, stop)."""
+    col = {name: values[start:stop] for name, values in _columns.items()}
+    mask = np.ones(stop - start, dtype=bool)
+    for name, codes in filters.items():
+        mask &= np.isin(col[name], codes)
+    counts = {"total_records": int(np.count_nonzero(mask))}
+    for key, date_col in DATE_COUNTS.items():
+        counts[key] = int(np.count_nonzero(mask & (col[date_col] <= as_of)))
+    arrived = mask & (col["arrival_date"] <= as_of)
+    ill = mask & col["health"] & (col["health_date"] <= as_of)
+    counts["health_incidents"] = int(np.count_nonzero(ill))
+    counts["deaths"] = int(np.count_nonzero(mask & col["dead"] & (col["death_date"] <= as_of)))
+    daily_arrivals = np.bincount(col["arrival_date"][arrived] // DAY_NS - day0, minlength=days)
+    daily_health = np.bincount(col["health_date"][ill] // DAY_NS - day0, minlength=days)
+    return counts, daily_arrivals, daily_health
+
+
+def _provider_shard(start, stop, as_of, providers):
+    """Per-provider counts and delivery-day sums of the rows in [start, stop)."""
+    col = {name: values[start:stop] for name, values in _columns.items()}
+    codes = col["service_provider"]
+    assigned = codes >= 0
+
+    def per_provider(mask, weights=None):
+        mask = assigned & mask
+        return np.bincount(codes[mask], weights=None if weights is None else weights[mask],
+                           minlength=providers)
+
+    both = (col["card_received_date"] != NAT) & (col["card_at_provider_date"] != NAT)
+    delivery_days = np.where(both, col["card_received_date"] - col["card_at_provider_date"], 0) // DAY_NS
+    return {
+        "pilgrims_assigned": per_provider(assigned),
+        "cards_at_provider": per_provider(col["card_at_provider_date"] <= as_of),
+        "cards_received": per_provider(col["card_received_date"] <= as_of),
+        "cards_activated": per_provider(col["card_activation_date"] <= as_of),
+        "health_incidents": per_provider(col["health"] & (col["health_date"] <= as_of)),
+        "delivery_days": per_provider(both, delivery_days.astype(np.float64)),
+        "delivered": per_provider(both),
+    }
+
+
+# ── Parent side ────────────────────────────────────────────────────────────
+class ShardedColumns:
+    """The metric columns of one dataset version in shared memory, with a pool attached."""
+
+    def __init__(self, df, workers):
+        self.rows = len(df)
+        self.categories = {}
+        arrays = {}
+        for name in DATE_COLUMNS:
+            values = column(df, name).to_numpy(dtype="datetime64[ns]").view(np.int64)
+            arrays[name] = np.where(values == np.iinfo(np.int64).min, NAT, values)
+        for name in CODE_COLUMNS:
+            codes, uniques = pd.factorize(df[name])  # first-appearance order, NaN -> -1
+            arrays[name] = codes.astype(np.int32)
+            self.categories[name] = list(uniques)
+        arrays["health"] = (df["health_status"] != "none").to_numpy(dtype=bool)
+        arrays["dead"] = (column(df, "death_status") == True).to_numpy(dtype=bool)
+
+        days = np.concatenate([arrays["arrival_date"], arrays["health_date"]])
+        days = days[days != NAT] // DAY_NS
+        self.day0 = int(days.min()) if len(days) else 0
+        self.days = int(days.max()) - self.day0 + 1 if len(days) else 1
+
+        self._pool = None
+        self._blocks = []
+        # Calls running on the pool; a released store closes once they are done
+        self._lock = threading.Lock()
+        self._running = 0
+        self._closing = False
+        atexit.register(self.close)
+        specs = {}
+        for name, values in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+            self._blocks.append(block)
+            specs[name] = (block.name, values.dtype.str, len(values))
+
+        shards = workers * SHARDS_PER_WORKER
+        bounds = np.linspace(0, self.rows, shards + 1).astype(int)
+        self.shards = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        # spawn: forking a threaded server process is unsafe
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach, initargs=(specs,),
+        )
+
+    def _codes(self, name, values):
+        index = {v: i for i, v in enumerate(self.categories[name])}
+        return np.array([index[v] for v in values if v in index], dtype=np.int32)
+
+    def _map(self, fn, *args):
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("the sharded columns of this dataset version were closed")
+            self._running += 1
+        try:
+            futures = [self._pool.submit(fn, start, stop, *args) for start, stop in self.shards]
+            return [f.result() for f in futures]
+        finally:
+            with self._lock:
+                self._running -= 1
+                done = self._closing and not self._running
+            if done:
+                self._release()
+
+    def metrics(self, as_of_date, person_type_filter=None, nationality_filter=None,
+                provider_filter=None, b2b_b2c_filter=None):
+        """(counts, daily_arrivals, daily_health) of the filtered rows, as compute_metrics sees them."""
+        filters = {}
+        for name, values in (("b2b_b2c", [b2b_b2c_filter] if b2b_b2c_filter else None),
+                             ("person_type", person_type_filter),
+                             ("nationality", nationality_filter),
+                             ("service_provider", provider_filter)):
+            if values:
+                filters[name] = self._codes(name, values)
+        as_of = pd.Timestamp(as_of_date).as_unit("ns").value
+        parts = self._map(_metrics_shard, as_of, filters, self.day0, self.days)
+
+        # Same scalar types as the pandas pass: numpy sums, and len() for the row count
+        counts = {key: np.int64(sum(p[0][key] for p in parts)) for key in parts[0][0]}
+        counts["total_records"] = int(counts["total_records"])
+        return (counts,
+                self._daily(sum(p[1] for p in parts), "arrival_date"),
+                self._daily(sum(p[2] for p in parts), "health_date"))
+
+    def _daily(self, histogram, name):
+        days = np.flatnonzero(histogram)
+        index = pd.Index(
+            [d.date() for d in pd.to_datetime((days + self.day0) * DAY_NS)], dtype=object, name=name)
+        return pd.Series(histogram[days].astype(np.int64), index=index, name="count")
+
+    def provider_totals(self, as_of_date):
+        """{provider: per-provider totals} (see _provider_shard), in first-appearance order."""
+        as_of = pd.Timestamp(as_of_date).as_unit("ns").value
+        providers = self.categories["service_provider"]
+        parts = self._map(_provider_shard, as_of, len(providers))
+        totals = {key: sum(p[key] for p in parts) for key in parts[0]}
+        return {provider: {key: values[i] for key, values in totals.items()}
+                for i, provider in enumerate(providers)}
+
+    def close(self):
+        """Shut the pool down and free the blocks, once the calls still running on them are done."""
+        with self._lock:
+            self._closing = True
+            if self._running:
+                return
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        for block in self._blocks:
+            try:
+                block.close()
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: data_version}, max_entries=1,
+                   on_release=lambda store: store.close())
+def get_sharded_columns(df):
+    """Build (once per dataset version) the shared-memory columns and their process pool."""
+    return ShardedColumns(df, METRIC_WORKERS)
@@ -0,0 +1,712 @@
+"""
+SQLite storage mode for servers that cannot hold the dataset in memory.
+With NUSUK_STORAGE=sqlite, loading imports the dataset in chunks (the import
+never holds the whole file) into a local SQLite database, once per data
+version, indexed on the lifecycle dates, person_id, father_id, the packed
+identifier codes, the dimensions and the phonetic name keys. The frame is
+never loaded: the app holds a zero-row stand-in with the dataset's columns
+(read_sql_dataset), and every page reads the database through a small page
+cache instead. Metrics, provider, group, aging and household tables, chart
+counts and dimension catalogs are SQL aggregates; page rows, lookups and
+linked family records are primary-key reads; exports stream from a cursor.
+Households (utils.family) are labelled at import, with the days each was
+issued and completed. Dates are stored as epoch seconds, NULL where missing;
+row `pos` is the record's position in the dataset file.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data import (STORAGE, DATA_DIR, DATE_COLS, BOOL_COLS, dataset_path, read_dataset_chunks,
+                        data_version, _file_version)
+from utils.identifiers import ID_FIELDS, is_identifier_query, pack_identifier, pack_identifiers
+from utils.groups import GROUP_STAGES
+from utils.phonetic import (NAME_COLS, MIN_PHONETIC_LEN, KEY_REVISION, phonetic_key, is_name_query,
+                            _vocabulary, _is_arabic, _ARTICLES)
+from utils.sharded import DATE_COUNTS
+from utils.stages import STAGE_DATE_COLS, STAGE_CODE, STATUS_FLAG_STAGES, DATE_FLAG_COLS
+
+
+# Database file; by default next to the dataset, with a .sqlite extension
+SQLITE_PATH = os.environ.get("NUSUK_SQLITE_PATH")
+IMPORT_CHUNK_ROWS = 100_000
+# Bumped when the import adds tables or columns: older databases are imported again
+SCHEMA_REVISION = 2
+# Page cache per connection, in KiB: the database is read, not held
+CACHE_KIB = 16 * 1024
+
+EPOCH = pd.Timestamp("1970-01-01")
+DAY_S = 86_400
+# Stands in for a date never reached where a missing date cannot be NULL
+FAR_FUTURE = 2 ** 62
+DIMENSION_COLS = ["person_type", "nationality", "service_provider", "b2b_b2c"]
+KEY_COLS = {col: col.replace("_name", "_key") for col in NAME_COLS}  # first_name -> first_key
+CODE_COLS = {col: f"{col}_code" for col in ID_FIELDS}  # packed identifiers (utils.identifiers)
+INDEXED_COLS = (DATE_COLS + ["person_id", "father_id"] + list(CODE_COLS.values()) + DIMENSION_COLS
+                + list(KEY_COLS.values()))
+
+
+def use_sql():
+    return STORAGE == "sqlite"
+
+
+def database_path(source):
+    """SQLite file for a dataset file."""
+    return SQLITE_PATH or re.sub(r"\.csv(\.gz)?$", "", source) + ".sqlite"
+
+
+def _seconds(as_of_date):
+    return int((pd.Timestamp(as_of_date) - EPOCH) // pd.Timedelta(seconds=1))
+
+
+def _cutoff(as_of_date):
+    """Next midnight after as_of_date: a date has passed on as_of_date when it falls before it."""
+    return _seconds(pd.Timestamp(as_of_date).normalize() + pd.Timedelta(days=1))
+
+
+def _cards_passed(cutoff):
+    """SQL count of the card stage dates passed at `cutoff`."""
+    return " + ".join(f"IFNULL({col} < {cutoff}, 0)" for col in STAGE_DATE_COLS[1:])
+
+
+def _stage_code(cutoff):
+    """SQL stage code (as StageDays.stage_codes) at `cutoff`."""
+    cards = _cards_passed(cutoff)
+    return f"({cards}) + (({cards}) > 0 OR IFNULL(visa_issue_date < {cutoff}, 0))"
+
+
+def _bind(values):
+    """SQL parameters of filter values (numpy scalars as Python ones)."""
+    return [value.item() if isinstance(value, np.generic) else value for value in values]
+
+
+# ── Import ─────────────────────────────────────────────────────────────────
+def _sql_type(col, dtype):
+    if col in DATE_COLS or pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        # Integer ids with gaps (group_id, spouse_id, ...) read as floats
+        return "INTEGER" if col.endswith("_id") else "REAL"
+    return "TEXT"
+
+
+def _sql_values(chunk, keys):
+    """Column value lists of a typed chunk, None where missing, plus the name key columns."""
+    values = {}
+    for col in chunk.columns:
+        s = chunk[col]
+        if col in DATE_COLS:
+            s = ((s - EPOCH) // pd.Timedelta(seconds=1)).astype("Int64")
+        elif pd.api.types.is_bool_dtype(s.dtype):
+            s = s.astype(np.int64)
+        elif pd.api.types.is_float_dtype(s.dtype) and col.endswith("_id"):
+            s = s.astype("Int64")
+        values[col] = s.astype(object).where(s.notna(), None).tolist()
+    for name_col, key_col in KEY_COLS.items():
+        names = chunk[name_col].tolist()
+        for name in set(names) - keys.keys():
+            keys[name] = (phonetic_key(name) or None) if isinstance(name, str) else None
+        values[key_col] = [keys[name] for name in names]
+    for id_col, code_col in CODE_COLS.items():
+        values[code_col] = pack_identifiers(chunk[id_col].to_numpy()).tolist()
+    return values
+
+
+def _link_ids(chunk, col):
+    return chunk[col].fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _import_households(conn, person_ids, spouse_ids, father_ids):
+    """
+    Family households (connected spouse/father links, as utils.family) of
+    two or more members: `members` maps positions to households and
+    `households` holds the day each was issued and the day every member
+    held a card (FAR_FUTURE if not all do).
+    """
+    from utils.family import connected_components
+
+    n = len(person_ids)
+    pos_by_pid = np.full(int(person_ids.max()) + 1 if n else 1, -1, dtype=np.int64)
+    pos_by_pid[person_ids] = np.arange(n)
+    src, dst = [], []
+    for linked in (spouse_ids, father_ids):
+        has = np.flatnonzero((linked >= 0) & (linked < len(pos_by_pid)))
+        pos = pos_by_pid[linked[has]]
+        src.append(has[pos >= 0])
+        dst.append(pos[pos >= 0])  # links to unknown ids are dropped
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    keep = src != dst
+    roots = connected_components(n, src[keep], dst[keep])
+    members = np.flatnonzero(np.bincount(roots, minlength=n)[roots] > 1)
+
+    conn.execute("CREATE TABLE members (pos INTEGER PRIMARY KEY, household INTEGER)")
+    conn.executemany("INSERT INTO members VALUES (?, ?)", zip(members.tolist(), roots[members].tolist()))
+    conn.execute(
+        "CREATE TABLE households AS SELECT household, MIN(visa_issue_date) AS issued, "
+        f"MAX(MIN(IFNULL(card_received_date, {FAR_FUTURE}), IFNULL(card_activation_date, {FAR_FUTURE}))) AS done "
+        "FROM members JOIN records USING (pos) GROUP BY household"
+    )
+    conn.execute("CREATE INDEX households_issued ON households (issued)")
+    conn.execute("CREATE INDEX households_done ON households (done)")
+
+
+def import_dataset(source, db_path, version):
+    """Import the dataset file into a fresh SQLite database at db_path (replaced atomically)."""
+    part = f"{db_path}.part"
+    if os.path.exists(part):
+        os.remove(part)
+    conn = sqlite3.connect(part)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        keys = {}  # name spelling -> phonetic key (None when it has none)
+        links = {"person_id": [], "spouse_id": [], "father_id": []}
+        columns, float_cols = [], set()
+        pos = 0
+        for chunk in read_dataset_chunks(source, IMPORT_CHUNK_ROWS):
+            values = _sql_values(chunk, keys)
+            cols = list(values)
+            for col, ids in links.items():
+                ids.append(_link_ids(chunk, col))
+            float_cols.update(col for col in chunk.columns if pd.api.types.is_float_dtype(chunk[col].dtype))
+            if pos == 0:
+                columns = list(chunk.columns)
+                types = {col: _sql_type(col, chunk[col].dtype) for col in chunk.columns}
+                types.update({col: "TEXT" for col in KEY_COLS.values()})
+                types.update({col: "INTEGER" for col in CODE_COLS.values()})
+                conn.execute("CREATE TABLE records (pos INTEGER PRIMARY KEY, "
+                             + ", ".join(f"{col} {types[col]}" for col in cols) + ")")
+            conn.executemany(
+                f"INSERT INTO records (pos, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))})",
+                zip(range(pos, pos + len(chunk)), *values.values()),
+            )
+            pos += len(chunk)
+
+        # Name spellings: the data's (searched by substring) and the generator's (keys only)
+        conn.execute("CREATE TABLE names (spelling TEXT PRIMARY KEY, key TEXT, in_data INTEGER)")
+        conn.executemany("INSERT INTO names VALUES (?, ?, 1)",
+                         [(name, key or "") for name, key in keys.items() if isinstance(name, str)])
+        conn.executemany("INSERT OR IGNORE INTO names VALUES (?, ?, 0)",
+                         [(name, phonetic_key(name)) for name in _vocabulary()])
+        conn.execute("CREATE INDEX names_key ON names (key)")
+
+        _import_households(conn, *(np.concatenate(ids or [np.empty(0, dtype=np.int64)])
+                                   for ids in links.values()))
+        for col in INDEXED_COLS:
+            conn.execute(f"CREATE INDEX records_{col} ON records ({col})")
+        conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+        # Columns read back as floats: integer ids with gaps, as the frame reads them
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("data_version", version), ("rows", str(pos)), ("columns", json.dumps(columns)),
+            ("float_columns", json.dumps(sorted(float_cols))),
+        ])
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(part, db_path)
+
+
+def stored_version(db_path):
+    """Data version the database at db_path was imported from ("" if none)."""
+    if not os.path.exists(db_path):
+        return ""
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'data_version'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return ""
+    return row[0] if row else ""
+
+
+# ── Queries ────────────────────────────────────────────────────────────────
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+class SqlStore:
+    """Read-only SQL aggregates over one imported dataset version."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._idle = []  # pooled connections, one per concurrent query at most
+        meta = dict(self._fetch("SELECT name, value FROM meta"))
+        self.n = int(meta["rows"])
+        self.columns = json.loads(meta["columns"])
+        self._float_cols = set(json.loads(meta["float_columns"]))
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    @staticmethod
+    def _filters(person_type_filter, nationality_filter, provider_filter, b2b_b2c_filter):
+        conditions, params = [], []
+        if b2b_b2c_filter:
+            conditions.append("b2b_b2c = ?")
+            params.append(b2b_b2c_filter)
+        for col, values in (("person_type", person_type_filter),
+                            ("nationality", nationality_filter),
+                            ("service_provider", provider_filter)):
+            if values:
+                conditions.append(f"{col} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        return conditions, params
+
+    def metrics(self, as_of_date, person_type_filter=None, nationality_filter=None,
+                provider_filter=None, b2b_b2c_filter=None):
+        """(counts, daily_arrivals, daily_health) of the filtered rows, as compute_metrics sees them."""
+        as_of = _seconds(as_of_date)
+        conditions, params = self._filters(
+            person_type_filter, nationality_filter, provider_filter, b2b_b2c_filter)
+        ill = "health_status IS NOT 'none' AND health_date <= ?"
+        sums = [f"SUM({col} <= ?)" for col in DATE_COUNTS.values()]
+        sums += [f"SUM({ill})", "SUM(death_status = 1 AND death_date <= ?)"]
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT COUNT(*), {', '.join(sums)} FROM records {_where(conditions)}",
+                [as_of] * len(sums) + params,
+            ).fetchone()
+            # Same scalar types as the pandas pass: numpy sums, and len() for the row count
+            counts = {"total_records": row[0]}
+            for key, value in zip(list(DATE_COUNTS) + ["health_incidents", "deaths"], row[1:]):
+                counts[key] = np.int64(value or 0)
+            daily_arrivals = self._daily(conn, "arrival_date", conditions + ["arrival_date <= ?"],
+                                         params + [as_of])
+            daily_health = self._daily(conn, "health_date", conditions + [ill], params + [as_of])
+        return counts, daily_arrivals, daily_health
+
+    @staticmethod
+    def _daily(conn, col, conditions, params):
+        rows = conn.execute(
+            f"SELECT {col} / {DAY_S} AS day, COUNT(*) FROM records {_where(conditions)} "
+            "GROUP BY day ORDER BY day", params,
+        ).fetchall()
+        index = pd.Index([(EPOCH + pd.Timedelta(days=day)).date() for day, _ in rows],
+                         dtype=object, name=col)
+        return pd.Series([n for _, n in rows], index=index, name="count", dtype=np.int64)
+
+    def provider_totals(self, as_of_date):
+        """{provider: per-provider totals} (as ShardedColumns.provider_totals), in first-appearance order."""
+        as_of = _seconds(as_of_date)
+        delay = "(card_received_date - card_at_provider_date)"
+        # Whole days, rounded down like Timedelta.days
+        delay_days = f"({delay} - (({delay} % {DAY_S}) + {DAY_S}) % {DAY_S}) / {DAY_S}"
+        rows = self._fetch(
+            "SELECT service_provider, COUNT(*), SUM(card_at_provider_date <= ?), "
+            "SUM(card_received_date <= ?), SUM(card_activation_date <= ?), "
+            "SUM(health_status IS NOT 'none' AND health_date <= ?), "
+            f"SUM({delay_days}), COUNT({delay}) "
+            "FROM records WHERE service_provider IS NOT NULL "
+            "GROUP BY service_provider ORDER BY MIN(pos)",
+            [as_of] * 4,
+        )
+        keys = ["pilgrims_assigned", "cards_at_provider", "cards_received", "cards_activated",
+                "health_incidents", "delivery_days", "delivered"]
+        return {row[0]: {key: value or 0 for key, value in zip(keys, row[1:])} for row in rows}
+
+    def _fetch(self, sql, params=()):
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def _positions(self, sql, params=()):
+        return np.array([pos for pos, in self._fetch(sql, params)], dtype=np.int64)
+
+    def match_positions(self, as_of_date, q, filters, stage_range=None, id_cols=()):
+        """
+        Ascending row positions matching the Card Tracking filters (see
+        utils.query.match_positions). `filters` maps dimension columns to
+        one value each, `stage_range` is an inclusive (lo, hi) stage code
+        range and `id_cols` are searched for `q` by substring.
+        """
+        cutoff = _cutoff(as_of_date)
+        conditions, params = ["visa_issue_date < ?"], [cutoff]
+        for col, value in filters.items():
+            conditions.append(f"{col} = ?")
+            params.append(value)
+        if stage_range is not None:
+            # The visa is issued (required above), so the stage code is one past
+            # the number of card stages reached
+            cards = " + ".join(f"IFNULL({col} < ?, 0)" for col in STAGE_DATE_COLS[1:])
+            conditions.append(f"({cards}) + 1 BETWEEN ? AND ?")
+            params += [cutoff] * len(STAGE_DATE_COLS[1:]) + list(stage_range)
+
+        if not q:
+            return self._positions(f"SELECT pos FROM records {_where(conditions)} ORDER BY pos", params)
+
+        # Names: phonetic / spelling-variant match through the name keys
+        positions = np.empty(0, dtype=np.int64)
+        if is_name_query(q):
+            positions = np.intersect1d(
+                self._name_positions(q),
+                self._positions(f"SELECT pos FROM records {_where(conditions)}", params),
+            )
+        # Identifiers: substring match on the rows that pass the filters
+        if id_cols and is_identifier_query(q):
+            found = " OR ".join(f"instr(lower({col}), ?) > 0" for col in id_cols)
+            hits = self._positions(
+                f"SELECT pos FROM records {_where(conditions + [f'({found})'])}",
+                params + [q] * len(id_cols),
+            )
+            positions = np.union1d(positions, hits)
+        return positions
+
+    # ── Rows ───────────────────────────────────────────────────────────
+    def _frame(self, columns, rows):
+        """Typed DataFrame of SQL rows, with the dtypes the loaded frame would have."""
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        for col in columns:
+            if col in DATE_COLS:
+                frame[col] = pd.to_datetime(frame[col].astype(np.float64), unit="s")
+            elif col in BOOL_COLS:
+                frame[col] = frame[col].fillna(0).astype(bool)
+            elif col in self._float_cols:
+                frame[col] = frame[col].astype(np.float64)
+        return frame
+
+    def header(self):
+        """Zero-row frame with the dataset's columns and dtypes."""
+        return self._frame(self.columns, [])
+
+    @staticmethod
+    def _select(columns, as_of_date=None):
+        """Select list of `columns`; with `as_of_date`, status flags hold their value on that date."""
+        if as_of_date is None:
+            return ", ".join(columns)
+        cutoff = _cutoff(as_of_date)
+        exprs = []
+        for col in columns:
+            if col in STATUS_FLAG_STAGES:
+                # Stage codes past "issued" are one more than the card stages passed
+                exprs.append(f"({_cards_passed(cutoff)}) >= {STATUS_FLAG_STAGES[col] - 1} AS {col}")
+            elif col in DATE_FLAG_COLS:
+                exprs.append(f"IFNULL({DATE_FLAG_COLS[col]} < {cutoff}, 0) AS {col}")
+            else:
+                exprs.append(col)
+        return ", ".join(exprs)
+
+    @staticmethod
+    def _at_positions(select):
+        return (f"SELECT {select} FROM json_each(?) AS p JOIN records ON records.pos = p.value "
+                "ORDER BY p.key")
+
+    @staticmethod
+    def _position_list(positions):
+        return json.dumps(np.asarray(positions, dtype=np.int64).tolist())
+
+    def rows(self, positions, columns, as_of_date=None):
+        """`columns` of the records at `positions`, in that order (see utils.query.gather_rows)."""
+        columns = list(columns)
+        return self._frame(columns, self._fetch(self._at_positions(self._select(columns, as_of_date)),
+                                                [self._position_list(positions)]))
+
+    def iter_rows(self, positions, columns, chunk_rows, as_of_date=None):
+        """
+        Frames of `chunk_rows` records (every record, or those at `positions`)
+        streamed from one cursor, so only one chunk is held at a time.
+        """
+        columns = list(columns)
+        select = self._select(columns, as_of_date)
+        if positions is None:
+            sql, params = f"SELECT {select} FROM records ORDER BY pos", []
+        else:
+            sql, params = self._at_positions(select), [self._position_list(positions)]
+        with self._connect() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    yield self._frame(columns, rows)
+            finally:
+                cursor.close()
+
+    def select(self, columns, filters=None, limit=None):
+        """`columns` of the records whose columns hold one of the given values ({column: values}), in order."""
+        conditions, params = [], []
+        for col, values in (filters or {}).items():
+            conditions.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params.extend(_bind(values))
+        sql = f"SELECT {', '.join(columns)} FROM records {_where(conditions)} ORDER BY pos"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self._frame(list(columns), self._fetch(sql, params))
+
+    def health_incidents(self, as_of_date, columns):
+        """`columns` of the health incidents recorded up to as_of_date, most recent first."""
+        return self._frame(list(columns), self._fetch(
+            f"SELECT {', '.join(columns)} FROM records "
+            "WHERE health_status IS NOT 'none' AND health_date <= ? ORDER BY health_date DESC, pos",
+            [_seconds(as_of_date)]))
+
+    def health_records(self, columns):
+        """`columns` of the records with a dated incident or death, in order (see utils.health.HealthCube)."""
+        return self._frame(list(columns), self._fetch(
+            f"SELECT {', '.join(columns)} FROM records "
+            "WHERE (health_status IS NOT 'none' AND health_date IS NOT NULL) "
+            "OR (death_status = 1 AND death_date IS NOT NULL) ORDER BY pos"))
+
+    # ── Counts ─────────────────────────────────────────────────────────
+    def counts(self, by, as_of_date=None, filters=None, limit=None):
+        """
+        Records per value of `by` (a column or a list of them), as
+        utils.metrics.record_counts: issued by as_of_date if given, matching
+        `filters`, largest first (ties in order of first appearance).
+        """
+        cols = [by] if isinstance(by, str) else list(by)
+        conditions, params = [f"{col} IS NOT NULL" for col in cols], []
+        if as_of_date is not None:
+            conditions.append("visa_issue_date <= ?")
+            params.append(_seconds(as_of_date))
+        for col, values in (filters or {}).items():
+            conditions.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params.extend(_bind(values))
+        sql = (f"SELECT {', '.join(cols)}, COUNT(*) AS n FROM records {_where(conditions)} "
+               f"GROUP BY {', '.join(cols)} ORDER BY n DESC, MIN(pos)")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        frame = self._frame(cols + ["count"], self._fetch(sql, params))
+        index = pd.Index(frame[by], name=by) if isinstance(by, str) else pd.MultiIndex.from_frame(frame[cols])
+        return pd.Series(frame["count"].to_numpy(dtype=np.int64), index=index, name="count")
+
+    def dimension(self, col):
+        """(values in order of first appearance, counts largest first) of a dimension column."""
+        rows = self._fetch(f"SELECT {col}, COUNT(*) FROM records WHERE {col} IS NOT NULL "
+                           f"GROUP BY {col} ORDER BY MIN(pos)")
+        counts = pd.Series([n for _, n in rows], index=pd.Index([v for v, _ in rows], name=col),
+                           name="count", dtype=np.int64)
+        return [v for v, _ in rows], counts.sort_values(ascending=False, kind="stable")
+
+    def link_counts(self, as_of_date, person_types):
+        """(records, with a spouse, with a father) of `person_types` issued by as_of_date."""
+        marks = ", ".join("?" * len(person_types))
+        return self._fetch(
+            "SELECT COUNT(*), COUNT(spouse_id), COUNT(father_id) FROM records "
+            f"WHERE visa_issue_date <= ? AND person_type IN ({marks})",
+            [_seconds(as_of_date)] + list(person_types))[0]
+
+    def household_metrics(self, as_of_date):
+        """Family households as of as_of_date (see utils.family.HouseholdDays.metrics)."""
+        cutoff = _cutoff(as_of_date)
+        issued, complete = self._fetch(
+            "SELECT (SELECT COUNT(*) FROM households WHERE issued < ?), "
+            "(SELECT COUNT(*) FROM households WHERE done < ?)", [cutoff, cutoff])[0]
+        return {
+            "families": issued,
+            "complete": complete,
+            "complete_pct": complete / issued * 100 if issued else 0.0,
+        }
+
+    def at_risk(self, person_types, min_age):
+        """Records of `person_types` aged `min_age` or more who arrived without an activated card."""
+        marks = ", ".join("?" * len(person_types))
+        return self._fetch(
+            f"SELECT COUNT(*) FROM records WHERE person_type IN ({marks}) AND age >= ? "
+            "AND arrival_date IS NOT NULL AND card_activation_date IS NULL",
+            list(person_types) + [min_age])[0][0]
+
+    def group_totals(self, as_of_date):
+        """
+        (group ids, per-group counts, arrived, arrival spread) of the pilgrim
+        groups on as_of_date, for utils.groups.group_table: counts hold the
+        group sizes, then the members at or past each of GROUP_STAGES.
+        """
+        cutoff = _cutoff(as_of_date)
+        reached = ", ".join(f"SUM(code >= {STAGE_CODE[stage]})" for stage in GROUP_STAGES)
+        rows = self._fetch(
+            f"SELECT group_id, COUNT(*), {reached}, SUM(arrived), "
+            f"MAX(CASE WHEN arrived THEN arrival_date / {DAY_S} END) "
+            f"- MIN(CASE WHEN arrived THEN arrival_date / {DAY_S} END) "
+            f"FROM (SELECT group_id, arrival_date, {_stage_code(cutoff)} AS code, "
+            f"IFNULL(arrival_date < {cutoff}, 0) AS arrived FROM records WHERE group_id > 0) "
+            "GROUP BY group_id ORDER BY group_id"
+        )
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(GROUP_STAGES) + 4)
+        counts = table[:, 1:len(GROUP_STAGES) + 2].astype(np.int64)
+        return (table[:, 0].astype(np.int64), counts, table[:, -2].astype(np.int64), table[:, -1])
+
+    # ── Aging ──────────────────────────────────────────────────────────
+    @staticmethod
+    def _ages(as_of_date, entered, left, by=None):
+        """Positions and ages (days since `entered`) of the cards in a stage at as_of_date."""
+        cutoff = _cutoff(as_of_date)
+        d = cutoff // DAY_S - 1
+        group = f"{by}, " if by else ""
+        return (f"SELECT {group}pos, {d} - {entered} / {DAY_S} AS age FROM records "
+                f"WHERE {entered} < {cutoff} AND IFNULL({left} >= {cutoff}, 1)")
+
+    def stage_aging(self, as_of_date, entered, left, sla, edges, by=None):
+        """
+        Rows of (cards in the stage, overdue, age sum, max age, count per age
+        bucket with lower `edges`) at as_of_date, overall or per value of `by`
+        (first column; in order of first appearance, missing values left out).
+        """
+        buckets = [f"SUM(age >= {lo} AND age < {hi})" for lo, hi in zip(edges[:-1], edges[1:])]
+        buckets.append(f"SUM(age >= {edges[-1]})")
+        sums = f"COUNT(*), IFNULL(SUM(age > {int(sla)}), 0), IFNULL(SUM(age), 0), IFNULL(MAX(age), 0), " + ", ".join(
+            f"IFNULL({bucket}, 0)" for bucket in buckets)
+        ages = self._ages(as_of_date, entered, left, by)
+        if by is None:
+            return self._fetch(f"SELECT {sums} FROM ({ages})")
+        return self._fetch(f"SELECT {by}, {sums} FROM ({ages}) WHERE {by} IS NOT NULL "
+                           f"GROUP BY {by} ORDER BY MIN(pos)")
+
+    def stage_overdue(self, as_of_date, entered, left, sla):
+        """(positions, ages) of the cards in a stage longer than `sla` days, oldest first."""
+        rows = self._fetch(f"SELECT pos, age FROM ({self._ages(as_of_date, entered, left)}) "
+                           "WHERE age > ? ORDER BY age DESC, pos", [int(sla)])
+        table = np.array(rows, dtype=np.int64).reshape(len(rows), 2)
+        return table[:, 0].astype(np.int32), table[:, 1].astype(np.int32)
+
+    # ── Lookups ────────────────────────────────────────────────────────
+    def _position_of(self, person_id):
+        rows = self._fetch("SELECT pos FROM records WHERE person_id = ?", [int(person_id)])
+        return rows[0][0] if rows else -1
+
+    def find(self, query):
+        """Positions of a person_id or document number, as IdentifierIndex.find."""
+        query = str(query).strip()
+        matches = []
+        if query.isdigit() and len(query) < 19:
+            pos = self._position_of(query)
+            if pos >= 0:
+                matches.append(("person_id", pos))
+        code = pack_identifier(query)
+        if code:
+            for field, code_col in CODE_COLS.items():
+                matches += [(field, int(pos)) for pos in self._positions(
+                    f"SELECT pos FROM records WHERE {code_col} = ? ORDER BY pos", [code])]
+        return matches
+
+    def related(self, pos):
+        """Positions of the family members linked to the record at `pos`, as IdentifierIndex.related."""
+        person_id, spouse_id, father_id = self._fetch(
+            "SELECT person_id, spouse_id, father_id FROM records WHERE pos = ?", [int(pos)])[0]
+        spouse = self._position_of(spouse_id) if spouse_id is not None else -1
+        father = self._position_of(father_id) if father_id is not None else -1
+        return {
+            "spouse": [spouse] if spouse >= 0 else [],
+            "father": [father] if father >= 0 else [],
+            "children": self._positions("SELECT pos FROM records WHERE father_id = ? ORDER BY pos",
+                                        [person_id]).tolist(),
+        }
+
+    def stage_codes(self, as_of_date, positions):
+        """int8 stage codes on as_of_date of the records at `positions`."""
+        rows = self._fetch(self._at_positions(_stage_code(_cutoff(as_of_date))),
+                           [self._position_list(positions)])
+        return np.array([code for code, in rows], dtype=np.int8)
+
+    def spellings(self, name):
+        """Known spellings sharing the phonetic key of `name` (as NameIndex.spellings)."""
+        return sorted(spelling for spelling, in self._fetch(
+            "SELECT spelling FROM names WHERE key = ?", [phonetic_key(name)]))
+
+    # Same matching rules as NameIndex.search, with SQL lookups for the index reads
+    def _known_key(self, name):
+        key = phonetic_key(name)
+        if key and self._fetch("SELECT 1 FROM names WHERE key = ? LIMIT 1", [key]):
+            return key
+        return None
+
+    def _term_keys(self, term):
+        keys = set()
+        arabic = _is_arabic(term)
+        if arabic or len(term) >= MIN_PHONETIC_LEN:
+            key = self._known_key(term)
+            if key:
+                keys.add(key)
+        if len(term) >= 2 and not arabic:
+            keys.update(key for key, in self._fetch(
+                "SELECT DISTINCT key FROM names WHERE in_data = 1 AND key != '' "
+                "AND instr(lower(spelling), ?) > 0", [term.lower()]))
+        return keys
+
+    def _key_positions(self, keys):
+        if not keys:
+            return np.empty(0, dtype=np.int64)
+        marks = ", ".join("?" * len(keys))
+        sql = " UNION ".join(f"SELECT pos FROM records WHERE {col} IN ({marks})"
+                             for col in KEY_COLS.values())
+        return np.unique(self._positions(sql, list(keys) * len(KEY_COLS)))
+
+    def _name_positions(self, query):
+        query = str(query).strip()
+        whole = self._known_key(query)
+        terms = [term for term in re.split(r"\s+", query)
+                 if term and term.lower() not in _ARTICLES]
+        result = None
+        for term in terms:
+            hits = self._key_positions(self._term_keys(term))
+            result = hits if result is None else np.intersect1d(result, hits, assume_unique=True)
+            if len(result) == 0:
+                break
+        if result is None:
+            result = np.empty(0, dtype=np.int64)
+        if whole is not None and len(terms) > 1:
+            result = np.union1d(result, self._key_positions({whole}))
+        return result
+
+
+def open_store(source, version):
+    """SqlStore for the dataset file `source`, importing it first when the database is missing or stale."""
+    db_path = database_path(source)
+    # The name key columns are computed at import: a key rule change needs a new import
+    version = f"{version}/keys{KEY_REVISION}/schema{SCHEMA_REVISION}"
+    if stored_version(db_path) != version:
+        import_dataset(source, db_path, version)
+    return SqlStore(db_path)
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: data_version}, max_entries=1,
+                   on_release=lambda store: store.close())
+def get_sql_store(df):
+    """Open (importing once per dataset version) the SQLite store of a loaded dataset."""
+    return open_store(df.attrs["source"], data_version(df))
+
+
+def read_sql_dataset(data_dir=DATA_DIR):
+    """
+    The dataset in SQLite storage mode: the zero-row header of its store,
+    carrying the source, data version and stored row count in `attrs`, so
+    the app's cache keys work as with a loaded frame. Imports the dataset
+    file first when its database is missing or stale.
+    """
+    path = dataset_path(data_dir)
+    df = pd.DataFrame()
+    df.attrs.update(source=path, data_version=_file_version(path))
+    store = get_sql_store(df)
+    header = store.header()
+    header.attrs.update(df.attrs, stored_rows=store.n)
+    return header
+
+
+def is_stored(df):
+    """Whether df is the zero-row header of an SQLite-stored dataset (see read_sql_dataset)."""
+    return "stored_rows" in df.attrs
@@ -0,0 +1,210 @@
+"""
+Lifecycle dates as compact day offsets.
+All 12 date columns are converted once into one contiguous int16 N x 12
+matrix of days since DAY_ZERO, so "where was this card on date d" is an
+integer comparison on small arrays instead of a datetime comparison on the
+DataFrame. The stage of every record on a date is one int8 code, cached per date.
+Versions derived by the live event feed (utils/ingest.py) get a copy of the
+previous matrix with only the rows their events touched rewritten.
+In memory storage mode the loaded frame is packed (pack_frame): its date
+columns and the status flags derived from them live only in the matrix,
+and readers get them back through `column` / `column_at`.
+"""
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from utils.data import DATE_COLS, frame_key, data_version
+
+
+DAY_ZERO = pd.Timestamp("2025-01-01")
+# Day offset for a stage that was never reached (compares after every date)
+NEVER = np.iinfo(np.int16).max
+
+# Pipeline stages in order, with the date column at which each one starts.
+# A record's stage on a date is the furthest stage whose date has passed.
+PIPELINE_STAGES = [
+    ("issued", "visa_issue_date"),
+    ("printed", "card_printed_date"),
+    ("at_center", "card_at_center_date"),
+    ("at_provider", "card_at_provider_date"),
+    ("received", "card_received_date"),
+    ("activated", "card_activation_date"),
+]
+STAGE_NAMES = ["not_issued"] + [name for name, _ in PIPELINE_STAGES]
+STAGE_CODE = {name: code for code, name in enumerate(STAGE_NAMES)}
+
+STAGE_DATE_COLS = [col for _, col in PIPELINE_STAGES]
+# Day matrix columns: the pipeline stages first, so they are its leading block
+DAY_COLS = STAGE_DATE_COLS + [col for col in DATE_COLS if col not in STAGE_DATE_COLS]
+
+# Boolean status columns (end-of-season in the data) → stage code from which they hold
+STATUS_FLAG_STAGES = {
+    "card_printed": STAGE_CODE["printed"],
+    "card_at_center": STAGE_CODE["at_center"],
+    "card_at_provider": STAGE_CODE["at_provider"],
+    "card_received": STAGE_CODE["received"],
+    "card_activated": STAGE_CODE["activated"],
+}
+# Other boolean columns that hold from a single date on
+DATE_FLAG_COLS = {"arrival_status": "arrival_date"}
+AS_OF_FLAG_COLS = set(STATUS_FLAG_STAGES) | set(DATE_FLAG_COLS)
+# Status flags that only say whether their date is set
+FLAG_DATES = {
+    "arrival_status": "arrival_date",
+    "card_printed": "card_printed_date",
+    "card_at_center": "card_at_center_date",
+    "card_at_provider": "card_at_provider_date",
+    "card_received": "card_received_date",
+    "card_activated": "card_activation_date",
+    "proof_picture_received": "proof_picture_date",
+    "death_status": "death_date",
+}
+# Live versions whose patched matrix is kept, for sessions still rendering an older one
+HANDED_OVER_VERSIONS = 4
+
+
+def day_offset(as_of_date):
+    """Day offset of a date (same scale as StageDays arrays)."""
+    return int((pd.Timestamp(as_of_date).normalize() - DAY_ZERO).days)
+
+
+def day_dates(days, unit="us"):
+    """datetime64 values of day offsets (NaT where NEVER)."""
+    dates = np.datetime64(DAY_ZERO.date(), "D") + days.astype("timedelta64[D]")
+    return np.where(days == NEVER, np.datetime64("NaT"), dates).astype(f"datetime64[{unit}]")
+
+
+class StageDays:
+    """Read-only int16 N x len(DAY_COLS) day offset matrix (NEVER where missing), with column views."""
+
+    def __init__(self, df, cols=DAY_COLS):
+        # Row-major, so one record's dates (and the stage code) are one contiguous read
+        matrix = np.full((len(df), len(cols)), NEVER, dtype=np.int16)
+        for i, col in enumerate(cols):
+            offsets = (df[col].dt.normalize() - DAY_ZERO).dt.days
+            matrix[:, i] = offsets.fillna(NEVER).to_numpy(dtype=np.int64).clip(-NEVER, NEVER)
+        self._set(matrix, cols)
+
+    def _set(self, matrix, cols):
+        self.n = len(matrix)
+        self.matrix = matrix
+        self.matrix.flags.writeable = False
+        self.columns = {col: i for i, col in enumerate(cols)}
+        self.days = {col: self.matrix[:, i] for col, i in self.columns.items()}
+        self.pipeline = self.matrix[:, :len(STAGE_DATE_COLS)]
+
+    def patched(self, updates):
+        """
+        New StageDays with {date column: (positions, datetime64 values)}
+        written over a copy of this matrix, which stays unchanged for
+        readers of its own version.
+        """
+        matrix = self.matrix.copy()
+        for col, (positions, values) in updates.items():
+            days = (np.asarray(values, dtype="datetime64[D]") - np.datetime64(DAY_ZERO.date(), "D")).astype(np.int64)
+            matrix[positions, self.columns[col]] = days.clip(-NEVER, NEVER)
+        patched = StageDays.__new__(StageDays)
+        patched._set(matrix, list(self.columns))
+        return patched
+
+    def __getitem__(self, col):
+        return self.days[col]
+
+    def stage_codes(self, d):
+        """int8 stage code of every record at day offset `d`."""
+        reached = self.pipeline <= d
+        # Card dates are strictly ordered, so counting them gives the card stage;
+        # the visa date is not (some cards are printed before the visa is issued).
+        codes = reached[:, 1:].sum(axis=1, dtype=np.int8)
+        codes += (codes > 0) | reached[:, 0]
+        return codes
+
+
+# Patched day matrices of the latest live versions, by data version (see hand_over_stage_days)
+_handed_over = {}
+# Day matrix of the packed frame (see pack_frame), by data version
+_packed = {}
+
+
+def hand_over_stage_days(df, days):
+    """
+    Serve `days` (patched by the live feed) as the stage days of the live
+    frame `df`. A packed frame cannot rebuild its matrix, so the matrices
+    of the previous few versions stay too.
+    """
+    _handed_over[data_version(df)] = days
+    while len(_handed_over) > HANDED_OVER_VERSIONS:
+        del _handed_over[next(iter(_handed_over))]
+
+
+def pack_frame(df):
+    """
+    The loaded frame without its date columns and status flags, which its
+    day matrix (built here) holds instead. The full column order is kept in
+    `attrs["columns"]` (see dataset_columns).
+    """
+    days = StageDays(df)
+    _packed.clear()
+    _packed[data_version(df)] = days
+    packed = df.drop(columns=DATE_COLS + list(FLAG_DATES))
+    packed.attrs = dict(df.attrs, columns=list(df.columns))
+    return packed
+
+
+def dataset_columns(df):
+    """Every column of the loaded dataset, including those a packed frame keeps in its day matrix."""
+    return df.attrs.get("columns") or list(df.columns)
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=2)
+def get_stage_days(df):
+    """Build (once per dataset version) and share the stage day offsets."""
+    days = _handed_over.get(data_version(df))
+    if days is None:
+        days = _packed.get(data_version(df))
+    return days if days is not None else StageDays(df)
+
+
+def column_at(df, col, positions):
+    """Values of a column at row positions; a packed frame's dates and status flags come from its matrix."""
+    if col in df.columns:
+        return df[col].iloc[positions].to_numpy()
+    days = get_stage_days(df)[FLAG_DATES.get(col, col)][positions]
+    return days != NEVER if col in FLAG_DATES else day_dates(days)
+
+
+def column(df, col):
+    """
+    A column of df as a Series (see column_at). Frames derived from a
+    packed one by selecting rows keep the loaded row positions as index.
+    """
+    if col in df.columns:
+        return df[col]
+    return pd.Series(column_at(df, col, df.index.to_numpy()), index=df.index, name=col)
+
+
+def stage_codes_at(df, as_of_date):
+    """Read-only int8 stage code (index into STAGE_NAMES) of every record on as_of_date."""
+    return _stage_codes_cached(df, day_offset(as_of_date))
+
+
+@st.cache_resource(hash_funcs={pd.DataFrame: frame_key}, max_entries=128)
+def _stage_codes_cached(df, d):
+    codes = get_stage_days(df).stage_codes(d)
+    codes.flags.writeable = False
+    return codes
+
+
+def flag_at(df, as_of_date, col, positions):
+    """Value of a boolean status column (see AS_OF_FLAG_COLS) on as_of_date, at row positions."""
+    if col in STATUS_FLAG_STAGES:
+        return stage_codes_at(df, as_of_date)[positions] >= STATUS_FLAG_STAGES[col]
+    return get_stage_days(df)[DATE_FLAG_COLS[col]][positions] <= day_offset(as_of_date)
+
+
+def column_frame(df, cols):
+    """df[cols], with a packed frame's dates and status flags rebuilt from its matrix (see column)."""
+    if all(col in df.columns for col in cols):
+        return df[cols]
+    return pd.DataFrame({col: column(df, col) for col in cols})